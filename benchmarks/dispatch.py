@@ -0,0 +1,63 @@
+"""Compare command dispatch time with a plain commandlet Parser and an
+indexed MudMakerParser as the number of socials grows.
+
+Each social adds two commands, just like Social.on_init does. Every parser
+also has some ordinary commands, with look added last, as it would be if
+socials were loaded before a game added its own commands.
+
+Usage: python benchmarks/dispatch.py [iterations]"""
+
+import sys
+from timeit import timeit
+
+from commandlet import Parser
+
+from mudmaker.parsers import MudMakerParser
+
+
+def make_parser(cls, socials):
+    p = cls()
+    p.filter('object')(lambda text: text)
+
+    for x in range(socials):
+        name = f'social{x}'
+        p.command(name)(lambda: None)
+        p.command(name, f'{name} <object:target>')(lambda target: None)
+
+    for name in ('say', 'who', 'quit', 'help', 'inventory', 'score'):
+        p.command(name, name, f'{name} <string>')(lambda string=None: None)
+    p.command('say', '"<string>', "'<string>")(lambda string: None)
+    p.command('look', 'look', 'look <object:thing>')(lambda thing=None: None)
+    return p
+
+
+def main():
+    if len(sys.argv) > 1:
+        iterations = int(sys.argv[1])
+    else:
+        iterations = 2000
+    print(
+        'Socials | Commands | Parser look | Indexed look | Parser say | '
+        'Indexed say'
+    )
+    for socials in (0, 10, 100, 500, 1000):
+        results = []
+        for cls in (Parser, MudMakerParser):
+            p = make_parser(cls, socials)
+            for string in ('look', '"hello'):
+                p.handle_command(string)  # Build the index.
+                results.append(
+                    timeit(
+                        lambda: p.handle_command(string), number=iterations
+                    ) / iterations * 1e6
+                )
+        print(
+            '%7d | %8d | %9.1fus | %10.1fus | %8.1fus | %9.1fus' % (
+                socials, len(p.commands), results[0], results[2], results[1],
+                results[3]
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""Measure how many commands per second a world can serve as gateways are
+added.
+
+For each number of gateways, a world is started in its own process, then
+several client processes open websocket connections to it. Each connection
+sends a number of @host commands, waiting for the reply before sending the
+next one.
+
+Usage: python benchmarks/gateways.py [--gateways 0 1 2 4] [--connections 200]
+[--commands 50] [--client-processes 4]
+
+With 0 gateways, the world accepts websockets itself."""
+
+import os
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser, SUPPRESS
+from json import dumps, loads
+from time import sleep, time
+
+parser = ArgumentParser()
+parser.add_argument('--gateways', type=int, nargs='+', default=[0, 1, 2, 4])
+parser.add_argument('--connections', type=int, default=200)
+parser.add_argument('--commands', type=int, default=50)
+parser.add_argument('--client-processes', type=int, default=4)
+parser.add_argument('--port', type=int, default=4800)
+parser.add_argument('--world', type=int, help=SUPPRESS)
+parser.add_argument('--clients', type=int, help=SUPPRESS)
+
+
+def run_world(gateways, port, directory):
+    """Run a world with the given number of gateways."""
+    from logging import WARNING, getLogger
+    from mudmaker import Game
+    game = Game(
+        'Benchmark', http_port=port, gateways=gateways,
+        gateway_address=os.path.join(directory, 'gateway.sock'),
+        filename=os.path.join(directory, 'world.yaml'),
+        logger=getLogger('benchmark')
+    )
+    game.logger.setLevel(WARNING)
+    game.account_store.filename = os.path.join(directory, 'accounts.json')
+    game.run()
+
+
+def run_clients(connections, commands, port):
+    """Open connections websockets, and send commands commands on each one.
+    Prints the results as JSON."""
+    from autobahn.twisted.websocket import (
+        WebSocketClientFactory, WebSocketClientProtocol, connectWS
+    )
+    from twisted.internet import reactor
+
+    latencies = []
+    state = dict(open=0, done=0, failed=0, connected=None)
+    started = time()
+
+    class Client(WebSocketClientProtocol):
+        def onOpen(self):
+            self.remaining = commands
+            state['open'] += 1
+            if state['open'] == connections:
+                state['connected'] = time() - started
+            self.send_command()
+
+        def send_command(self):
+            self.sent = time()
+            self.sendMessage(b'@host')
+
+        def onMessage(self, payload, is_binary):
+            data = loads(payload)
+            if data['name'] != 'message' or \
+               not data['args'][0].startswith('You are connected'):
+                return
+            latencies.append(time() - self.sent)
+            self.remaining -= 1
+            if self.remaining:
+                self.send_command()
+            else:
+                self.sendClose()
+
+        def onClose(self, was_clean, code, reason):
+            if getattr(self, 'remaining', 1):
+                state['failed'] += 1
+            state['done'] += 1
+            if state['done'] == connections:
+                reactor.stop()
+
+    factory = WebSocketClientFactory(f'ws://127.0.0.1:{port}')
+    factory.protocol = Client
+    for x in range(connections):
+        connectWS(factory)
+    reactor.run()
+    elapsed = time() - started
+    latencies.sort()
+    n = len(latencies)
+    print(
+        dumps(
+            dict(
+                elapsed=elapsed, commands=len(latencies),
+                failed=state['failed'], connected=state['connected'],
+                p50=latencies[n // 2] if n else None,
+                p99=latencies[int(n * 0.99)] if n else None
+            )
+        )
+    )
+
+
+def benchmark(gateways, args):
+    """Start a world and some clients, and return the combined results."""
+    port = args.port
+    with tempfile.TemporaryDirectory() as directory:
+        world = subprocess.Popen(
+            [
+                sys.executable, __file__, '--world', str(gateways), '--port',
+                str(port)
+            ], env=dict(
+                os.environ, WORLD_DIRECTORY=directory,
+                PYTHONPATH=os.getcwd()
+            ),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            sleep(1.5 + gateways * 0.5)
+            per_process = args.connections // args.client_processes
+            clients = [
+                subprocess.Popen(
+                    [
+                        sys.executable, __file__, '--clients',
+                        str(per_process), '--commands', str(args.commands),
+                        '--port', str(port + 1)
+                    ], stdout=subprocess.PIPE
+                ) for x in range(args.client_processes)
+            ]
+            results = [loads(c.communicate()[0]) for c in clients]
+        finally:
+            world.terminate()
+            world.wait()
+    elapsed = max(r['elapsed'] for r in results)
+    commands = sum(r['commands'] for r in results)
+    return dict(
+        gateways=gateways, connections=per_process * len(results),
+        commands=commands, failed=sum(r['failed'] for r in results),
+        commands_per_second=commands / elapsed,
+        connect_time=max(r['connected'] or elapsed for r in results),
+        p50=max(r['p50'] or 0 for r in results),
+        p99=max(r['p99'] or 0 for r in results)
+    )
+
+
+def main():
+    args = parser.parse_args()
+    if args.world is not None:
+        return run_world(args.world, args.port, os.environ['WORLD_DIRECTORY'])
+    elif args.clients is not None:
+        return run_clients(args.clients, args.commands, args.port)
+    print(
+        'Gateways | Connections | Failed | Connect time | Commands/s | p50 ms '
+        '| p99 ms'
+    )
+    for gateways in args.gateways:
+        r = benchmark(gateways, args)
+        print(
+            '%8d | %11d | %6d | %11.2fs | %10.0f | %6.1f | %6.1f' % (
+                r['gateways'], r['connections'], r['failed'],
+                r['connect_time'], r['commands_per_second'], r['p50'] * 1000,
+                r['p99'] * 1000
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Compare the size and CPU cost of the JSON and binary client protocols.
+
+Usage: python benchmarks/protocol.py [iterations]"""
+
+import sys
+from json import dumps, loads
+from timeit import timeit
+
+from mudmaker.protocol import decode_frame, encode_frame
+
+frames = [
+    ('message', '[The First Zone; The First Room]'),
+    ('message', 'You see nothing special.'),
+    ('message', 'Test Object says: "Hello everyone, how is it going?"'),
+    ('message', 'Somebody smiles at you.'),
+    ('promptText', 'Command'),
+    ('title', 'MudMaker'),
+    ('status', '<p>Not yet implemented.</p>'),
+    ('inputType', 'text'),
+    ('ping',)
+]
+
+
+def encode_json():
+    return [dumps(dict(name=f[0], args=f[1:])).encode() for f in frames]
+
+
+def encode_binary():
+    return [encode_frame(*f) for f in frames]
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    json_frames = encode_json()
+    binary_frames = encode_binary()
+    json_size = sum(len(f) for f in json_frames)
+    binary_size = sum(len(f) for f in binary_frames)
+    print('Frames per batch: %d.' % len(frames))
+    print('JSON bytes: %d.' % json_size)
+    print(
+        'Binary bytes: %d (%.1f%% of JSON).' % (
+            binary_size, binary_size / json_size * 100
+        )
+    )
+    for name, func in (
+        ('JSON encode', encode_json),
+        ('Binary encode', encode_binary),
+        ('JSON decode', lambda: [loads(f) for f in json_frames]),
+        ('Binary decode', lambda: [decode_frame(f) for f in binary_frames])
+    ):
+        t = timeit(func, number=iterations)
+        print(
+            '%s: %.3f microseconds per frame.' % (
+                name, t / (iterations * len(frames)) * 1000000
+            )
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,9 @@ from .exits import Exit
 from .game import Game
 from .zones import Zone
 from .rooms import Room
+from .sessions import Session
 from .websockets import WebSocketConnection
+from .telnet import TelnetConnection
 from .objects import Object
 from .account_store import Account, AccountStore
 from .tasks import Task
@@ -15,6 +17,6 @@ from .menus import Menu
 
 __all__ = [
     'Attribute', 'text', 'Direction', 'Exit', 'Game', 'Zone', 'Room',
-    'WebSocketConnection', 'Object', 'Account', 'AccountStore', 'Task',
-    'Social', 'Menu'
+    'Session', 'WebSocketConnection', 'TelnetConnection', 'Object', 'Account',
+    'AccountStore', 'Task', 'Social', 'Menu'
 ]
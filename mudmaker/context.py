@@ -0,0 +1,80 @@
+"""Provides the Context class."""
+
+from collections.abc import Mapping
+
+from .socials import factory
+
+
+def get_account(ctx):
+    player = ctx['player']
+    if player is not None:
+        return player.account
+
+
+def get_is_staff(ctx):
+    account = ctx['account']
+    return account is not None and account.is_staff
+
+
+def get_location(ctx):
+    player = ctx['player']
+    if player is not None:
+        return player.location
+
+
+def get_zone(ctx):
+    location = ctx['location']
+    if location is not None:
+        return location.zone
+
+
+class Context(Mapping):
+    """The values which commands can ask for by name, worked out the first
+    time they are needed rather than for every command.
+
+    Any keyword arguments are added to the context as they are. Parsers set
+    matched to the name of the command which handled the string, so it can be
+    timed."""
+
+    matched = None
+
+    getters = dict(
+        con=lambda ctx: ctx.con,
+        player=lambda ctx: ctx.con.object,
+        hostname=lambda ctx: ctx.con.host,
+        port=lambda ctx: ctx.con.port,
+        host=lambda ctx: '%s:%d' % (ctx.con.host, ctx.con.port),
+        game=lambda ctx: ctx.con.game,
+        parser=lambda ctx: ctx.con.parser,
+        logger=lambda ctx: ctx.con.logger,
+        accounts=lambda ctx: ctx.con.game.account_store,
+        is_staff=get_is_staff,
+        account=get_account,
+        location=get_location,
+        socials=lambda ctx: factory,
+        zone=get_zone
+    )
+
+    def __init__(self, con, **kwargs):
+        self.con = con
+        self.values = kwargs
+
+    def __getitem__(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            value = self.getters[name](self)
+            self.values[name] = value
+            return value
+
+    def __contains__(self, name):
+        return name in self.values or name in self.getters
+
+    def __iter__(self):
+        yield from self.getters
+        for name in self.values:
+            if name not in self.getters:
+                yield name
+
+    def __len__(self):
+        return len(self.getters.keys() | self.values.keys())
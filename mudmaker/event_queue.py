@@ -0,0 +1,152 @@
+"""Provides the EventQueue class, which holds delayed events that are saved
+with the game and survive restarts."""
+
+from functools import partial
+from logging import getLogger
+from time import time
+
+from attr import attrs, attrib, Factory
+
+from .exc import InvalidPolicyError, NoSuchHandlerError
+
+NoneType = type(None)
+policies = ('run', 'skip', 'spread')
+
+
+@attrs
+class QueuedEvent:
+    """An event which will call the handler called name with kwargs at the
+    time due.
+
+    If due passed while the game was not running, catch_up says what happens
+    when the game is loaded: "run" runs it straight away, "skip" drops it, and
+    "spread" runs it along with every other overdue "spread" event, spaced
+    out over game.event_catch_up_window seconds in the order they were
+    due."""
+
+    queue = attrib(repr=False)
+    id = attrib()
+    name = attrib()
+    due = attrib()
+    kwargs = attrib(default=Factory(dict))
+    catch_up = attrib(default=Factory(lambda: 'run'))
+    job = attrib(default=Factory(NoneType), init=False, repr=False)
+
+    def cancel(self):
+        """Cancel this event."""
+        self.queue.cancel(self)
+
+    def dump(self):
+        """Return a dictionary which can be dumped with the game."""
+        return dict(
+            id=self.id, name=self.name, due=self.due, catch_up=self.catch_up,
+            kwargs=self.kwargs
+        )
+
+
+@attrs
+class EventQueue:
+    """Holds queued events, and runs them on game.scheduler.
+
+    Handlers are registered by name with self.handler, and are called with
+    the keyword arguments of the events which name them. Those arguments are
+    saved in the world file, so they must be things the game can dump, like
+    strings, numbers, lists, dictionaries and database objects."""
+
+    game = attrib()
+    handlers = attrib(default=Factory(dict), repr=False)
+    events = attrib(default=Factory(dict), init=False, repr=False)
+    max_id = attrib(default=Factory(int), init=False)
+    logger = attrib(
+        default=Factory(lambda: getLogger(__name__)), init=False, repr=False
+    )
+
+    def handler(self, name):
+        """Decorate a function to handle events called name."""
+
+        def inner(func):
+            self.handlers[name] = func
+            return func
+
+        return inner
+
+    def schedule(self, delay, name, catch_up='run', **kwargs):
+        """Queue an event to call the handler called name with kwargs in delay
+        seconds."""
+        if name not in self.handlers:
+            raise NoSuchHandlerError(name)
+        if catch_up not in policies:
+            raise InvalidPolicyError(catch_up, policies)
+        self.max_id += 1
+        event = QueuedEvent(
+            self, self.max_id, name, time() + delay, kwargs=kwargs,
+            catch_up=catch_up
+        )
+        self.start(event, delay)
+        return event
+
+    def start(self, event, delay):
+        """Add event to self.events, and schedule it to run after delay
+        seconds."""
+        self.events[event.id] = event
+        event.job = self.game.scheduler.call_later(
+            max(0, delay), partial(self.fire, event)
+        )
+
+    def cancel(self, event):
+        """Cancel an event."""
+        if self.events.pop(event.id, None) is not None:
+            event.job.cancel()
+
+    def fire(self, event):
+        """Run event."""
+        del self.events[event.id]
+        handler = self.handlers.get(event.name)
+        if handler is None:
+            return self.logger.error(
+                'Dropping %r: there is no handler called %s.', event,
+                event.name
+            )
+        try:
+            with self.game.lag_monitor.doing('event', event):
+                handler(**event.kwargs)
+        except Exception:
+            self.logger.exception('Event %r failed.', event)
+
+    def dump(self):
+        """Return a list of dumped events, soonest first."""
+        return [
+            e.dump() for e in sorted(self.events.values(), key=lambda e: e.due)
+        ]
+
+    def load(self, data):
+        """Load events dumped with self.dump. Events whose time has passed are
+        treated according to their catch_up policies."""
+        now = time()
+        spread = []
+        for row in data:
+            try:
+                kwargs = self.game.load_value(row['kwargs'])
+            except KeyError:
+                self.logger.warning(
+                    'Dropping event #%d (%s): an object it needs was deleted.',
+                    row['id'], row['name']
+                )
+                continue
+            event = QueuedEvent(
+                self, row['id'], row['name'], row['due'], kwargs=kwargs,
+                catch_up=row['catch_up']
+            )
+            self.max_id = max(self.max_id, event.id)
+            if event.due > now:
+                self.start(event, event.due - now)
+            elif event.catch_up == 'skip':
+                self.logger.info('Skipping overdue %r.', event)
+            elif event.catch_up == 'spread':
+                spread.append(event)
+            else:
+                self.start(event, 0)
+        spread.sort(key=lambda e: e.due)
+        window = self.game.event_catch_up_window
+        for i, event in enumerate(spread):
+            self.start(event, window * i / len(spread))
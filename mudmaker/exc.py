@@ -55,3 +55,31 @@ class TaskError(MudMakerError):
 
 class InvalidArgumentError(TaskError):
     """That argument is not supported by the tasks framework."""
+
+
+class InvalidModeError(TaskError):
+    """That is not a valid task mode."""
+
+
+class NotModuleLevelError(TaskError):
+    """Process tasks must be module-level functions."""
+
+
+class EventQueueError(MudMakerError):
+    """There was an error with the event queue."""
+
+
+class NoSuchHandlerError(EventQueueError):
+    """There is no event handler with that name."""
+
+
+class InvalidPolicyError(EventQueueError):
+    """That is not a valid catch up policy."""
+
+
+class InvalidOutboundPolicyError(MudMakerError):
+    """That is not a valid outbound policy."""
+
+
+class ProtocolError(MudMakerError):
+    """A malformed frame was received."""
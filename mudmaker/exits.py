@@ -113,28 +113,26 @@ class Exit(BaseObject, LocationMixin):
                 elif 'and' not in name:
                     name = 'the ' + name
                 msg = other.arrive_msg.format(name)
-            string = factory.get_strings(msg, [obj])[-1]
             d = self.destination
-            d.message_all(string)
+            d.deliver_socials([(msg, [obj])])
+            origin = self.location
             obj.location = d
             obj.look_here()
-            for follower in obj.followers:
-                strings = factory.get_strings(
-                    other.arrive_follow_msg, [follower, obj]
+            followers = obj.followers
+            if followers:
+                if other is None:
+                    arrive_follow_msg = self.arrive_follow_msg
+                else:
+                    arrive_follow_msg = other.arrive_follow_msg
+                d.deliver_socials(
+                    [(arrive_follow_msg, [f, obj]) for f in followers]
                 )
-                obj.message(strings[1])
-                d.message_all_but([obj], strings[-1])
-            strings = []
-            for follower in obj.followers:
-                follower.location = d
-                follower.look_here()
-                strings.append(
-                    factory.get_strings(
-                        self.leave_follow_msg, [follower, obj]
-                    )[-1]
+                for follower in followers:
+                    follower.location = d
+                    follower.look_here()
+                origin.deliver_socials(
+                    [(self.leave_follow_msg, [f, obj]) for f in followers]
                 )
-            for string in strings:
-                self.location.message_all(string)
         elif self.state is self.LOCKED:
             obj.message(factory.get_strings(self.locked_msg, [obj, self])[0])
         elif self.state is self.CLOSED:
@@ -3,12 +3,14 @@
 from code import InteractiveConsole
 from contextlib import redirect_stdout, redirect_stderr
 from functools import partial
+from time import time
 
 from twisted.internet import reactor
 
 from ..attributes import text
 from .builder_parser import builder_parser
 from ..menus import Menu
+from ..profiler import ProfileWindow
 from ..socials import Social
 from ..util import yes_or_no, broadcast
 
@@ -16,7 +18,7 @@ from ..util import yes_or_no, broadcast
 class Shell(InteractiveConsole):
     def __init__(self, player, *args, **kwargs):
         self.player = player
-        kwargs['locals'] = player.connection.get_context()
+        kwargs['locals'] = dict(player.connection.get_context())
         for name, cls in player.game._bases.items():
             kwargs['locals'][name] = cls
         super().__init__(*args, **kwargs)
@@ -32,7 +34,7 @@ class Shell(InteractiveConsole):
         self.player.message(text)
 
 
-admin_parser = builder_parser.copy()
+admin_parser = builder_parser.layer()
 
 
 @admin_parser.command('shell', '@shell', '@python')
@@ -82,6 +84,198 @@ def do_message(game, player, message):
     broadcast(game.players, '%s broadcasts: %s' % (player.name, message))
 
 
+@admin_parser.command('connections', '@connections', '@netstat')
+def do_connections(player, game):
+    """Show network statistics for every connection."""
+    player.message('Connections: %d.' % len(game.connections))
+    for con in game.connections:
+        stats = con.network_stats()
+        if stats['ratio'] is None:
+            ratio = 'n/a'
+        else:
+            ratio = '%.2f' % stats['ratio']
+        player.message(
+            '%s:%d (%s): %d bytes sent, compression %s (ratio %s), %.3f '
+            'seconds sending.' % (
+                con.host, con.port, con.object, stats['bytes_sent'],
+                'on' if stats['compression'] else 'off', ratio,
+                stats['send_time']
+            )
+        )
+        if stats['rtt'] is None:
+            rtt = 'unknown'
+        else:
+            rtt = '%.3f seconds' % stats['rtt']
+        player.message(
+            'Idle for %d seconds, round trip time %s.' % (
+                time() - con.last_active, rtt
+            )
+        )
+        player.message(
+            'Outbound queue: %d messages (%d bytes)%s, %d suppressed.' % (
+                stats['queued_messages'], stats['queued_bytes'],
+                ', paused' if stats['paused'] else '', stats['suppressed']
+            )
+        )
+        player.message(
+            'Rate limited: %s; %d commands queued.' % (
+                ', '.join(
+                    '%s %d' % (kind, count) for kind, count in
+                    sorted(stats['rate_limited'].items())
+                ), stats['queued_input']
+            )
+        )
+
+
+@admin_parser.command('ratelimits', '@ratelimits')
+def do_ratelimits(player, game):
+    """Show the rate limits, and which accounts have hit them."""
+    for kind, limit in sorted(game.rate_limits.items()):
+        if limit is None:
+            player.message(f'{kind}: unlimited.')
+        else:
+            player.message(
+                '%s: %s per second, bursts of %d.' % (kind, limit[0], limit[1])
+            )
+    player.message(
+        'Policy: %s (queue size %d).' % (
+            game.rate_limit_policy, game.rate_limit_queue_size
+        )
+    )
+    for (id, kind), bucket in sorted(game.account_buckets.items()):
+        if bucket.limited:
+            player.message(
+                '%s (%s): %d allowed, %d limited.' % (
+                    game.objects.get(id, id), kind, bucket.allowed,
+                    bucket.limited
+                )
+            )
+
+
+@admin_parser.command(
+    'socialcache', '@socialcache', '@socialcache <word:action>'
+)
+def do_socialcache(player, game, action=None):
+    """Show the social template cache statistics, or clear the cache with
+    "@socialcache clear"."""
+    f = game.socials_factory
+    if not hasattr(f, 'cache_stats'):
+        return player.message('The socials factory does not cache templates.')
+    if action == 'clear':
+        f.clear_cache()
+        return player.message('Cache cleared.')
+    elif action is not None:
+        return player.message('The only action is "clear".')
+    stats = f.cache_stats()
+    player.message(
+        'Templates: {size} of {cache_size}; {hits} hits, {misses} misses, '
+        '{evictions} evictions.'.format(**stats)
+    )
+    if stats['hit_rate'] is not None:
+        player.message('Hit rate: %.1f%%.' % (stats['hit_rate'] * 100))
+
+
+@admin_parser.command('tasks', '@tasks')
+def do_tasks(player, game):
+    """Show how long tasks take to run, and how late they run."""
+    if not game.tasks:
+        return player.message('There are no tasks.')
+    for task in game.tasks.values():
+        stats = task.stats()
+        player.message(
+            '#{id} {name} ({mode}): every {interval:g} seconds, {runs} '
+            '{runs_word} ({failures} failed, {skipped} skipped, {overlaps} '
+            'overlapping){stopped}.'.format(
+                runs_word='run' if stats['runs'] == 1 else 'runs',
+                stopped='' if stats['running'] else ', stopped', **stats
+            )
+        )
+        if stats['runs']:
+            times = tuple(
+                '%.1f ms' % (stats[name] * 1000) for name in (
+                    'last', 'p50', 'p99', 'lateness', 'max_lateness'
+                )
+            )
+            player.message(
+                'Took %s last, %s p50, %s p99. Late by %s (at most %s).' %
+                times
+            )
+
+
+@admin_parser.command('profile', '@profile', '@profile <int:seconds>')
+def do_profile(player, game, seconds=None):
+    """Profile the server for a number of seconds, then show the functions
+    which took the most time."""
+    if game.profile_window is not None:
+        return player.message(
+            'Already profiling (%d seconds, started %s).' % (
+                game.profile_window.seconds,
+                game.profile_window.started.strftime('%H:%M:%S')
+            )
+        )
+    if seconds is None:
+        seconds = 10
+    elif not 0 < seconds <= game.profile_max_seconds:
+        return player.message(
+            'You can profile for between 1 and %d seconds.' %
+            game.profile_max_seconds
+        )
+
+    def done(window):
+        for sort in ('cumulative', 'internal'):
+            player.message(f'Top functions by {sort} time:')
+            for name, calls, internal, cumulative in window.top(
+                sort, game.profile_top
+            ):
+                player.message(
+                    '%.1f ms cumulative, %.1f ms internal, %d %s: %s' % (
+                        cumulative * 1000, internal * 1000, calls,
+                        'call' if calls == 1 else 'calls', name
+                    )
+                )
+        player.message(f'Saved to {window.filename}.')
+
+    ProfileWindow(game, seconds, done).start()
+    player.message(f'Profiling for {seconds} seconds.')
+
+
+@admin_parser.command(
+    'lag', '@lag', '@lag <int:number>', '@lag <word:action>'
+)
+def do_lag(player, game, number=None, action=None):
+    """Show how late the reactor is running and the last times it stalled,
+    show the stack of a stall with "@lag <number>", or forget stalls with
+    "@lag clear"."""
+    monitor = game.lag_monitor
+    if action == 'clear':
+        monitor.clear()
+        return player.message('Stalls cleared.')
+    elif action is not None:
+        return player.message('The only action is "clear".')
+    stalls = list(reversed(monitor.stalls))
+    if number is not None:
+        if not 0 < number <= len(stalls):
+            return player.message('There is no stall %d.' % number)
+        stall = stalls[number - 1]
+        for line in ''.join(stall.stack).splitlines():
+            player.message(line)
+        return
+    player.message(
+        'Lag: %.1f ms (at most %.1f ms). %d %s of %g seconds or more.' % (
+            monitor.lag * 1000, monitor.max_lag * 1000, monitor.count,
+            'stall' if monitor.count == 1 else 'stalls', game.lag_threshold
+        )
+    )
+    for i, stall in enumerate(stalls, start=1):
+        player.message(
+            '%d: %s for %.3f seconds%s, running %s.' % (
+                i, stall.started.strftime('%H:%M:%S'), stall.duration,
+                '' if stall.finished else ' so far',
+                ' < '.join(stall.activities) or 'nothing'
+            )
+        )
+
+
 def edit_string(social, name, obj):
     obj.message('Enter the new value:')
     obj.connection.set_input_text(getattr(social, name))
@@ -7,7 +7,7 @@ from ..parsers import main_parser
 from ..rooms import Room
 from ..util import yes_or_no
 
-builder_parser = main_parser.copy()
+builder_parser = main_parser.layer()
 
 
 @builder_parser.command(
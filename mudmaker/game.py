@@ -1,37 +1,61 @@
 """Provides the Game class."""
 
+import hmac
 import os
 import os.path
+import sys
 
 from datetime import datetime
 from json import dumps
+from secrets import token_hex
+from time import perf_counter, time
 
-from attr import attrs, attrib, Factory
+from attr import attrs, attrib, Factory, setters
+from autobahn.twisted.resource import WebSocketResource
 from autobahn.twisted.websocket import listenWS, WebSocketServerFactory
 from twisted.internet import reactor
+from twisted.internet.error import ProcessExitedAlready
 from twisted.web.resource import Resource
 from twisted.web.server import Site
-from twisted.web.static import File
 from twisted.web.util import redirectTo
 from yaml import dump, FullLoader, load
 
 from .account_store import AccountStore
 from .base import BaseObject
 from .directions import Direction
+from .event_queue import EventQueue
 from .ext.admin_parser import admin_parser
 from .ext.builder_parser import builder_parser
+from .exc import InvalidOutboundPolicyError
 from .exits import Exit
+from .gateway import (
+    accept_compression, GatewayLinkFactory, GatewayProcessProtocol,
+    RemoteSession
+)
+from .lag import LagMonitor
+from .metrics import GameMetrics
 from .objects import Object
 from .parsers import main_parser
 from .rooms import Room
+from .scheduler import Scheduler
+from .sessions import outbound_policies
 from .socials import factory, Social
 from .sources import html, js
+from .static import StaticResource
 from .tasks import Task
+from .ticks import Ticker
+from .util import pluralise
+from .telnet import TelnetConnection, TelnetFactory
 from .websockets import WebSocketConnection
 from .zones import Zone
 
 NoneType = type(None)
-static = File('html')
+
+
+def validate_outbound_policy(instance, attribute, value):
+    """Make sure value is one of the allowed outbound policies."""
+    if value not in outbound_policies:
+        raise InvalidOutboundPolicyError(value, outbound_policies)
 
 
 class FunctionResource(Resource):
@@ -66,8 +90,21 @@ class Game:
     websocket_class = attrib(default=Factory(lambda: WebSocketConnection))
     websocket_factory = attrib(default=Factory(NoneType), repr=False)
     websocket_port = attrib(default=Factory(NoneType), repr=False)
+    websocket_path = attrib(default=Factory(NoneType))
     site_port = attrib(default=Factory(NoneType), repr=False)
+    telnet_port = attrib(default=Factory(NoneType))
+    telnet_class = attrib(default=Factory(lambda: TelnetConnection))
+    telnet_factory = attrib(default=Factory(NoneType), repr=False)
+    telnet_listener = attrib(default=Factory(NoneType), repr=False)
+    gateways = attrib(default=Factory(int))
+    gateway_address = attrib(default=Factory(NoneType))
+    remote_session_class = attrib(default=Factory(lambda: RemoteSession))
+    gateway_listener = attrib(default=Factory(NoneType), repr=False)
+    gateway_processes = attrib(default=Factory(list), init=False, repr=False)
     web_root = attrib(default=Factory(Resource), repr=False)
+    static_path = attrib(default=Factory(lambda: 'html'))
+    static_max_age = attrib(default=Factory(lambda: 300))
+    static_resource = attrib(default=Factory(NoneType), repr=False)
     socials_factory = attrib(default=Factory(lambda: factory))
     connections = attrib(default=Factory(list), init=False, repr=False)
     zones = attrib(default=Factory(dict), init=False, repr=False)
@@ -88,12 +125,77 @@ class Game:
             lambda: 'While executing your command an error occurred.'
         )
     )
+    idle_msg = attrib(
+        default=Factory(lambda: 'You have been idle for too long.')
+    )
     started = attrib(default=Factory(datetime.utcnow))
     directions = attrib(default=Factory(dict), repr=False)
     _objects = attrib(default=Factory(dict), init=False, repr=False)
     account_store = attrib(default=Factory(NoneType), repr=False)
     filename = attrib(default=Factory(lambda: 'game.yaml'))
     tasks = attrib(default=Factory(dict))
+    scheduler = attrib(default=Factory(NoneType), repr=False)
+    scheduler_resolution = attrib(default=Factory(lambda: 0.1))
+    task_samples = attrib(default=Factory(lambda: 100))
+    ticker = attrib(default=Factory(NoneType), repr=False)
+    tick_interval = attrib(default=Factory(lambda: 1.0))
+    tick_budget = attrib(default=Factory(lambda: 0.05))
+    tick_linger = attrib(default=Factory(lambda: 60))
+    tick_max_catch_up = attrib(default=Factory(lambda: 3600))
+    event_queue = attrib(default=Factory(NoneType), repr=False)
+    event_catch_up_window = attrib(default=Factory(lambda: 60))
+    task_processes = attrib(default=Factory(NoneType))
+    process_pool = attrib(default=Factory(NoneType), repr=False)
+    profile_window = attrib(default=Factory(NoneType), repr=False)
+    profile_path = attrib(default=Factory(lambda: 'profiles'))
+    profile_max_seconds = attrib(default=Factory(lambda: 300))
+    profile_top = attrib(default=Factory(lambda: 15))
+    lag_monitor = attrib(default=Factory(NoneType), repr=False)
+    lag_interval = attrib(default=Factory(lambda: 0.1))
+    lag_threshold = attrib(default=Factory(lambda: 0.25))
+    lag_samples = attrib(default=Factory(lambda: 50))
+    lag_stack_depth = attrib(default=Factory(lambda: 20))
+    metrics_hosts = attrib(default=Factory(lambda: {'127.0.0.1', '::1'}))
+    metrics_token = attrib(default=Factory(NoneType), repr=False)
+    metrics = attrib(default=Factory(NoneType), repr=False)
+    binary_protocol = attrib(default=Factory(bool))
+    outbound_max_messages = attrib(default=Factory(lambda: 1000))
+    outbound_max_bytes = attrib(default=Factory(lambda: 1024 * 1024))
+    outbound_policy = attrib(
+        default=Factory(lambda: 'summarise'),
+        validator=validate_outbound_policy, on_setattr=setters.validate
+    )
+    outbound_overflow_factor = attrib(default=Factory(lambda: 4))
+    compression = attrib(default=Factory(bool))
+    compression_window_bits = attrib(default=Factory(NoneType))
+    compression_mem_level = attrib(default=Factory(NoneType))
+    compression_no_context_takeover = attrib(default=Factory(bool))
+    login_timeout = attrib(default=Factory(lambda: 300))
+    idle_timeout = attrib(default=Factory(lambda: 3600))
+    keepalive_interval = attrib(default=Factory(lambda: 30))
+    keepalive_timeout = attrib(default=Factory(lambda: 60))
+    reap_interval = attrib(default=Factory(lambda: 5))
+    rate_limits = attrib(
+        default=Factory(
+            lambda: dict(login=(0.5, 5), command=(10, 20), broadcast=(2, 5))
+        )
+    )
+    rate_limit_policy = attrib(default=Factory(lambda: 'queue'))
+    rate_limit_queue_size = attrib(default=Factory(lambda: 20))
+    rate_limit_msg = attrib(
+        default=Factory(lambda: 'You are sending commands too quickly.')
+    )
+    broadcast_commands = attrib(
+        default=Factory(lambda: {'say'}), repr=False
+    )
+    broadcast_prefixes = attrib(default=Factory(lambda: '"\''), repr=False)
+    account_buckets = attrib(default=Factory(dict), init=False, repr=False)
+    resume_secret = attrib(
+        default=Factory(lambda: os.urandom(32)), repr=False
+    )
+    resume_ttl = attrib(default=Factory(lambda: 300))
+    resume_refresh_interval = attrib(default=Factory(lambda: 60))
+    resume_buffer_size = attrib(default=Factory(lambda: 200))
 
     def __repr__(self):
         return f'{type(self).__name__}({self.interface}:{self.http_port})'
@@ -122,18 +224,96 @@ class Game:
             self.add_direction(name, *aliases, **coordinates)
         if self.account_store is None:
             self.account_store = AccountStore(self)
+        if self.metrics is None:
+            self.metrics = GameMetrics(game=self)
+        if self.scheduler is None:
+            self.scheduler = Scheduler(resolution=self.scheduler_resolution)
+        self.scheduler.observe_lag = self.metrics.reactor_lag.observe
+        if self.ticker is None:
+            self.ticker = Ticker(self)
+        if self.event_queue is None:
+            self.event_queue = EventQueue(self)
+        if self.lag_monitor is None:
+            self.lag_monitor = LagMonitor(self)
 
     def new_id(self):
         self.max_id += 1
         return self.max_id
 
     def on_websocket_page(self, request):
-        """Return the websocket port number."""
-        return dumps(self.websocket_port.port).encode()
+        """Return the websocket port number, or the path the websocket is
+        mounted on if it is being served on the HTTP port."""
+        if self.serve_websocket_path():
+            return dumps(f'/{self.websocket_path}').encode()
+        elif self.websocket_port is None:
+            # Gateways are listening on our behalf.
+            port = self.http_port + 1
+        else:
+            port = self.websocket_port.port
+        return dumps(port).encode()
+
+    def metrics_allowed(self, request):
+        """Return True if request may see the metrics pages, either because it
+        comes from one of self.metrics_hosts, or because it carries
+        self.metrics_token as a bearer token or a token argument. If not, the
+        response code is set to 403."""
+        address = request.getClientAddress()
+        if getattr(address, 'host', None) in self.metrics_hosts:
+            return True
+        if self.metrics_token is not None:
+            token = self.metrics_token.encode()
+            header = request.getHeader(b'authorization') or b''
+            if hmac.compare_digest(header, b'Bearer ' + token):
+                return True
+            for value in request.args.get(b'token', []):
+                if hmac.compare_digest(value, token):
+                    return True
+        request.setResponseCode(403)
+        return False
+
+    def on_tasks_page(self, request):
+        """Return statistics for every task as JSON."""
+        if not self.metrics_allowed(request):
+            return b'Forbidden.'
+        request.setHeader(b'Content-Type', b'application/json')
+        return dumps([t.stats() for t in self.tasks.values()]).encode()
+
+    def on_metrics_page(self, request):
+        """Return self.metrics in the Prometheus text exposition format."""
+        if not self.metrics_allowed(request):
+            return b'Forbidden.'
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4')
+        return self.metrics.render().encode()
 
     def on_index_page(self, request):
-        """Get the index page. By default redirects to /static/index.html."""
-        return redirectTo(b'/static/index.html', request)
+        """Get the index page. By default redirects to /static/index.html,
+        telling the client where the websocket is if it is being served on the
+        HTTP port, which saves a request to /wsport."""
+        url = '/static/index.html'
+        if self.serve_websocket_path():
+            url += f'?websocket=/{self.websocket_path}'
+        return redirectTo(url.encode(), request)
+
+    def serve_websocket_path(self):
+        """Return True if websockets should be accepted on
+        self.websocket_path on the HTTP port, rather than on a port of their
+        own. Gateways always use a port of their own."""
+        return self.websocket_path is not None and not self.gateways
+
+    def accept_compression(self, offers):
+        """Decide which permessage-deflate offer (if any) to accept from a
+        client. Used as the perMessageCompressionAccept protocol option when
+        self.compression is True.
+
+        The window bits, memory level and context takeover settings are taken
+        from the compression_* attributes of this game. If the client asks for
+        a smaller window, or for no context takeover, its request is honoured.
+        Gateways are given the same settings."""
+        return accept_compression(
+            offers, window_bits=self.compression_window_bits,
+            mem_level=self.compression_mem_level,
+            no_context_takeover=self.compression_no_context_takeover
+        )
 
     def start_listening(self):
         """Start listening for network connections. Usually called from
@@ -143,14 +323,17 @@ class Game:
         self.web_root.putChild(
             b'wsport', FunctionResource(self.on_websocket_page)
         )
+        self.logger.info('Adding task statistics page.')
+        self.web_root.putChild(b'tasks', FunctionResource(self.on_tasks_page))
+        self.web_root.putChild(
+            b'metrics', FunctionResource(self.on_metrics_page)
+        )
         self.logger.info('Adding index page.')
         self.web_root.putChild(b'', FunctionResource(self.on_index_page))
-        static_path = static.path
+        static_path = self.static_path
         if not os.path.isdir(static_path):
             self.logger.info('Making static directory %s.', static_path)
             os.makedirs(static_path)
-        self.logger.info('Adding static page.')
-        self.web_root.putChild(b'static', static)
         index_path = os.path.join(static_path, 'index.html')
         if not os.path.isfile(index_path):
             self.logger.info('Creating index page at %s.', index_path)
@@ -161,19 +344,35 @@ class Game:
             self.logger.info('Creating javascript at %s.', js_path)
             with open(js_path, 'w') as f:
                 f.write(js)
-        if self.websocket_factory is None:
-            self.websocket_factory = WebSocketServerFactory(
-                f'ws://{self.interface}:{self.http_port + 1}'
+        self.logger.info('Adding static page.')
+        if self.static_resource is None:
+            self.static_resource = StaticResource(
+                static_path, max_age=self.static_max_age
             )
-            self.websocket_factory.protocol = self.websocket_class
-        self.websocket_factory.game = self
-        self.websocket_port = listenWS(
-            self.websocket_factory, interface=self.interface
-        )
+        self.static_resource.load()
         self.logger.info(
-            'Listening for websockets on %s:%d.',
-            self.websocket_port.interface, self.websocket_port.port
+            'Loaded %d static files.', len(self.static_resource.assets)
         )
+        self.web_root.putChild(b'static', self.static_resource)
+        if self.gateways and self.gateway_address is None:
+            self.gateway_address = 'gateway.sock'
+        if self.gateway_address is not None:
+            self.listen_for_gateways()
+        if self.gateways:
+            self.start_gateways()
+        else:
+            self.listen_for_websockets()
+        if self.telnet_port is not None:
+            if self.telnet_factory is None:
+                self.telnet_factory = TelnetFactory(self)
+                self.telnet_factory.protocol = self.telnet_class
+            self.telnet_listener = reactor.listenTCP(
+                self.telnet_port, self.telnet_factory, interface=self.interface
+            )
+            self.logger.info(
+                'Listening for telnet connections on %s:%d.',
+                self.telnet_listener.interface, self.telnet_listener.port
+            )
         site = Site(self.web_root)
         self.site_port = reactor.listenTCP(
             self.http_port, site, interface=self.interface
@@ -183,6 +382,104 @@ class Game:
             self.site_port.interface, self.site_port.port
         )
         self.task(300, now=False)(self.dump_task)
+        self.task(self.reap_interval, now=False)(self.reap_task)
+        self.task(self.tick_interval, now=False)(self.world_tick_task)
+        self.lag_monitor.start()
+        reactor.addSystemEventTrigger(
+            'before', 'shutdown', self.lag_monitor.stop
+        )
+
+    def listen_for_websockets(self):
+        """Start listening for websocket connections in this process. If
+        self.websocket_path is not None, the websocket is mounted at that path
+        on self.web_root instead of listening on a port of its own."""
+        if self.websocket_factory is None:
+            if self.websocket_path is None:
+                url = f'ws://{self.interface}:{self.http_port + 1}'
+            else:
+                url = f'ws://{self.interface}:{self.http_port}/' + \
+                    self.websocket_path
+            self.websocket_factory = WebSocketServerFactory(url)
+            self.websocket_factory.protocol = self.websocket_class
+        if self.compression:
+            self.logger.info('Enabling permessage-deflate compression.')
+            self.websocket_factory.setProtocolOptions(
+                perMessageCompressionAccept=self.accept_compression
+            )
+        self.websocket_factory.game = self
+        if self.websocket_path is not None:
+            self.web_root.putChild(
+                self.websocket_path.encode(),
+                WebSocketResource(self.websocket_factory)
+            )
+            self.logger.info(
+                'Accepting websockets at /%s on the HTTP port.',
+                self.websocket_path
+            )
+            return
+        self.websocket_port = listenWS(
+            self.websocket_factory, interface=self.interface
+        )
+        self.logger.info(
+            'Listening for websockets on %s:%d.',
+            self.websocket_port.interface, self.websocket_port.port
+        )
+
+    def listen_for_gateways(self):
+        """Listen for connections from gateway processes on
+        self.gateway_address, which is either a UNIX socket path, or a TCP port
+        on the loopback interface."""
+        factory = GatewayLinkFactory(self)
+        address = self.gateway_address
+        if isinstance(address, int):
+            self.gateway_listener = reactor.listenTCP(
+                address, factory, interface='127.0.0.1'
+            )
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            self.gateway_listener = reactor.listenUNIX(address, factory)
+        self.logger.info('Listening for gateways on %s.', address)
+
+    def start_gateways(self):
+        """Spawn self.gateways gateway processes, which will all accept
+        websocket connections on the port after self.http_port."""
+        args = [
+            sys.executable, '-m', 'mudmaker.gateway',
+            str(self.gateway_address), '--interface', self.interface,
+            '--port', str(self.http_port + 1)
+        ]
+        if self.binary_protocol:
+            args.append('--binary-protocol')
+        if self.compression:
+            args.append('--compression')
+            if self.compression_window_bits is not None:
+                args.extend(
+                    ['--window-bits', str(self.compression_window_bits)]
+                )
+            if self.compression_mem_level is not None:
+                args.extend(['--mem-level', str(self.compression_mem_level)])
+            if self.compression_no_context_takeover:
+                args.append('--no-context-takeover')
+        for x in range(self.gateways):
+            self.gateway_processes.append(
+                reactor.spawnProcess(
+                    GatewayProcessProtocol(self), sys.executable, args,
+                    env=os.environ
+                )
+            )
+        self.logger.info('Started %d gateways.', self.gateways)
+        reactor.addSystemEventTrigger('before', 'shutdown', self.stop_gateways)
+
+    def stop_gateways(self):
+        """Stop any gateway processes which were started by
+        self.start_gateways."""
+        for process in self.gateway_processes:
+            try:
+                process.signalProcess('TERM')
+            except ProcessExitedAlready:
+                pass
+        self.gateway_processes.clear()
 
     def maybe_load(self):
         """Load this game, if the game file exists."""
@@ -295,17 +592,21 @@ class Game:
 
     def as_dict(self):
         """Return a dictionary which can be dumped to save the state of this
-        game."""
-        return self.dump_value(
-            dict(objects=[o.dump() for o in self._objects.values()])
-        )
+        game. Queued events are only included if there are any."""
+        data = dict(objects=[o.dump() for o in self._objects.values()])
+        if self.event_queue.events:
+            data['events'] = self.event_queue.dump()
+        return self.dump_value(data)
 
     def dump(self, filename=None):
         """Dump game state to disk."""
         if filename is None:
             filename = self.filename
-        with open(filename, 'w') as f:
-            dump(self.as_dict(), stream=f)
+        started = perf_counter()
+        with self.lag_monitor.doing('save', filename):
+            with open(filename, 'w') as f:
+                dump(self.as_dict(), stream=f)
+        self.metrics.saves.observe(perf_counter() - started)
 
     def from_dict(self, data):
         """Load the data loaded with self.load."""
@@ -334,6 +635,7 @@ class Game:
             bases = b[id]
             self.call_on_init(bases, obj)
             self.logger.info('Loaded %s.', obj)
+        self.event_queue.load(data.get('events', []))
 
     def load(self):
         """Load some yaml and run it through self.from_dict."""
@@ -341,13 +643,18 @@ class Game:
             data = load(f, Loader=FullLoader)
         self.from_dict(data)
 
-    def task(self, *args, **kwargs):
-        """Decorate a function to be made into a task, using
-        twisted.internet.task.LoopingCall. All arguments will be passed to the
-        LoopingCall instance's start method."""
+    def task(
+        self, *args, mode='reactor', snapshot=None, on_result=None, **kwargs
+    ):
+        """Decorate a function to be made into a task, run by
+        self.scheduler. The mode, snapshot and on_result arguments are passed
+        to the Task constructor, and all other arguments to the task's start
+        method."""
 
         def inner(func):
-            t = Task(self, func)
+            t = Task(
+                self, func, mode=mode, snapshot=snapshot, on_result=on_result
+            )
             self.tasks[t.id] = t
             t.start(*args, **kwargs)
             return t
@@ -361,6 +668,82 @@ class Game:
         self.dump(filename)
         self.logger.info('Objects dumped: %d.', len(self._objects))
 
+    def world_tick_task(self):
+        """Run a world tick."""
+        self.ticker.tick()
+
+    def reap_task(self):
+        """Disconnect idle connections, send keepalives to quiet ones, and
+        drop any which have not answered a keepalive in time.
+
+        Connections which have not logged in are disconnected after
+        self.login_timeout seconds without input, and everyone else after
+        self.idle_timeout seconds. Either timeout can be None to disable it.
+        If self.keepalive_interval is None, keepalives are not sent.
+
+        Logged in players are also sent a new resume token once theirs is
+        self.resume_refresh_interval seconds old."""
+        now = time()
+        for con in list(self.connections):
+            player = con.object
+            if player is not None and player.resume_nonce is not None and \
+               now - player.resume_issued >= self.resume_refresh_interval:
+                con.send('resumeToken', self.make_resume_token(player))
+            if player is None:
+                timeout = self.login_timeout
+            else:
+                timeout = self.idle_timeout
+            idle = now - con.last_active
+            if timeout is not None and idle > timeout:
+                con.logger.info('Idle for %d seconds.', idle)
+                con.disconnect(self.idle_msg)
+            elif self.keepalive_interval is None:
+                continue
+            elif con.keepalive_sent is not None:
+                if now - con.keepalive_sent > self.keepalive_timeout:
+                    con.logger.info('Keepalive timed out.')
+                    con.abort()
+            elif now - con.last_seen >= self.keepalive_interval and \
+                    con.keepalive():
+                con.keepalive_sent = now
+
+    def sign_resume_token(self, id, nonce, issued):
+        """Return the signature for a resume token."""
+        return hmac.new(
+            self.resume_secret, f'{id}:{nonce}:{issued}'.encode(), 'sha256'
+        ).hexdigest()
+
+    def make_resume_token(self, player):
+        """Return a new resume token for player, invalidating any others."""
+        player.resume_nonce = token_hex(8)
+        player.resume_issued = int(time())
+        signature = self.sign_resume_token(
+            player.id, player.resume_nonce, player.resume_issued
+        )
+        return f'{player.id}.{player.resume_issued}.{signature}'
+
+    def check_resume_token(self, token):
+        """Return the player a resume token was issued to, or None if the
+        token is invalid, has been replaced, or was issued more than
+        self.resume_ttl seconds ago. Connected players are sent a new token
+        every self.resume_refresh_interval seconds, so the token a client
+        holds when it loses its connection stays valid for a while."""
+        try:
+            id, issued, signature = token.split('.')
+            player = self.objects[int(id)]
+            issued = int(issued)
+        except (KeyError, ValueError):
+            return None
+        if player.resume_nonce is None or not hmac.compare_digest(
+            signature.encode(), self.sign_resume_token(
+                player.id, player.resume_nonce, issued
+            ).encode()
+        ):
+            return None
+        if time() - issued > self.resume_ttl:
+            return None
+        return player
+
     def finish_login(self, con, player):
         """Connection an Object instance player to the connection con."""
         con.set_prompt_text('Command')
@@ -382,6 +765,16 @@ class Game:
             old.message('*** You have logged in from somewhere else.')
             old.object = None
             old.disconnect('Goodbye.')
+        if player.output_buffer:
+            n = len(player.output_buffer)
+            con.message(
+                '*** %d %s while you were away: ***' % (
+                    n, pluralise(n, 'message')
+                )
+            )
+            while player.output_buffer:
+                con.message(player.output_buffer.popleft())
+        con.send('resumeToken', self.make_resume_token(player))
         if not self.zones:
             self.make_object('Zone', (Zone,), name='The First Zone')
         if not self.rooms:
@@ -0,0 +1,495 @@
+"""Provides connection gateways, which let websocket framing, JSON encoding
+and compression happen in processes other than the one running the world.
+
+Gateways accept websocket connections, and talk to the world process over a
+local socket. Every message on that socket is length-prefixed, and starts with
+a one-byte message type and a four-byte session number. Output from the world
+is sent as compact binary frames (see mudmaker.protocol), which the gateway
+either passes straight on to clients that speak the binary protocol, or turns
+into JSON for everyone else.
+
+Several gateways can listen on the same websocket port, in which case the
+operating system spreads new connections between them.
+
+Run a gateway with python -m mudmaker.gateway, or let Game.start_listening
+spawn them for you by setting Game.gateways."""
+
+import os
+import socket
+import sys
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+from functools import partial
+from json import dumps
+from logging import basicConfig, getLogger
+from struct import Struct
+
+from autobahn.twisted.websocket import (
+    WebSocketServerFactory, WebSocketServerProtocol
+)
+from autobahn.websocket.compress import (
+    PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+)
+from autobahn.websocket.types import ConnectionDeny
+from twisted.internet import reactor
+from twisted.internet.error import ConnectionDone
+from twisted.internet.interfaces import IPushProducer
+from twisted.internet.protocol import (
+    Factory, ProcessProtocol, ReconnectingClientFactory
+)
+from twisted.protocols.basic import Int32StringReceiver
+from twisted.python.failure import Failure
+from zope.interface import implementer
+
+from .exc import ProtocolError
+from .protocol import (
+    binary_protocol, decode_frame, encode_frame, json_protocol
+)
+from .sessions import Session
+
+header = Struct('>BI')
+
+# Messages from gateways to the world.
+OPEN = 1  # A client has connected. The payload is its host and port.
+INPUT = 2  # The payload is a line of input from the client.
+CLOSE = 3  # The client has gone. The payload is the reason.
+PAUSE = 4  # The client is not reading fast enough.
+RESUME = 5  # The client has caught up.
+PONG = 6  # The client has answered a ping.
+
+# Messages from the world to gateways.
+OUTPUT = 10  # The payload is a binary frame to send to the client.
+DISCONNECT = 11  # Close the connection, using the payload as the reason.
+ABORT = 12  # Drop the connection immediately.
+PING = 13  # Send the client a websocket ping.
+
+
+def pack_message(type, session_id, payload=b''):
+    """Return a message ready to be sent with sendString."""
+    return header.pack(type, session_id) + payload
+
+
+def unpack_message(data):
+    """Return a tuple of (type, session_id, payload)."""
+    if len(data) < header.size:
+        raise ProtocolError('Message too short.')
+    type, session_id = header.unpack_from(data)
+    return type, session_id, data[header.size:]
+
+
+class RemoteTransport:
+    """Stands in for the transport of a RemoteSession, sending everything
+    through the gateway link the session arrived on."""
+
+    def __init__(self, link, session_id):
+        self.link = link
+        self.session_id = session_id
+        self.producer = None
+
+    def write(self, data):
+        self.link.send_message(OUTPUT, self.session_id, data)
+
+    def loseConnection(self, reason=None):
+        self.link.send_message(
+            DISCONNECT, self.session_id, (reason or '').encode()
+        )
+
+    def abortConnection(self):
+        self.link.send_message(ABORT, self.session_id)
+
+    def ping(self):
+        self.link.send_message(PING, self.session_id)
+
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
+
+class RemoteSession(Session):
+    """A session whose client is connected to a gateway process."""
+
+    def disconnect(self, text=None):
+        """Ask the gateway to close the connection."""
+        self.transport.loseConnection(text)
+
+    def abort(self):
+        """Ask the gateway to drop the connection."""
+        self.transport.abortConnection()
+
+    def encode(self, name, *args):
+        """Encode everything as binary frames, leaving the gateway to convert
+        them for clients which speak JSON."""
+        return encode_frame(name, *args)
+
+    def transmit(self, payload):
+        self.transport.write(payload)
+
+    def keepalive(self):
+        """Ask the gateway to send a websocket ping. The gateway tells us when
+        the pong arrives."""
+        self.transport.ping()
+        return True
+
+
+class GatewayLink(Int32StringReceiver):
+    """The world's end of a connection from a gateway."""
+
+    MAX_LENGTH = 16 * 1024 * 1024
+
+    def connectionMade(self):
+        self.game = self.factory.game
+        self.sessions = {}
+        self.game.logger.info('Gateway connected.')
+
+    def connectionLost(self, reason):
+        self.game.logger.info('Gateway disconnected.')
+        for session in list(self.sessions.values()):
+            session.close_session(reason)
+        self.sessions.clear()
+
+    def send_message(self, type, session_id, payload=b''):
+        """Send a message to the gateway."""
+        self.sendString(pack_message(type, session_id, payload))
+
+    def stringReceived(self, data):
+        try:
+            type, session_id, payload = unpack_message(data)
+        except ProtocolError:
+            self.game.logger.exception('Invalid message from gateway:')
+            return
+        if type == OPEN:
+            host, _, port = payload.decode().rpartition(':')
+            session = self.game.remote_session_class()
+            session.factory = self.factory
+            session.transport = RemoteTransport(self, session_id)
+            self.sessions[session_id] = session
+            session.open_session(host, int(port))
+            return
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        if type == INPUT:
+            session.receive_string(payload.decode())
+        elif type == CLOSE:
+            del self.sessions[session_id]
+            session.close_session(Failure(ConnectionDone(payload.decode())))
+        elif type == PAUSE:
+            session.pauseProducing()
+        elif type == RESUME:
+            session.resumeProducing()
+        elif type == PONG:
+            session.keepalive_received()
+
+
+class GatewayLinkFactory(Factory):
+    """Creates GatewayLink instances for a game."""
+
+    protocol = GatewayLink
+
+    def __init__(self, game):
+        self.game = game
+
+
+@implementer(IPushProducer)
+class GatewayConnection(WebSocketServerProtocol):
+    """A websocket client connected to a gateway. Clients are turned away
+    while the gateway is not connected to the world, because the world would
+    never hear about them."""
+
+    binary = False
+    session_id = None
+
+    def onConnect(self, request):
+        protocols = request.protocols
+        gateway = self.factory.gateway
+        if gateway.link is None:
+            raise ConnectionDeny(
+                ConnectionDeny.SERVICE_UNAVAILABLE,
+                'Not connected to the world.'
+            )
+        if binary_protocol in protocols and gateway.binary_protocol:
+            self.binary = True
+            return binary_protocol
+        elif json_protocol in protocols:
+            return json_protocol
+
+    def onOpen(self):
+        gateway = self.factory.gateway
+        if gateway.link is None:
+            # The link went down during the handshake.
+            return self.sendClose(
+                code=self.CLOSE_STATUS_CODE_TRY_AGAIN_LATER,
+                reason='Not connected to the world.'
+            )
+        self.session_id = gateway.add_connection(self)
+        peer = self.transport.getPeer()
+        self.registerProducer(self, True)
+        gateway.send_message(
+            OPEN, self.session_id, f'{peer.host}:{peer.port}'.encode()
+        )
+
+    def onMessage(self, payload, is_binary):
+        if not is_binary:
+            self.factory.gateway.send_message(INPUT, self.session_id, payload)
+
+    def connectionLost(self, reason):
+        super().connectionLost(reason)
+        if self.session_id is not None:
+            self.factory.gateway.remove_connection(
+                self.session_id, reason.getErrorMessage()
+            )
+
+    def send_frame(self, frame):
+        """Send a binary frame from the world, converting it to JSON if
+        necessary."""
+        if self.binary:
+            self.sendMessage(frame, isBinary=True)
+        else:
+            name, args = decode_frame(frame)
+            self.sendMessage(dumps(dict(name=name, args=args)).encode())
+
+    def onPong(self, payload):
+        self.factory.gateway.send_message(PONG, self.session_id)
+
+    def pauseProducing(self):
+        self.factory.gateway.send_message(PAUSE, self.session_id)
+
+    def resumeProducing(self):
+        self.factory.gateway.send_message(RESUME, self.session_id)
+
+    def stopProducing(self):
+        pass
+
+
+class GatewayClient(Int32StringReceiver):
+    """The gateway's end of its connection to the world."""
+
+    MAX_LENGTH = 16 * 1024 * 1024
+
+    def connectionMade(self):
+        self.factory.resetDelay()
+        self.factory.gateway.link = self
+        self.factory.gateway.logger.info('Connected to the world.')
+
+    def connectionLost(self, reason):
+        gateway = self.factory.gateway
+        gateway.link = None
+        gateway.logger.info('Lost connection to the world.')
+        for con in list(gateway.connections.values()):
+            con.dropConnection(abort=True)
+
+    def stringReceived(self, data):
+        gateway = self.factory.gateway
+        try:
+            type, session_id, payload = unpack_message(data)
+        except ProtocolError:
+            gateway.logger.exception('Invalid message from the world:')
+            return
+        con = gateway.connections.get(session_id)
+        if con is None:
+            return
+        if type == OUTPUT:
+            try:
+                con.send_frame(payload)
+            except ProtocolError:
+                gateway.logger.exception(
+                    'Dropping invalid frame for session %d:', session_id
+                )
+        elif type == DISCONNECT:
+            con.sendClose(
+                code=con.CLOSE_STATUS_CODE_NORMAL,
+                reason=payload.decode() or None
+            )
+        elif type == ABORT:
+            con.dropConnection(abort=True)
+        elif type == PING:
+            con.sendPing()
+
+
+class GatewayClientFactory(ReconnectingClientFactory):
+    """Keeps a gateway connected to the world."""
+
+    protocol = GatewayClient
+    maxDelay = 5
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+
+class GatewayProcessProtocol(ProcessProtocol):
+    """Logs the output of a gateway process spawned by a game."""
+
+    def __init__(self, game):
+        self.game = game
+
+    def outReceived(self, data):
+        for line in data.decode(errors='replace').splitlines():
+            self.game.logger.info('Gateway %s: %s', self.transport.pid, line)
+
+    errReceived = outReceived
+
+    def processEnded(self, reason):
+        self.game.logger.info(
+            'Gateway exited: %s', reason.getErrorMessage()
+        )
+
+
+class Gateway:
+    """A gateway process. Listens for websockets on interface:port, and
+    forwards everything to the world listening on world_address, which is
+    either a UNIX socket path, or a TCP port on the loopback interface."""
+
+    def __init__(
+        self, world_address, interface='127.0.0.1', port=4001,
+        binary_protocol=False, compression=False, window_bits=None,
+        mem_level=None, no_context_takeover=False
+    ):
+        self.world_address = world_address
+        self.interface = interface
+        self.port = port
+        self.binary_protocol = binary_protocol
+        self.compression = compression
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.no_context_takeover = no_context_takeover
+        self.connections = {}
+        self.max_id = 0
+        self.link = None
+        self.logger = getLogger(f'Gateway {os.getpid()}')
+
+    def add_connection(self, con):
+        """Register a websocket connection, and return its session number."""
+        self.max_id += 1
+        self.connections[self.max_id] = con
+        return self.max_id
+
+    def remove_connection(self, session_id, reason):
+        """A websocket connection has gone away."""
+        if self.connections.pop(session_id, None) is not None:
+            self.send_message(CLOSE, session_id, reason.encode())
+
+    def send_message(self, type, session_id, payload=b''):
+        """Send a message to the world, if the link is up. While it is down
+        there are no connections to send messages for, since new ones are
+        refused and existing ones are dropped when the link goes."""
+        if self.link is not None:
+            self.link.sendString(pack_message(type, session_id, payload))
+
+    def start(self):
+        """Connect to the world, and start listening for websockets."""
+        factory = GatewayClientFactory(self)
+        if isinstance(self.world_address, int):
+            reactor.connectTCP('127.0.0.1', self.world_address, factory)
+        else:
+            reactor.connectUNIX(self.world_address, factory)
+        websocket_factory = WebSocketServerFactory(
+            f'ws://{self.interface}:{self.port}'
+        )
+        websocket_factory.protocol = GatewayConnection
+        websocket_factory.gateway = self
+        if self.compression:
+            websocket_factory.setProtocolOptions(
+                perMessageCompressionAccept=partial(
+                    accept_compression, window_bits=self.window_bits,
+                    mem_level=self.mem_level,
+                    no_context_takeover=self.no_context_takeover
+                )
+            )
+        listen_shared(self.interface, self.port, websocket_factory)
+        self.logger.info(
+            'Listening for websockets on %s:%d.', self.interface, self.port
+        )
+
+
+def accept_compression(
+    offers, window_bits=None, mem_level=None, no_context_takeover=False
+):
+    """Accept the first permessage-deflate offer, if there is one.
+
+    The window bits, memory level and context takeover settings are used if
+    they are given. If the client asks for a smaller window, or for no context
+    takeover, its request is honoured."""
+    for offer in offers:
+        if not isinstance(offer, PerMessageDeflateOffer):
+            continue
+        if window_bits is not None and offer.request_max_window_bits:
+            window_bits = min(window_bits, offer.request_max_window_bits)
+        return PerMessageDeflateOfferAccept(
+            offer, window_bits=window_bits, mem_level=mem_level,
+            no_context_takeover=no_context_takeover or
+            offer.request_no_context_takeover
+        )
+
+
+def listen_shared(interface, port, factory):
+    """Listen on interface:port with SO_REUSEPORT set, so that several
+    processes can accept connections on the same port."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((interface, port))
+    sock.listen(128)
+    sock.setblocking(False)
+    try:
+        return reactor.adoptStreamPort(sock.fileno(), socket.AF_INET, factory)
+    finally:
+        sock.close()
+
+
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+
+parser.add_argument(
+    'world', help='The UNIX socket path or local TCP port of the world'
+)
+
+parser.add_argument(
+    '-i', '--interface', default='127.0.0.1', help='The interface to bind to'
+)
+
+parser.add_argument(
+    '-p', '--port', type=int, default=4001, help='The websocket port to '
+    'listen on'
+)
+
+parser.add_argument(
+    '-b', '--binary-protocol', action='store_true', help='Allow clients to '
+    'use the binary protocol'
+)
+
+parser.add_argument(
+    '-c', '--compression', action='store_true', help='Enable '
+    'permessage-deflate compression'
+)
+
+parser.add_argument(
+    '--window-bits', type=int, help='The largest compression window to use'
+)
+
+parser.add_argument(
+    '--mem-level', type=int, help='The zlib memory level to compress with'
+)
+
+parser.add_argument(
+    '--no-context-takeover', action='store_true', help='Reset the '
+    'compression context after every message'
+)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    world = args.world
+    if world.isdigit():
+        world = int(world)
+    basicConfig(level='INFO', stream=sys.stdout)
+    Gateway(
+        world, interface=args.interface, port=args.port,
+        binary_protocol=args.binary_protocol, compression=args.compression,
+        window_bits=args.window_bits, mem_level=args.mem_level,
+        no_context_takeover=args.no_context_takeover
+    ).start()
+    reactor.run()
+
+
+if __name__ == '__main__':
+    main()
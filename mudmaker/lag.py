@@ -0,0 +1,178 @@
+"""Provides the LagMonitor class, which watches the reactor from another
+thread, and records what was running whenever it stalls."""
+
+import sys
+from collections import deque
+from datetime import datetime
+from logging import getLogger
+from threading import Event, Thread, get_ident
+from traceback import format_stack
+
+from attr import attrs, attrib, Factory
+
+NoneType = type(None)
+
+
+@attrs
+class Activity:
+    """Something the reactor thread is doing, for use as a context manager
+    with LagMonitor.doing. Activities nest, so a save started by a task is
+    attributed to both."""
+
+    monitor = attrib(repr=False)
+    kind = attrib()
+    name = attrib()
+    con = attrib(default=Factory(NoneType), repr=False)
+    previous = attrib(default=Factory(NoneType), init=False, repr=False)
+
+    def __enter__(self):
+        self.previous = self.monitor.current
+        self.monitor.current = self
+        return self
+
+    def __exit__(self, *args):
+        self.monitor.current = self.previous
+
+    def describe(self):
+        """Return a description of this activity."""
+        string = f'{self.kind} {self.name}'
+        if self.con is not None:
+            string += ' from %s:%d' % (self.con.host, self.con.port)
+            if self.con.object is not None:
+                string += f' ({self.con.object})'
+        return string
+
+
+@attrs
+class Stall:
+    """A time the reactor stalled for at least game.lag_threshold seconds.
+    The activities which were running are listed innermost first, and stack
+    is the reactor thread's stack when the stall was noticed."""
+
+    started = attrib()
+    duration = attrib()
+    activities = attrib()
+    stack = attrib(repr=False)
+    finished = attrib(default=Factory(bool))
+
+
+@attrs
+class LagMonitor:
+    """Measures how late the reactor runs a heartbeat every game.lag_interval
+    seconds. A watchdog thread checks the heartbeat, so stalls are caught
+    while they happen: if the reactor is game.lag_threshold seconds late, the
+    activity it is busy with and a sample of its stack are recorded in
+    self.stalls, which keeps the last game.lag_samples stalls.
+
+    The reactor thread marks what it is doing with self.doing, which costs a
+    couple of attribute assignments, so nothing is profiled or sampled unless
+    the reactor actually stalls."""
+
+    game = attrib()
+    current = attrib(default=Factory(NoneType), init=False, repr=False)
+    stalls = attrib(default=Factory(NoneType), init=False, repr=False)
+    stall = attrib(default=Factory(NoneType), init=False, repr=False)
+    count = attrib(default=Factory(int), init=False)
+    lag = attrib(default=Factory(float), init=False)
+    max_lag = attrib(default=Factory(float), init=False)
+    last_beat = attrib(default=Factory(float), init=False, repr=False)
+    thread_id = attrib(default=Factory(NoneType), init=False, repr=False)
+    job = attrib(default=Factory(NoneType), init=False, repr=False)
+    thread = attrib(default=Factory(NoneType), init=False, repr=False)
+    stopping = attrib(default=Factory(Event), init=False, repr=False)
+    logger = attrib(
+        default=Factory(lambda: getLogger(__name__)), init=False, repr=False
+    )
+
+    def __attrs_post_init__(self):
+        self.stalls = deque(maxlen=self.game.lag_samples)
+
+    @property
+    def clock(self):
+        return self.game.scheduler.clock
+
+    def doing(self, kind, name, con=None):
+        """Return an Activity to use in a with statement around work done on
+        the reactor thread."""
+        return Activity(self, kind, name, con=con)
+
+    def start(self, thread=True):
+        """Start the heartbeat, and the watchdog thread if thread is True.
+        Must be called from the reactor thread."""
+        self.thread_id = get_ident()
+        self.last_beat = self.clock.seconds()
+        self.job = self.game.scheduler.call_every(
+            self.game.lag_interval, self.beat
+        )
+        if thread:
+            self.stopping.clear()
+            self.thread = Thread(
+                target=self.watch, name='Lag monitor', daemon=True
+            )
+            self.thread.start()
+
+    def stop(self):
+        """Stop monitoring."""
+        if self.job is not None:
+            self.job.cancel()
+            self.job = None
+        self.stopping.set()
+
+    def beat(self):
+        """Record a heartbeat on the reactor thread."""
+        now = self.clock.seconds()
+        self.lag = max(0.0, now - self.last_beat - self.game.lag_interval)
+        self.max_lag = max(self.max_lag, self.lag)
+        self.last_beat = now
+        stall = self.stall
+        if stall is not None:
+            self.stall = None
+            stall.duration = self.lag
+            stall.finished = True
+            self.logger.warning(
+                'The reactor stalled for %.3f seconds while running %s.',
+                stall.duration, ' < '.join(stall.activities) or 'nothing'
+            )
+
+    def watch(self):
+        """Check the heartbeat until stopped. Runs in the watchdog thread, so
+        errors are logged rather than allowed to end the thread."""
+        interval = self.game.lag_threshold / 2
+        while not self.stopping.wait(interval):
+            try:
+                self.check()
+            except Exception:
+                self.logger.exception('Checking for stalls failed.')
+
+    def check(self):
+        """Record a stall if the heartbeat is late enough."""
+        delay = self.clock.seconds() - self.last_beat - self.game.lag_interval
+        if delay < self.game.lag_threshold:
+            return
+        stall = self.stall
+        if stall is None:
+            activities = []
+            activity = self.current
+            while activity is not None:
+                activities.append(activity.describe())
+                activity = activity.previous
+            stall = Stall(
+                datetime.now(), delay, activities, self.sample()
+            )
+            self.stall = stall
+            self.stalls.append(stall)
+            self.count += 1
+        else:
+            stall.duration = delay
+
+    def sample(self):
+        """Return the reactor thread's stack as a list of strings."""
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return []
+        return format_stack(frame, limit=self.game.lag_stack_depth)
+
+    def clear(self):
+        """Forget recorded stalls."""
+        self.stalls.clear()
+        self.max_lag = 0.0
@@ -0,0 +1,446 @@
+"""Provides a load-testing tool, which connects simulated players to a game.
+
+A world with a grid of rooms and a few socials is started in its own process,
+listening on 127.0.0.1. Simulated players then connect over websockets,
+create accounts, disconnect, log back in, and spend the rest of the run
+walking around, talking and using socials.
+
+When the run finishes, command round trip times, frames received per second,
+and the world's reactor lag and memory use are reported.
+
+Usage: python -m mudmaker.loadtest [-n PLAYERS] [-d SECONDS] [options]"""
+
+import json
+import os
+import os.path
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter, SUPPRESS
+from logging import WARNING, getLogger
+from time import perf_counter, sleep, time
+
+from .util import percentile
+
+directions = ('n', 'e', 's', 'w')
+opposites = dict(n='s', e='w', s='n', w='e')
+offsets = dict(n=(0, 1), e=(1, 0), s=(0, -1), w=(-1, 0))
+socials = dict(
+    smile=('%1N smile%1s.', '%1N smile%1s happily.', '%1N smile%1s at %2n.'),
+    nod=('%1N nod%1s.', '%1N nod%1s thoughtfully.', '%1N nod%1s to %2n.'),
+    wave=('%1N wave%1s.', '%1N wave%1s wildly.', '%1N wave%1s at %2n.')
+)
+sayings = (
+    'Hello everyone.', 'Which way is the exit?', 'Nice weather today.',
+    'Has anyone seen my sword?', 'I think I am lost.'
+)
+
+
+def rss():
+    """Return the resident set size of this process in bytes, or None if it
+    cannot be found."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def build_world(game, size):
+    """Build a size by size grid of rooms joined by exits, and add some
+    socials. Returns the list of rooms."""
+    from .exits import Exit
+    from .rooms import Room
+    from .socials import Social
+    from .zones import Zone
+    zone = game.make_object('Zone', (Zone,), name='Load Test Zone')
+    grid = {}
+    for x in range(size):
+        for y in range(size):
+            grid[x, y] = game.make_object(
+                'Room', (Room,), name=f'Room {x}, {y}', zone=zone,
+                x=x, y=y
+            )
+    for (x, y), room in grid.items():
+        for direction in ('n', 'e'):
+            dx, dy = offsets[direction]
+            other = grid.get((x + dx, y + dy))
+            if other is None:
+                continue
+            game.make_object(
+                'Exit', (Exit,), location=room, destination=other,
+                direction_name=direction
+            )
+            game.make_object(
+                'Exit', (Exit,), location=other, destination=room,
+                direction_name=opposites[direction]
+            )
+    for name, (no_target, self_target, any_target) in socials.items():
+        game.make_object(
+            'Social', (Social,), name=name, no_target=no_target,
+            self_target=self_target, any_target=any_target
+        )
+    return list(grid.values())
+
+
+def run_world(args):
+    """Build and run a world, printing statistics as JSON when it stops."""
+    from twisted.internet import reactor
+    from twisted.internet.task import LoopingCall
+    from .game import Game
+    directory = args.directory
+    game = Game(
+        'Load Test', http_port=args.port, logger=getLogger('loadtest'),
+        filename=os.path.join(directory, 'world.yaml'),
+        static_path=os.path.join(directory, 'html'),
+        login_timeout=None, idle_timeout=None
+    )
+    game.logger.setLevel(WARNING)
+    game.account_store.filename = os.path.join(directory, 'accounts.json')
+    build_world(game, args.rooms)
+    lag = []
+    memory = dict(start=rss(), peak=rss())
+    last = [perf_counter()]
+
+    def probe():
+        now = perf_counter()
+        lag.append(max(0.0, now - last[0] - args.lag_interval))
+        last[0] = now
+        memory['peak'] = max(memory['peak'] or 0, rss() or 0)
+
+    def report():
+        lag.sort()
+        print(
+            json.dumps(
+                dict(
+                    lag=lag, memory_start=memory['start'], memory_end=rss(),
+                    memory_peak=memory['peak'],
+                    connections=len(game.connections)
+                )
+            ), flush=True
+        )
+
+    LoopingCall(probe).start(args.lag_interval, now=False)
+    reactor.addSystemEventTrigger('before', 'shutdown', report)
+    game.start_listening()
+    reactor.run()
+
+
+class Stats:
+    """Statistics gathered by the simulated players in one process."""
+
+    def __init__(self):
+        self.latencies = []
+        self.frames = 0
+        self.commands = 0
+        self.logins = 0
+        self.errors = 0
+        self.playing = 0
+
+
+def run_players(args, first, count, stats):
+    """Connect count simulated players, numbered from first, and run them
+    until args.duration seconds after the last one connected."""
+    from autobahn.twisted.websocket import (
+        WebSocketClientFactory, WebSocketClientProtocol, connectWS
+    )
+    from twisted.internet import reactor
+
+    url = f'ws://127.0.0.1:{args.port + 1}'
+    players = []
+
+    class SimulatedPlayer(WebSocketClientProtocol):
+        """A player who creates an account, then logs in and plays."""
+
+        def onOpen(self):
+            players.append(self)
+            self.sent = None
+            self.call = None
+            if self.factory.logging_in:
+                self.stage = 'login'
+                self.command(f'connect {self.factory.username} password')
+            else:
+                self.stage = 'create'
+                self.command(f'create {self.factory.username} password')
+
+        def command(self, text):
+            self.sent = perf_counter()
+            stats.commands += 1
+            self.sendMessage(text.encode())
+
+        def onMessage(self, payload, is_binary):
+            stats.frames += 1
+            data = json.loads(payload)
+            if data['name'] != 'message':
+                return
+            text = data['args'][0]
+            if self.sent is not None:
+                stats.latencies.append(perf_counter() - self.sent)
+                self.sent = None
+            if self.stage == 'create' and text.startswith('Enter a name'):
+                self.command(self.factory.name)
+            elif self.stage == 'create' and text.startswith('Welcome back'):
+                self.stage = 'quit'
+                self.command('quit')
+            elif self.stage == 'login' and text.startswith('Welcome back'):
+                stats.logins += 1
+                stats.playing += 1
+                self.stage = 'playing'
+                self.schedule()
+            elif text.startswith('Invalid username'):
+                stats.errors += 1
+
+        def schedule(self):
+            delay = random.uniform(0.5, 1.5) * args.think_time
+            self.call = reactor.callLater(delay, self.act)
+
+        def act(self):
+            choice = random.random()
+            if choice < 0.4:
+                self.command(random.choice(directions))
+            elif choice < 0.7:
+                self.command('say ' + random.choice(sayings))
+            elif choice < 0.9:
+                self.command(random.choice(list(socials)))
+            else:
+                other = random.randrange(args.players)
+                social = random.choice(list(socials))
+                self.command(f'{social} Player{other}')
+            self.schedule()
+
+        def stop(self):
+            if self.call is not None and self.call.active():
+                self.call.cancel()
+            self.sendClose()
+
+        def onClose(self, was_clean, code, reason):
+            if self.stage == 'quit':
+                # Account created, so log back in.
+                self.factory.logging_in = True
+                connectWS(self.factory)
+            elif self.stage == 'playing':
+                stats.playing -= 1
+                if self.call is not None and self.call.active():
+                    self.call.cancel()
+            elif self.stage != 'stopped':
+                stats.errors += 1
+            if self in players:
+                players.remove(self)
+
+    def connect(number):
+        factory = WebSocketClientFactory(url)
+        factory.protocol = SimulatedPlayer
+        factory.username = f'user{number}'
+        factory.name = f'Player{number}'
+        factory.logging_in = False
+        connectWS(factory)
+
+    def stop():
+        for player in list(players):
+            if player.stage == 'playing':
+                stats.playing -= 1
+            player.stage = 'stopped'
+            player.stop()
+        reactor.callLater(1, reactor.stop)
+
+    for number in range(first, first + count):
+        reactor.callLater(
+            (number - first) / args.ramp_rate, connect, number
+        )
+    started = time()
+    reactor.callLater(count / args.ramp_rate + args.duration, stop)
+    reactor.run()
+    return time() - started
+
+
+def run_client_process(args):
+    """Run some players, then print their statistics as JSON."""
+    stats = Stats()
+    elapsed = run_players(args, args.first, args.count, stats)
+    print(
+        json.dumps(
+            dict(
+                latencies=stats.latencies, frames=stats.frames,
+                commands=stats.commands, logins=stats.logins,
+                errors=stats.errors, elapsed=elapsed
+            )
+        ), flush=True
+    )
+
+
+def wait_for_port(port, timeout=30):
+    """Wait for something to start listening on 127.0.0.1:port."""
+    started = time()
+    while time() - started < timeout:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            return
+        except OSError:
+            sleep(0.1)
+    raise RuntimeError(f'Nothing is listening on port {port}.')
+
+
+def format_seconds(value):
+    if value is None:
+        return 'n/a'
+    return '%.1f ms' % (value * 1000)
+
+
+def format_bytes(value):
+    if value is None:
+        return 'n/a'
+    return '%.1f MB' % (value / 1024 / 1024)
+
+
+def world_command(args, directory):
+    """Return the command line which starts the world process."""
+    return [
+        sys.executable, '-m', 'mudmaker.loadtest', '--world',
+        '--directory', directory, '--port', str(args.port),
+        '--rooms', str(args.rooms), '--lag-interval', str(args.lag_interval)
+    ]
+
+
+def run(args):
+    """Start a world and some client processes, and print a report."""
+    with tempfile.TemporaryDirectory() as directory:
+        world = subprocess.Popen(
+            world_command(args, directory), stdout=subprocess.PIPE
+        )
+        try:
+            wait_for_port(args.port + 1)
+            per_process = -(-args.players // args.processes)
+            starts = range(0, args.players, per_process)
+            clients = []
+            for first in starts:
+                count = min(per_process, args.players - first)
+                clients.append(
+                    subprocess.Popen(
+                        [
+                            sys.executable, '-m', 'mudmaker.loadtest',
+                            '--first', str(first), '--count', str(count),
+                            '--ramp-rate', str(args.ramp_rate / len(starts)),
+                            '--players', str(args.players),
+                            '--port', str(args.port),
+                            '--duration', str(args.duration),
+                            '--think-time', str(args.think_time)
+                        ], stdout=subprocess.PIPE
+                    )
+                )
+            results = [json.loads(c.communicate()[0]) for c in clients]
+        finally:
+            world.send_signal(signal.SIGINT)
+            output = world.communicate()[0]
+    world_stats = json.loads(output.splitlines()[-1])
+    latencies = sorted(x for r in results for x in r['latencies'])
+    elapsed = max(r['elapsed'] for r in results)
+    lag = world_stats['lag']
+    print(f'Players: {args.players} ({args.processes} processes).')
+    print(
+        'Logged in: %d, errors: %d.' % (
+            sum(r['logins'] for r in results),
+            sum(r['errors'] for r in results)
+        )
+    )
+    print(
+        'Commands: %d (%.1f per second).' % (
+            sum(r['commands'] for r in results),
+            sum(r['commands'] for r in results) / elapsed
+        )
+    )
+    print(
+        'Frames received: %d (%.1f per second).' % (
+            sum(r['frames'] for r in results),
+            sum(r['frames'] for r in results) / elapsed
+        )
+    )
+    print(
+        'Round trip: p50 %s, p90 %s, p99 %s, max %s.' % tuple(
+            format_seconds(percentile(latencies, p)) for p in (50, 90, 99, 100)
+        )
+    )
+    print(
+        'Reactor lag: p50 %s, p99 %s, max %s.' % tuple(
+            format_seconds(percentile(lag, p)) for p in (50, 99, 100)
+        )
+    )
+    start = world_stats['memory_start']
+    end = world_stats['memory_end']
+    print(
+        'World memory: %s at start, %s at end, %s peak.' % (
+            format_bytes(start), format_bytes(end),
+            format_bytes(world_stats['memory_peak'])
+        )
+    )
+    if start is not None and end is not None:
+        print(
+            'Memory growth: %s (%.1f KB per player).' % (
+                format_bytes(end - start),
+                (end - start) / 1024 / args.players
+            )
+        )
+
+
+parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+
+parser.add_argument(
+    '-n', '--players', type=int, default=50, help='The number of simulated '
+    'players'
+)
+
+parser.add_argument(
+    '-d', '--duration', type=float, default=30, help='The number of seconds '
+    'to play for once every player has connected'
+)
+
+parser.add_argument(
+    '-t', '--think-time', type=float, default=1.0, help='The average number '
+    'of seconds between commands from each player'
+)
+
+parser.add_argument(
+    '-r', '--ramp-rate', type=float, default=20, help='The number of players '
+    'to connect per second'
+)
+
+parser.add_argument(
+    '-s', '--rooms', type=int, default=5, help='The width and height of the '
+    'grid of rooms'
+)
+
+parser.add_argument(
+    '-P', '--processes', type=int, default=1, help='The number of processes '
+    'to run players in'
+)
+
+parser.add_argument(
+    '-p', '--port', type=int, default=4900, help='The HTTP port for the '
+    'world. Websockets use the port after it'
+)
+
+parser.add_argument(
+    '--lag-interval', type=float, default=0.05, help='How often to measure '
+    'reactor lag in the world'
+)
+
+parser.add_argument('--world', action='store_true', help=SUPPRESS)
+parser.add_argument('--directory', help=SUPPRESS)
+parser.add_argument('--first', type=int, help=SUPPRESS)
+parser.add_argument('--count', type=int, help=SUPPRESS)
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if args.world:
+        run_world(args)
+    elif args.first is not None:
+        run_client_process(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
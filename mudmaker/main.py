@@ -2,10 +2,12 @@
 
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
+from attr import fields
+
 from mudmaker.game import Game
 
-interface = Game.__attrs_attrs__[0].default.factory()
-port = Game.__attrs_attrs__[1].default.factory()
+interface = fields(Game).interface.default.factory()
+port = fields(Game).http_port.default.factory()
 
 
 parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
@@ -19,11 +21,22 @@ parser.add_argument(
     'listen on'
 )
 
+parser.add_argument(
+    '-t', '--telnet-port', type=int, default=None, help='The port to listen '
+    'for telnet connections on'
+)
+
+parser.add_argument(
+    '-w', '--websocket-path', default=None, help='Accept websockets at this '
+    'path on the HTTP port, instead of on the port after it'
+)
+
 
 def main():
     args = parser.parse_args()
     game = Game(
-        'MudMaker Script', interface=args.interface, http_port=args.http_port
+        'MudMaker Script', interface=args.interface, http_port=args.http_port,
+        telnet_port=args.telnet_port, websocket_path=args.websocket_path
     )
     game.run()
 
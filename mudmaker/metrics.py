@@ -0,0 +1,221 @@
+"""Provides counters, histograms and callback metrics, and the GameMetrics
+registry which renders them in the Prometheus text exposition format."""
+
+from bisect import bisect_left
+
+from attr import attrs, attrib, Factory
+
+default_buckets = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+    2.5, 5.0, 10.0
+)
+
+
+def escape(value):
+    """Escape a label value."""
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def format_sample(name, labels, value):
+    """Return one line of exposition text."""
+    if labels:
+        name += '{%s}' % ','.join(
+            '%s="%s"' % (key, escape(data)) for key, data in labels.items()
+        )
+    if isinstance(value, float):
+        value = repr(value)
+    return f'{name} {value}'
+
+
+@attrs
+class Counter:
+    """A value which only goes up. Values are kept for each combination of
+    label values."""
+
+    kind = 'counter'
+
+    name = attrib()
+    help = attrib()
+    labels = attrib(default=Factory(tuple))
+    values = attrib(default=Factory(dict), init=False, repr=False)
+
+    def inc(self, amount=1, *label_values):
+        """Add amount to the counter for the given label values."""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        """Yield (name, labels, value) tuples."""
+        for label_values, value in self.values.items():
+            yield self.name, dict(zip(self.labels, label_values)), value
+
+
+@attrs
+class Histogram:
+    """Counts observations in buckets, for each combination of label
+    values."""
+
+    kind = 'histogram'
+
+    name = attrib()
+    help = attrib()
+    labels = attrib(default=Factory(tuple))
+    buckets = attrib(default=Factory(lambda: default_buckets))
+    values = attrib(default=Factory(dict), init=False, repr=False)
+
+    def observe(self, value, *label_values):
+        """Record value."""
+        try:
+            counts, total = self.values[label_values]
+        except KeyError:
+            counts = [0] * (len(self.buckets) + 1)
+            total = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.values[label_values] = (counts, total + value)
+
+    def samples(self):
+        """Yield (name, labels, value) tuples, with cumulative buckets."""
+        for label_values, (counts, total) in self.values.items():
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket', dict(labels, le=le), cumulative
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, cumulative
+
+
+@attrs
+class Callback:
+    """A metric whose samples are worked out when it is rendered. The func
+    should return an iterable of (suffix, labels, value) tuples."""
+
+    name = attrib()
+    help = attrib()
+    kind = attrib()
+    func = attrib(repr=False)
+
+    def samples(self):
+        for suffix, labels, value in self.func():
+            yield self.name + suffix, labels, value
+
+
+@attrs
+class Registry:
+    """A collection of metrics."""
+
+    metrics = attrib(default=Factory(list), repr=False)
+
+    def add(self, metric):
+        """Add a metric, and return it."""
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.add(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.add(Histogram(*args, **kwargs))
+
+    def callback(self, *args, **kwargs):
+        return self.add(Callback(*args, **kwargs))
+
+    def render(self):
+        """Return every metric in the text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for sample in metric.samples():
+                lines.append(format_sample(*sample))
+        return '\n'.join(lines) + '\n'
+
+
+@attrs
+class GameMetrics(Registry):
+    """The standard metrics for a game. Everything is either counted as it
+    happens, or read from structures the game already keeps, so rendering
+    never walks the world."""
+
+    game = attrib(default=None, repr=False)
+
+    def __attrs_post_init__(self):
+        self.commands = self.histogram(
+            'mudmaker_command_seconds', 'Time taken to handle commands',
+            labels=('command',)
+        )
+        self.bytes_sent = self.counter(
+            'mudmaker_bytes_sent_total', 'Bytes sent to clients, before any '
+            'compression'
+        )
+        self.frames_sent = self.counter(
+            'mudmaker_frames_sent_total', 'Frames sent to clients'
+        )
+        self.saves = self.histogram(
+            'mudmaker_save_seconds', 'Time taken to dump the game',
+            buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0)
+        )
+        self.reactor_lag = self.histogram(
+            'mudmaker_reactor_lag_seconds', 'How late scheduler ticks run'
+        )
+        self.callback(
+            'mudmaker_reactor_stalls_total', 'Times the reactor stalled for '
+            'longer than lag_threshold', 'counter', self.stall_samples
+        )
+        self.callback(
+            'mudmaker_connections', 'Open connections', 'gauge',
+            self.connection_samples
+        )
+        self.callback(
+            'mudmaker_objects', 'Database objects by kind', 'gauge',
+            self.object_samples
+        )
+        self.callback(
+            'mudmaker_task_duration_seconds', 'Task run times', 'summary',
+            self.task_samples
+        )
+        self.callback(
+            'mudmaker_task_lateness_seconds', 'How late tasks last ran',
+            'gauge', self.task_lateness_samples
+        )
+        self.callback(
+            'mudmaker_task_failures_total', 'Failed task runs', 'counter',
+            self.task_failure_samples
+        )
+
+    def stall_samples(self):
+        yield '', {}, self.game.lag_monitor.count
+
+    def connection_samples(self):
+        connections = self.game.connections
+        players = sum(1 for con in connections if con.object is not None)
+        yield '', dict(state='all'), len(connections)
+        yield '', dict(state='logged_in'), players
+
+    def object_samples(self):
+        game = self.game
+        yield '', dict(kind='all'), len(game._objects)
+        for kind in ('zones', 'rooms', 'objects', 'exits', 'socials'):
+            yield '', dict(kind=kind), len(getattr(game, kind))
+
+    def task_samples(self):
+        for task in self.game.tasks.values():
+            stats = task.stats()
+            labels = dict(task=task.name, id=task.id)
+            for quantile in ('p50', 'p99'):
+                if stats[quantile] is not None:
+                    yield '', dict(
+                        labels, quantile='0.%s' % quantile[1:]
+                    ), stats[quantile]
+            yield '_sum', labels, task.total_duration
+            yield '_count', labels, task.runs
+
+    def task_lateness_samples(self):
+        for task in self.game.tasks.values():
+            yield '', dict(task=task.name, id=task.id), task.lateness
+
+    def task_failure_samples(self):
+        for task in self.game.tasks.values():
+            yield '', dict(task=task.name, id=task.id), task.failures
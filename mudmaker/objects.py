@@ -1,5 +1,8 @@
 """Provides the Object class."""
 
+from collections import deque
+from time import time
+
 from .attributes import Attribute
 from .base import BaseObject, LocationMixin
 from .exc import NoSuchObjectError
@@ -31,6 +34,12 @@ class Object(BaseObject, LocationMixin):
         instance.game.objects[instance.id] = instance
         instance.connection = None
         instance.parser = None
+        instance.resume_nonce = None
+        instance.resume_issued = None
+        instance.disconnected = None
+        instance.output_buffer = deque(
+            maxlen=instance.game.resume_buffer_size
+        )
 
     @classmethod
     def on_delete(cls, instance):
@@ -52,10 +61,18 @@ class Object(BaseObject, LocationMixin):
             pass  # return None.
 
     def message(self, text):
-        """Send some text to this object's connection."""
+        """Send some text to this object's connection. If this object has
+        lost its connection, but its resume token is still valid, the text is
+        buffered so it can be replayed later."""
         if self.connection is not None:
             self.connection.message(text)
             return True
+        elif self.resume_nonce is not None:
+            if time() - self.resume_issued > self.game.resume_ttl:
+                self.resume_nonce = None
+                self.output_buffer.clear()
+            else:
+                self.output_buffer.append(text)
         return False
 
     def look_here(self):
@@ -142,6 +159,7 @@ class Object(BaseObject, LocationMixin):
         for i, obj in enumerate(perspectives):
             obj.message(strings[i])
         objects = getattr(self.location, 'contents', [])
+        perspectives = set(perspectives)
         for obj in objects:
             if obj not in perspectives:
                 obj.message(strings[-1])
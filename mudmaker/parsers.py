@@ -1,30 +1,231 @@
 """Provides the two main command parsers: login_parser, and main_parser."""
 
+from collections import ChainMap
 from datetime import datetime
-from functools import partial
+from itertools import chain
 from time import time
 
 from commandlet import Parser, command
+from commandlet.exc import ConvertionError, CommandFailedError
+from .context import Context
 from .exc import AuthenticationError, DontSaveCommand
 from .objects import Object
 from .util import get_login, english_list
 
+regexp_special = set('.^$*+?{}[]|()')
+
+
+def index_key(usage):
+    """Return the key which a command with the given usage should be indexed
+    under: ('word', first_word) if the first word of the usage is literal,
+    ('char', first_character) if the usage starts with literal text joined to
+    an argument (like "!<string>"), or None if the command must be tried
+    against every string."""
+    prefix = []
+    escaped = False
+    for char in usage:
+        if escaped:
+            if char.isascii() and char.isalnum():
+                # Escaped letters and digits are classes like \d and \w,
+                # anchors like \b, or backreferences, not literal text.
+                return None
+            prefix.append(char)
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '<':
+            break
+        elif char in regexp_special:
+            return None
+        else:
+            prefix.append(char)
+    else:
+        # There are no arguments, so the whole usage is literal.
+        return ('word', ''.join(prefix).split(' ', 1)[0])
+    prefix = ''.join(prefix)
+    if not prefix:
+        return None
+    elif ' ' in prefix:
+        return ('word', prefix.split(' ', 1)[0])
+    return ('char', prefix[0])
+
 
 class MudMakerParser(Parser):
-    """A parser with extra socials."""
+    """A parser which only tries commands that could possibly match, and
+    which falls back to the game's socials.
+
+    Commands are indexed by the first word of their usage, or by its first
+    character if the first word runs into an argument (like "!<string>").
+    Commands whose usage starts with an argument, or with regular expression
+    syntax, are tried against every string. Matching candidates are still
+    tried in the order they were added, so results are the same as with a
+    plain Parser. The index is rebuilt whenever the commands list is replaced
+    or changes length.
+
+    If no command matches, and the first word is the name of a social in the
+    game's socials dictionary, that social is used instead. Anything after the
+    name is matched with the object filter to find the target.
+
+    Parsers can be layered with self.layer: a layer has its own commands, but
+    also sees every command (and filter) of the parser it was made from, so
+    commands added to a lower layer are visible to the layers above it
+    straight away."""
+
+    parent = None
+    _index = None
+    _indexed = None
+    _help = None
+    _helped = None
+
+    def layer(self):
+        """Return a new parser on top of this one."""
+        p = type(self)(filters=ChainMap({}, self.filters))
+        p.parent = self
+        return p
+
+    @property
+    def layers(self):
+        """The parsers this one is made from, lowest first, ending with this
+        one."""
+        layers = [self]
+        while layers[0].parent is not None:
+            layers.insert(0, layers[0].parent)
+        return layers
+
+    @property
+    def all_commands(self):
+        """Every command from every layer, in the order they will be
+        tried."""
+        return list(chain.from_iterable(p.commands for p in self.layers))
+
+    def commands_version(self):
+        """Return a value which changes whenever the commands of any layer are
+        replaced or change length."""
+        return tuple(
+            (id(p.commands), len(p.commands)) for p in self.layers
+        )
 
-    def social(self, social):
-        """Add a social to this parser."""
-        name = social.name
-        p = partial(social.use_nothing)
-        p.__doc__ = name + '.'
-        self.command(name)(p)
-        p = partial(social.use_target)
-        p.__doc__ = social.description
-        self.command(f'{name} <object:target>')(p)
+    def build_index(self):
+        """Build the dispatch index for self.all_commands."""
+        words = {}
+        chars = {}
+        fallback = []
+        commands = self.all_commands
+        for position, cmd in enumerate(commands):
+            entry = (position, cmd, self.context_keys(cmd))
+            key = index_key(cmd.usage)
+            if key is None:
+                fallback.append(entry)
+            elif key[0] == 'word':
+                words.setdefault(key[1], []).append(entry)
+            else:
+                chars.setdefault(key[1], []).append(entry)
+        # Keep the indexed commands, so their ids cannot be reused.
+        self._index = (words, chars, fallback, commands)
+        self._indexed = self.commands_version()
+
+    def get_entries(self, string):
+        """Return (position, command, context_keys) tuples for the commands
+        which might match string, in the order they should be tried."""
+        if self._indexed != self.commands_version():
+            self.build_index()
+        words, chars, fallback, commands = self._index
+        candidates = sorted(
+            chain(
+                words.get(string.split(' ', 1)[0], ()),
+                chars.get(string[:1], ()), fallback
+            ), key=lambda entry: entry[0]
+        )
+        return candidates
+
+    def get_candidates(self, string):
+        """Return the commands which might match string, in the order they
+        should be tried."""
+        return [entry[1] for entry in self.get_entries(string)]
+
+    def context_keys(self, cmd):
+        """Return the names of the context values which cmd, or the filters
+        of its arguments, ask for."""
+        names = set(cmd.func.args)
+        for arg in cmd.args:
+            names.update(arg.filter.args)
+        names.difference_update(arg.name for arg in cmd.args)
+        names.discard('text')
+        return tuple(names)
+
+    def handle_command(self, string, **context):
+        """Handle a command with the specified context."""
+        return self.dispatch(string, context)
+
+    def dispatch(self, string, context):
+        """Handle a command, only trying commands from self.get_entries.
+        Only the values each command asks for are taken from context, so it can
+        be a mapping which works values out lazily."""
+        exc = CommandFailedError()
+        for position, cmd, keys in self.get_entries(string):
+            m = cmd.regexp.match(string)
+            if m is None:
+                continue
+            ctx = {name: context[name] for name in keys if name in context}
+            ctx.update(m.groupdict())
+            if isinstance(context, Context):
+                context.matched = cmd.name
+            try:
+                return cmd.call(**ctx)
+            except ConvertionError:
+                exc.tried_commands.append(cmd)
+        game = context.get('game')
+        player = context.get('player')
+        if game is not None and player is not None:
+            name, _, target = string.partition(' ')
+            social = game.socials.get(name)
+            if social is not None:
+                if isinstance(context, Context):
+                    context.matched = 'social'
+                return self.use_social(social, target, context)
+        raise exc
+
+    def get_help(self, game=None):
+        """Return the lines of help text for every command this parser knows
+        about. The text is only rendered again when commands change. If game
+        is given and has socials, they are listed on the end, since they are
+        not commands."""
+        version = self.commands_version()
+        if self._helped != version:
+            commands = {}
+            for cmd in sorted(self.all_commands, key=lambda cmd: cmd.name):
+                if cmd.name not in commands:
+                    commands[cmd.name] = [
+                        cmd.func.func.__doc__ or 'No description available.'
+                    ]
+                commands[cmd.name].append(cmd.usage)
+            lines = []
+            for name, values in commands.items():
+                lines.append('%s:' % name)
+                formats = [x.replace('\\', '') for x in values[1:]]
+                lines.append(', '.join(formats) + '.')
+                lines.append(values[0])
+            self._help = lines
+            self._helped = version
+        if game is not None and game.socials:
+            return self._help + [
+                'Socials:', '%s.' % english_list(sorted(game.socials))
+            ]
+        return self._help
 
+    def use_social(self, social, target, context):
+        """Use social as context['player'], matching target with the object
+        filter if it is not empty."""
+        player = context['player']
+        if not target:
+            return social.use_nothing(player)
+        f = self.filters['object']
+        ctx = {name: context[name] for name in f.args if name in context}
+        ctx['text'] = target
+        return social.use_target(player, f.call(**ctx))
 
-login_parser = Parser()
+
+login_parser = MudMakerParser()
 
 
 @login_parser.command(
@@ -98,21 +299,11 @@ def do_hostname(con, host):
 
 
 @command([login_parser, main_parser], 'help', 'help', '@commands', r'\?')
-def do_help(con, parser):
+def do_help(con, parser, game):
     """Get a list of possible commands."""
     con.message('Commands available to you:')
-    commands = {}
-    for cmd in sorted(parser.commands, key=lambda cmd: cmd.name):
-        if cmd.name not in commands:
-            commands[cmd.name] = [
-                cmd.func.func.__doc__ or 'No description available.'
-            ]
-        commands[cmd.name].append(cmd.usage)
-    for name, values in commands.items():
-        con.message('%s:' % name)
-        formats = [x.replace('\\', '') for x in values[1:]]
-        con.message(', '.join(formats) + '.')
-        con.message(values[0])
+    for line in parser.get_help(game=game):
+        con.message(line)
 
 
 @command([login_parser, main_parser], 'uptime', '@uptime')
@@ -126,6 +317,9 @@ def do_uptime(game, con):
 @command([login_parser, main_parser], 'quit', 'quit', '@quit')
 def do_quit(con):
     """Quit the game."""
+    if con.object is not None:
+        con.object.resume_nonce = None
+    con.send('resumeToken', '')
     con.disconnect('Goodbye.')
 
 
@@ -160,6 +354,18 @@ def do_login(game, con, username, password=None):
         con.set_prompt_text(prompt)
 
 
+@login_parser.command('resume', '@resume <word:token>')
+def do_resume(game, con, token):
+    """Resume a session after reconnecting."""
+    player = game.check_resume_token(token)
+    if player is None:
+        con.message('Your session could not be resumed. Please log in.')
+        con.send('resumeToken', '')
+    else:
+        con.logger.info('Resuming session of %s.', player)
+        game.finish_login(con, player)
+
+
 @main_parser.command('look', 'look <object:thing>', 'l', 'l <object:thing>')
 def look(player, location, thing=False):
     """Look around, or at something in this room."""
@@ -0,0 +1,74 @@
+"""Provides the ProfileWindow class, which profiles the reactor thread for a
+number of seconds."""
+
+import os
+import os.path
+from cProfile import Profile
+from datetime import datetime
+from pstats import Stats
+
+from attr import attrs, attrib, Factory
+
+NoneType = type(None)
+
+
+def format_function(key):
+    """Return a short name for a pstats function key."""
+    filename, line, name = key
+    if filename == '~':
+        return name  # A builtin.
+    return '%s:%d %s' % (os.path.basename(filename), line, name)
+
+
+@attrs
+class ProfileWindow:
+    """Profiles the reactor thread with cProfile for seconds seconds, then
+    writes a .pstats file to game.profile_path, and calls callback with this
+    object.
+
+    The profiler is only enabled while a window is open, so there is no
+    profiling overhead the rest of the time."""
+
+    game = attrib()
+    seconds = attrib()
+    callback = attrib(repr=False)
+    profile = attrib(default=Factory(Profile), init=False, repr=False)
+    started = attrib(default=Factory(datetime.now), init=False)
+    filename = attrib(default=Factory(NoneType), init=False)
+    stats = attrib(default=Factory(NoneType), init=False, repr=False)
+    job = attrib(default=Factory(NoneType), init=False, repr=False)
+
+    def start(self):
+        """Start profiling."""
+        self.game.profile_window = self
+        self.profile.enable()
+        self.job = self.game.scheduler.call_later(self.seconds, self.finish)
+
+    def finish(self):
+        """Stop profiling, save the results, and call self.callback."""
+        self.profile.disable()
+        self.game.profile_window = None
+        path = self.game.profile_path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.filename = os.path.join(
+            path, self.started.strftime('profile-%Y%m%d-%H%M%S.pstats')
+        )
+        self.profile.dump_stats(self.filename)
+        self.stats = Stats(self.profile)
+        self.callback(self)
+
+    def top(self, sort, count):
+        """Return a list of (function, calls, internal, cumulative) tuples
+        for the count functions with the highest sort time, which should be
+        either "cumulative" or "internal"."""
+        index = dict(internal=2, cumulative=3)[sort]
+        rows = sorted(
+            self.stats.stats.items(), key=lambda item: item[1][index],
+            reverse=True
+        )
+        return [
+            (format_function(key), calls, internal, cumulative) for (
+                key, (primitive, calls, internal, cumulative, callers)
+            ) in rows[:count]
+        ]
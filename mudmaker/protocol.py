@@ -0,0 +1,65 @@
+"""Provides the compact binary protocol which clients can negotiate instead of
+JSON.
+
+Each frame starts with a single opcode byte, followed by the arguments as
+UTF-8 strings, each prefixed by its length as a big-endian unsigned 32-bit
+integer. Commands which have no opcode of their own, or which have arguments
+that are not strings, are sent with the json opcode, whose only argument is
+the JSON object that would have been sent otherwise."""
+
+from json import dumps, loads
+from struct import Struct
+
+from .exc import ProtocolError
+
+json_protocol = 'mudmaker.json'
+binary_protocol = 'mudmaker.binary'
+
+opcodes = dict(
+    json=0, message=1, inputType=2, promptText=3, title=4, status=5, ping=6,
+    inputText=7, resumeToken=8
+)
+names = {opcode: name for name, opcode in opcodes.items()}
+length = Struct('>I')
+
+
+def encode_frame(name, *args):
+    """Return name and args as a binary frame."""
+    opcode = opcodes.get(name, 0)
+    if not opcode or not all(isinstance(arg, str) for arg in args):
+        opcode = 0
+        args = [dumps(dict(name=name, args=args))]
+    parts = [bytes((opcode,))]
+    for arg in args:
+        data = arg.encode()
+        parts.append(length.pack(len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+def decode_frame(data):
+    """Return a tuple of (name, args) decoded from a binary frame. If the
+    frame is malformed, ProtocolError will be raised."""
+    if not data:
+        raise ProtocolError('Empty frame.')
+    opcode = data[0]
+    if opcode not in names:
+        raise ProtocolError('Invalid opcode: %d.' % opcode)
+    args = []
+    pos = 1
+    end = len(data)
+    while pos < end:
+        if pos + length.size > end:
+            raise ProtocolError('Truncated length at offset %d.' % pos)
+        (size,) = length.unpack_from(data, pos)
+        pos += length.size
+        if pos + size > end:
+            raise ProtocolError('Truncated argument at offset %d.' % pos)
+        args.append(data[pos:pos + size].decode())
+        pos += size
+    if opcode:
+        return names[opcode], args
+    if len(args) != 1:
+        raise ProtocolError('JSON frames must have exactly one argument.')
+    data = loads(args[0])
+    return data['name'], data['args']
@@ -0,0 +1,46 @@
+"""Provides the TokenBucket class, used to rate limit input from clients."""
+
+from time import monotonic
+
+from attr import attrs, attrib, Factory
+
+
+@attrs
+class TokenBucket:
+    """A bucket holding up to burst tokens, which refills at rate tokens per
+    second. Every command costs one token."""
+
+    rate = attrib()
+    burst = attrib()
+    tokens = attrib(default=Factory(float), init=False)
+    stamp = attrib(default=Factory(monotonic), init=False, repr=False)
+    allowed = attrib(default=Factory(int), init=False)
+    limited = attrib(default=Factory(int), init=False)
+
+    def __attrs_post_init__(self):
+        self.tokens = float(self.burst)
+
+    def refill(self, now=None):
+        """Add the tokens which have accumulated since the last refill."""
+        if now is None:
+            now = monotonic()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.stamp) * self.rate
+        )
+        self.stamp = now
+
+    def available(self, now=None):
+        """Return True if there is a token to take."""
+        self.refill(now=now)
+        return self.tokens >= 1
+
+    def take(self):
+        """Take a token, which must be available."""
+        self.tokens -= 1
+        self.allowed += 1
+
+    def delay(self):
+        """Return the number of seconds until a token will be available."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
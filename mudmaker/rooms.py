@@ -21,10 +21,37 @@ class Room(BaseObject):
     def message_all_but(self, objects, text):
         """Message everyone in this room with text, apart from those in the
         objects list."""
+        objects = set(objects)
         for obj in self.contents:
             if obj not in objects:
                 obj.message(text)
 
+    def deliver_socials(self, socials):
+        """Deliver a batch of socials to everyone in this room. The socials
+        argument should be a list of (string, perspectives) pairs.
+
+        Each string is rendered once. Objects in this room which are in the
+        perspectives list get their own version, and everyone else in this
+        room gets the version for observers. Perspectives which are not in this
+        room get nothing. The contents of this room are only worked out once,
+        and everyone gets their messages in the order the socials were
+        given."""
+        contents = self.contents
+        if not contents:
+            return
+        get_strings = self.game.socials_factory.get_strings
+        outbox = {obj: [] for obj in contents}
+        for string, perspectives in socials:
+            strings = get_strings(string, perspectives)
+            observed = strings[-1]
+            positions = {obj: i for i, obj in enumerate(perspectives)}
+            for obj, texts in outbox.items():
+                i = positions.get(obj)
+                texts.append(observed if i is None else strings[i])
+        for obj, texts in outbox.items():
+            for text in texts:
+                obj.message(text)
+
     @property
     def contents(self):
         return [o for o in self.game.objects.values() if o.location is self]
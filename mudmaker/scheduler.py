@@ -0,0 +1,237 @@
+"""Provides the Scheduler class, a hierarchical timer wheel which runs
+periodic and one-shot jobs from a single reactor callback."""
+
+from logging import getLogger
+
+from attr import attrs, attrib, Factory
+
+NoneType = type(None)
+
+
+@attrs
+class Job:
+    """A job held by a Scheduler. The job is next due to run on tick due, and
+    if interval is not None it runs every interval ticks after that."""
+
+    scheduler = attrib(repr=False)
+    id = attrib()
+    func = attrib()
+    due = attrib()
+    interval = attrib(default=Factory(NoneType))
+    stopped = attrib(default=Factory(bool), init=False)
+    skipped = attrib(default=Factory(int), init=False)
+    slot = attrib(default=Factory(NoneType), init=False, repr=False)
+
+    @property
+    def active(self):
+        """Whether or not this job will run again."""
+        return not self.stopped
+
+    def cancel(self):
+        """Stop this job from running again."""
+        self.scheduler.cancel(self)
+
+
+@attrs
+class Scheduler:
+    """A hierarchical timer wheel, with levels wheels of 2 ** bits slots each.
+    Time is measured in ticks of resolution seconds.
+
+    A job due within 2 ** bits ticks sits in a slot of the first wheel, one
+    due within 2 ** (bits * 2) ticks sits in the second wheel, and so on.
+    Whenever a lower wheel comes round to its first slot, the next slot of the
+    wheel above it is emptied and its jobs placed again, closer to the bottom.
+    Jobs due even later wait in self.overflow. Slots are dictionaries keyed by
+    job id, so adding and cancelling jobs takes constant time.
+
+    Only one call is ever scheduled with clock (the reactor unless otherwise
+    specified), and none at all while there are no jobs. How late that call
+    runs is stored in self.lag, and passed to observe_lag if it is not
+    None."""
+
+    resolution = attrib(default=Factory(lambda: 0.1))
+    clock = attrib(default=Factory(NoneType), repr=False)
+    bits = attrib(default=Factory(lambda: 8))
+    levels = attrib(default=Factory(lambda: 4))
+    wheels = attrib(default=Factory(list), init=False, repr=False)
+    overflow = attrib(default=Factory(dict), init=False, repr=False)
+    tick = attrib(default=Factory(int), init=False)
+    target = attrib(default=Factory(int), init=False, repr=False)
+    pending = attrib(default=Factory(int), init=False)
+    max_id = attrib(default=Factory(int), init=False)
+    started = attrib(default=Factory(float), init=False, repr=False)
+    call = attrib(default=Factory(NoneType), init=False, repr=False)
+    advancing = attrib(default=Factory(bool), init=False, repr=False)
+    call_due = attrib(default=Factory(float), init=False, repr=False)
+    lag = attrib(default=Factory(float), init=False)
+    observe_lag = attrib(default=Factory(NoneType), repr=False)
+    logger = attrib(
+        default=Factory(lambda: getLogger(__name__)), init=False, repr=False
+    )
+
+    def __attrs_post_init__(self):
+        if self.clock is None:
+            from twisted.internet import reactor
+            self.clock = reactor
+        self.wheels = [
+            [{} for i in range(1 << self.bits)] for level in range(self.levels)
+        ]
+        self.started = self.clock.seconds()
+
+    def new_id(self):
+        """Return a new job id."""
+        self.max_id += 1
+        return self.max_id
+
+    def ticks(self, seconds):
+        """Convert seconds to a number of ticks, which is never less than
+        1."""
+        return max(1, round(seconds / self.resolution))
+
+    def current_tick(self):
+        """Return the tick the clock says it is."""
+        return int(
+            (self.clock.seconds() - self.started) / self.resolution + 1e-6
+        )
+
+    def due_time(self, job):
+        """Return the time, according to self.clock, when job is due."""
+        return self.started + job.due * self.resolution
+
+    def idle(self):
+        """Return True if nothing is scheduled with the clock, in which case
+        self.tick is brought up to date first."""
+        if self.call is not None or self.advancing:
+            return False
+        self.tick = max(self.tick, self.current_tick())
+        return True
+
+    def call_later(self, delay, func, id=None):
+        """Run func once, after delay seconds."""
+        if id is None:
+            id = self.new_id()
+        self.idle()
+        job = Job(self, id, func, self.tick + self.ticks(delay))
+        self.add(job)
+        return job
+
+    def call_every(self, interval, func, delay=None, id=None):
+        """Run func every interval seconds. The first run is after delay
+        seconds, or after interval seconds if delay is None."""
+        if id is None:
+            id = self.new_id()
+        if delay is None:
+            delay = interval
+        self.idle()
+        job = Job(
+            self, id, func, self.tick + self.ticks(delay),
+            interval=self.ticks(interval)
+        )
+        self.add(job)
+        return job
+
+    def add(self, job):
+        """Add a job. Jobs which are already due will run on the next
+        tick."""
+        idle = self.idle()
+        job.due = max(job.due, self.tick + 1)
+        job.stopped = False
+        self.place(job)
+        self.pending += 1
+        if idle:
+            self.schedule_call()
+
+    def place(self, job):
+        """Put job in the right slot for its due tick."""
+        delta = job.due - self.tick
+        for level, wheel in enumerate(self.wheels):
+            if delta < 1 << (self.bits * (level + 1)):
+                slot = wheel[(job.due >> (self.bits * level)) & (
+                    len(wheel) - 1
+                )]
+                break
+        else:
+            slot = self.overflow
+        slot[job.id] = job
+        job.slot = slot
+
+    def cancel(self, job):
+        """Cancel a job."""
+        job.stopped = True
+        if job.slot is not None:
+            del job.slot[job.id]
+            job.slot = None
+            self.pending -= 1
+
+    def cascade(self, slot):
+        """Place every job in slot again."""
+        for job in slot.values():
+            self.place(job)
+
+    def advance(self):
+        """Move on by one tick, and run every job which is due."""
+        self.tick += 1
+        tick = self.tick
+        mask = (1 << self.bits) - 1
+        if not tick & ((1 << (self.bits * self.levels)) - 1):
+            overflow = self.overflow
+            self.overflow = {}
+            self.cascade(overflow)
+        for level in range(self.levels - 1, 0, -1):
+            if not tick & ((1 << (self.bits * level)) - 1):
+                wheel = self.wheels[level]
+                index = (tick >> (self.bits * level)) & mask
+                slot = wheel[index]
+                wheel[index] = {}
+                self.cascade(slot)
+        index = tick & mask
+        slot = self.wheels[0][index]
+        self.wheels[0][index] = {}
+        for job in list(slot.values()):
+            if job.slot is not slot:
+                continue  # Cancelled by a job which has already run.
+            job.slot = None
+            self.pending -= 1
+            self.run(job)
+
+    def run(self, job):
+        """Run a job which is due, and add it again if it is periodic. Runs of
+        a periodic job which were missed because the reactor was busy are
+        skipped, like twisted.internet.task.LoopingCall does. Jobs which raise
+        an exception are logged and cancelled."""
+        if job.interval is None:
+            job.stopped = True
+        try:
+            job.func()
+        except Exception:
+            self.logger.exception('Job #%d failed.', job.id)
+            job.stopped = True
+        if not job.stopped and job.slot is None:
+            job.due += job.interval
+            if job.due <= self.target:
+                missed = (self.target - job.due) // job.interval + 1
+                job.due += missed * job.interval
+                job.skipped += missed
+            self.add(job)
+
+    def schedule_call(self):
+        """Schedule a call to self.on_tick for the start of the next tick."""
+        self.call_due = self.started + (self.tick + 1) * self.resolution
+        delay = self.call_due - self.clock.seconds()
+        self.call = self.clock.callLater(max(0, delay), self.on_tick)
+
+    def on_tick(self):
+        """Catch up with the clock, running any jobs which are due."""
+        self.call = None
+        self.lag = max(0.0, self.clock.seconds() - self.call_due)
+        if self.observe_lag is not None:
+            self.observe_lag(self.lag)
+        self.target = self.current_tick()
+        self.advancing = True
+        try:
+            while self.tick < self.target and self.pending:
+                self.advance()
+        finally:
+            self.advancing = False
+        if self.pending:
+            self.schedule_call()
@@ -0,0 +1,472 @@
+"""Provides the Session class, which contains the command handling logic
+shared by every kind of connection."""
+
+from abc import ABC, abstractmethod
+from collections import deque
+from inspect import isgenerator
+from logging import getLogger
+from time import perf_counter, time
+
+from attr import attrs, attrib, Factory
+from commandlet.exc import CommandFailedError
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from zope.interface import implementer
+
+from .context import Context
+from .exc import DontSaveCommand
+from .parsers import login_parser
+from .ratelimit import TokenBucket
+from .util import format_error, pluralise
+
+outbound_policies = ('disconnect', 'drop', 'summarise')
+
+
+@attrs
+class InputType:
+    """Stores the input type along with a timestamp representing when the last
+    change was made."""
+
+    type = attrib()
+    stamp = attrib(default=Factory(time))
+
+
+@implementer(IPushProducer)
+class Session(ABC):
+    """A connected client, regardless of the protocol it speaks.
+
+    Subclasses must also inherit from a twisted protocol whose factory has a
+    game attribute, call self.open_session once the client is ready, and
+    self.close_session when the connection is lost. They must implement the
+    abstract encode, transmit, disconnect and abort methods, or they cannot
+    be instantiated.
+
+    Sessions register themselves as streaming producers with their transport.
+    While the transport is paused because the client is not reading fast
+    enough, outgoing frames are queued, and once the queue passes the game's
+    outbound_max_messages or outbound_max_bytes limits, the game's
+    outbound_policy decides what happens to any more frames.
+
+    Subclasses which can check that the client is still there should override
+    the keepalive method, and call self.keepalive_received when the client
+    answers.
+
+    Input from the network should be passed to self.receive_string, which
+    applies the game's rate limits before calling self.handle_string."""
+
+    low_priority = ('message',)
+    game = None
+
+    def open_session(self, host, port):
+        """Initialise this session, and add it to the game's connections."""
+        self.last_command = None
+        self.command_result = None
+        self.game = self.factory.game
+        self.game.connections.append(self)
+        self.parser = login_parser
+        self.ping_time = None
+        self.last_active = time()
+        self.last_seen = self.last_active
+        self.keepalive_sent = None
+        self.rtt = None
+        self.object = None
+        self.input_type = InputType('text')
+        self.status = None
+        self.title = None
+        self.prompt_text = None
+        self.send_time = 0.0
+        self.paused = False
+        self.outbound = deque()
+        self.outbound_bytes = 0
+        self.suppressed = 0
+        self.total_suppressed = 0
+        self.buckets = {}
+        self.input_queue = deque()
+        self.input_call = None
+        self.rate_limited = dict.fromkeys(self.game.rate_limits, 0)
+        self.transport.registerProducer(self, True)
+        self.host = host
+        self.port = port
+        self.logger = getLogger(f'{self.host}:{self.port}')
+        self.logger.info('Connected.')
+        self.set_title(self.game.name)
+        self.set_prompt_text('Login Command')
+        self.message(self.game.welcome_msg)
+
+    def close_session(self, reason):
+        """Remove this session from the game, and detach it from its object.
+        The reason argument should be a twisted Failure instance."""
+        self.logger.info(reason.getErrorMessage())
+        self.outbound.clear()
+        self.outbound_bytes = 0
+        self.input_queue.clear()
+        if self.input_call is not None and self.input_call.active():
+            self.input_call.cancel()
+        if self in self.game.connections:
+            self.game.connections.remove(self)
+        if self.object is not None:
+            self.object.connection = None
+            self.object.disconnected = time()
+
+    @abstractmethod
+    def disconnect(self, text=None):
+        """Close this connection, sending text as reason."""
+
+    @abstractmethod
+    def abort(self):
+        """Drop this connection immediately."""
+
+    @abstractmethod
+    def encode(self, name, *args):
+        """Return name and args encoded as bytes ready to be passed to
+        self.transmit, or None if there is nothing to send."""
+
+    @abstractmethod
+    def transmit(self, payload):
+        """Write an encoded payload to the client."""
+
+    def keepalive(self):
+        """Ask the client to prove it is still there, returning True if a
+        request was sent. By default, keepalives are not supported."""
+        return False
+
+    def keepalive_received(self):
+        """The client has answered a keepalive, or has otherwise shown it is
+        still connected."""
+        now = time()
+        if self.keepalive_sent is not None:
+            self.rtt = now - self.keepalive_sent
+            self.keepalive_sent = None
+        self.last_seen = now
+
+    def send_status(self):
+        """Send the attached object's status HTML."""
+        html = '<p>Not yet implemented.</p>'
+        if html != self.status:
+            self.status = html
+            self.send('status', html)
+
+    def set_input_type(self, t='text'):
+        """Set the input type. Valid options are anything that can be recognised
+        by the type attribute of the html input tag."""
+        if t != self.input_type.type:
+            if t == 'password':
+                self.set_prompt_text('Password')
+            self.send('inputType', t)
+        self.input_type = InputType(t)
+
+    def set_input_text(self, t):
+        """Set the input text to t."""
+        self.send('inputText', t)
+
+    def get_password(self, message):
+        """Tell the client to hide input, and send the message to the user.
+        Next time input is received, tell the client to unhide the input."""
+        self.set_input_type('password')
+        self.message(message)
+
+    def set_prompt_text(self, p):
+        """Tell the client to use p as the new prompt text."""
+        if p != self.prompt_text:
+            self.prompt_text = p
+            self.send('promptText', p)
+
+    def set_title(self, t):
+        """Tell the client to set the title to t."""
+        if self.title != t:
+            self.title = t
+            self.send('title', t)
+
+    def get_context(self, **kwargs):
+        """Get a context to be sent to self.parser. Values are only worked
+        out when a command asks for them."""
+        return Context(self, **kwargs)
+
+    def dispatch(self, parser, string, context):
+        """Have parser handle string. Parsers which cannot take a lazy
+        context are given a dictionary of every value."""
+        dispatch = getattr(parser, 'dispatch', None)
+        if dispatch is None:
+            return parser.handle_command(string, **context)
+        return dispatch(string, context)
+
+    def use_exit(self, direction):
+        """Use the exit in the given direction."""
+        player = self.object
+        location = player.location
+        x = location.match_exit(direction)
+        if x is None:
+            player.message('You cannot go that way.')
+        else:
+            x.use(player)
+
+    def huh(self, string, tried_commands):
+        """Called when no command was found. The tried_commands variable might
+        contain already-tried commands. Socials are not commands, so they are
+        never suggested here: a string starting with a social's name uses
+        that social instead."""
+        if self.object is not None:
+            here = self.object.location
+            if here is not None:
+                if string in self.game.directions:
+                    self.use_exit(self.game.directions[string])
+                    return
+                if here.parser is not None:
+                    try:
+                        self.dispatch(
+                            here.parser, string, self.get_context()
+                        )
+                        return  # We're done here.
+                    except CommandFailedError as e:
+                        tried_commands.extend(e.tried_commands)
+        self.message('No command found.')
+        if tried_commands:
+            possible_commands = ', '.join(
+                map(lambda thing: thing.name, tried_commands)
+            )
+            self.message(
+                'Commands you may have meant to try: %s.' % possible_commands
+            )
+
+    def classify_input(self, string):
+        """Return the name of the rate limit which applies to string: "login"
+        before the client has logged in, "broadcast" for commands which are
+        seen by everyone in the room, and "command" for everything else."""
+        if self.object is None:
+            return 'login'
+        elif string[:1] in self.game.broadcast_prefixes:
+            return 'broadcast'
+        word = string.split(' ', 1)[0]
+        if word in self.game.broadcast_commands or word in self.game.socials:
+            return 'broadcast'
+        return 'command'
+
+    def get_buckets(self, kind):
+        """Return the token buckets which must all have a token to spare for
+        input of the given kind: one for this connection and, once logged in,
+        one for the account."""
+        limit = self.game.rate_limits.get(kind)
+        if limit is None:
+            return []
+        if kind not in self.buckets:
+            self.buckets[kind] = TokenBucket(*limit)
+        buckets = [self.buckets[kind]]
+        if self.object is not None:
+            key = (self.object.id, kind)
+            account_buckets = self.game.account_buckets
+            if key not in account_buckets:
+                account_buckets[key] = TokenBucket(*limit)
+            buckets.append(account_buckets[key])
+        return buckets
+
+    def receive_string(self, string):
+        """Handle a string received from the client, subject to the game's
+        rate limits.
+
+        If a limit has been reached, the string is queued until there are
+        tokens to spare if the game's rate_limit_policy is "queue" and there is
+        room in the queue. Otherwise it is rejected."""
+        if self.input_queue:
+            return self.queue_input(string)
+        kind = self.classify_input(string)
+        buckets = self.get_buckets(kind)
+        if all(bucket.available() for bucket in buckets):
+            for bucket in buckets:
+                bucket.take()
+            return self.handle_string(string)
+        for bucket in buckets:
+            if bucket.tokens < 1:
+                bucket.limited += 1
+        self.rate_limited[kind] += 1
+        self.queue_input(string)
+
+    def queue_input(self, string):
+        """Queue string until the rate limits allow it, or reject it."""
+        game = self.game
+        if game.rate_limit_policy != 'queue' or \
+           len(self.input_queue) >= game.rate_limit_queue_size:
+            self.message(game.rate_limit_msg)
+            return
+        self.input_queue.append(string)
+        if self.input_call is None or not self.input_call.active():
+            self.schedule_input()
+
+    def schedule_input(self):
+        """Schedule self.process_input_queue for when the first queued string
+        will be allowed."""
+        buckets = self.get_buckets(self.classify_input(self.input_queue[0]))
+        delay = max([bucket.delay() for bucket in buckets], default=0.0)
+        self.input_call = reactor.callLater(delay, self.process_input_queue)
+
+    def process_input_queue(self):
+        """Handle as many queued strings as the rate limits allow."""
+        self.input_call = None
+        while self.input_queue:
+            string = self.input_queue[0]
+            buckets = self.get_buckets(self.classify_input(string))
+            if not all(bucket.available() for bucket in buckets):
+                self.schedule_input()
+                break
+            self.input_queue.popleft()
+            for bucket in buckets:
+                bucket.take()
+            self.handle_string(string)
+
+    def handle_string(self, string):
+        """Handle a string as a command, letting the lag monitor know which
+        command is running."""
+        with self.game.lag_monitor.doing('command', string, con=self):
+            self.run_command(string)
+
+    def run_command(self, string):
+        """Run a string as a command."""
+        last_input_type = self.input_type
+        self.last_active = time()
+        self.last_seen = self.last_active
+        try:
+            if self.command_result is not None:
+                try:
+                    self.command_result.send(string)
+                except Exception as e:
+                    self.command_result = None
+                    if not isinstance(e, StopIteration):
+                        # The command raised an exception.
+                        raise e
+            else:
+                save_command = True
+                ctx = self.get_context(command=string)
+                started = perf_counter()
+                try:
+                    res = self.dispatch(self.parser, string, ctx)
+                    if isgenerator(res):
+                        try:
+                            next(res)
+                            self.command_result = res
+                        except StopIteration:
+                            pass  # It just finished prematurely.
+                except DontSaveCommand:
+                    save_command = False
+                except CommandFailedError as e:
+                    ctx.matched = None
+                    self.huh(string, e.tried_commands)
+                finally:
+                    if save_command:
+                        self.last_command = string
+                    self.game.metrics.commands.observe(
+                        perf_counter() - started, ctx.matched or 'unknown'
+                    )
+        except Exception as e:
+            self.logger.exception('Command %r threw an error:', string)
+            self.message(self.game.error_msg)
+            if self.object and self.object.account.is_staff:
+                self.message(format_error(e))
+        finally:
+            self.send_status()
+            if self.input_type is last_input_type and \
+               last_input_type.type != 'text':
+                # Only reset back to text if no changes to the input type have
+                # been made this run, the input type is not "text", and there
+                # is no command still running.
+                self.set_input_type()
+
+    def network_stats(self):
+        """Return a dictionary of statistics about the data sent over this
+        connection.
+
+        The compression ratio is the number of bytes which were actually sent,
+        divided by the number of bytes before compression. The send_time value
+        is the number of seconds spent framing (and possibly compressing)
+        outgoing messages, and rtt is the round trip time of the last answered
+        keepalive, or None. Subclasses should fill in the byte counts."""
+        return dict(
+            compression=False, bytes_sent=0, bytes_compressed=0, ratio=None,
+            send_time=self.send_time, paused=self.paused, rtt=self.rtt,
+            queued_messages=len(self.outbound),
+            queued_bytes=self.outbound_bytes,
+            suppressed=self.total_suppressed,
+            rate_limited=dict(self.rate_limited),
+            queued_input=len(self.input_queue)
+        )
+
+    def send(self, name, *args):
+        """Encode a command with self.encode, and send it to the client."""
+        payload = self.encode(name, *args)
+        if payload is not None:
+            if self.paused:
+                self.queue_frame(name, payload)
+            else:
+                self.write_frame(payload)
+        self.send_status()
+
+    def write_frame(self, payload):
+        """Send an already-encoded frame to the client."""
+        started = perf_counter()
+        self.transmit(payload)
+        self.send_time += perf_counter() - started
+        metrics = self.game.metrics
+        metrics.bytes_sent.inc(len(payload))
+        metrics.frames_sent.inc()
+
+    def queue_frame(self, name, payload):
+        """Queue an encoded frame until the transport resumes reading.
+
+        If the queue is already full, the game's outbound_policy is applied:
+        with "disconnect" the connection is dropped. With "drop" or "summarise"
+        frames named in self.low_priority are discarded, and other frames are
+        queued anyway. With "summarise", the number of discarded frames is sent
+        to the client once the queue has drained.
+
+        Whatever the policy, the connection is dropped once the queue is
+        game.outbound_overflow_factor times over either limit, so a client
+        which never reads cannot use up all the memory."""
+        game = self.game
+        messages = len(self.outbound)
+        size = self.outbound_bytes + len(payload)
+        if messages >= game.outbound_max_messages or \
+           size > game.outbound_max_bytes:
+            factor = game.outbound_overflow_factor
+            if game.outbound_policy == 'disconnect' or \
+               messages >= game.outbound_max_messages * factor or \
+               size > game.outbound_max_bytes * factor:
+                self.logger.warning(
+                    'Disconnecting slow client with %d queued messages (%d '
+                    'bytes).', len(self.outbound), self.outbound_bytes
+                )
+                self.outbound.clear()
+                self.outbound_bytes = 0
+                self.abort()
+                return
+            elif name in self.low_priority:
+                self.suppressed += 1
+                self.total_suppressed += 1
+                return
+        self.outbound.append(payload)
+        self.outbound_bytes += len(payload)
+
+    def pauseProducing(self):
+        """The transport's buffer is full, so start queueing frames."""
+        self.paused = True
+
+    def resumeProducing(self):
+        """The transport's buffer has drained, so send any queued frames."""
+        self.paused = False
+        while self.outbound and not self.paused:
+            payload = self.outbound.popleft()
+            self.outbound_bytes -= len(payload)
+            self.write_frame(payload)
+        if self.suppressed and not self.paused:
+            n = self.suppressed
+            self.suppressed = 0
+            if self.game.outbound_policy == 'summarise':
+                self.message(
+                    '*** %d %s suppressed ***' % (n, pluralise(n, 'line'))
+                )
+
+    def stopProducing(self):
+        """The connection is going away, so forget any queued frames."""
+        self.outbound.clear()
+        self.outbound_bytes = 0
+
+    def message(self, text):
+        """Send some text to this connection."""
+        return self.send('message', text)
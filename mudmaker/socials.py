@@ -1,12 +1,121 @@
-"""Provides a PopulatedSocialsFactory instance called factory."""
+"""Provides a CachingSocialsFactory instance called factory."""
+
+from collections import OrderedDict
+from re import sub
 
 from emote_utils import PopulatedSocialsFactory
 
 from .attributes import Attribute
 from .base import BaseObject
-from .parsers import main_parser
 
-factory = PopulatedSocialsFactory()
+
+class CachingSocialsFactory(PopulatedSocialsFactory):
+    """A socials factory which compiles each social string once, and keeps
+    the compiled templates in a least recently used cache of up to cache_size
+    entries. Rendering a compiled template only calls the suffix functions and
+    fills in the results."""
+
+    def __init__(self, *args, cache_size=1000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def compile(self, string):
+        """Return a tuple of (template, suffixes), where template is string
+        with every suffix replaced by "{}", and suffixes is a list of
+        (index, suffix_name, filter_name) tuples."""
+        suffixes = []
+
+        def repl(match):
+            whole, index_string, suffix_name, filter_name = match.groups()
+            if index_string:
+                index = int(index_string) - 1
+            else:
+                index = self.default_index - 1
+            if not suffix_name:
+                suffix_name = self.default_suffix
+            if not filter_name:
+                if suffix_name.istitle():
+                    filter_name = self.title_case_filter
+                elif suffix_name.isupper():
+                    filter_name = self.upper_case_filter
+                else:
+                    filter_name = self.lower_case_filter
+            suffixes.append((index, suffix_name, filter_name))
+            return '{}'
+
+        template = sub(
+            self.suffix_re, repl, string.replace('%%', '{percent}')
+        )
+        return template, suffixes
+
+    def get_compiled(self, string):
+        """Return the compiled form of string, from the cache if possible."""
+        try:
+            compiled = self.cache[string]
+        except KeyError:
+            self.misses += 1
+            compiled = self.compile(string)
+            self.cache[string] = compiled
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self.cache.move_to_end(string)
+        return compiled
+
+    def get_strings(self, string, perspectives, **kwargs):
+        """Works like PopulatedSocialsFactory.get_strings, but uses a compiled
+        template."""
+        template, suffixes = self.get_compiled(string)
+        kwargs.setdefault('percent', '%')
+        replacements = [[] for p in perspectives]
+        replacements.append([])
+        for index, suffix_name, filter_name in suffixes:
+            try:
+                obj = perspectives[index]
+            except IndexError:
+                obj = self.no_object(index)
+            func = self.suffixes.get(suffix_name.lower(), None)
+            if func is None:
+                func = self.no_suffix(obj, suffix_name)
+            this, other = func(obj, suffix_name)
+            if filter_name:
+                filter_func = self.filters.get(filter_name, None)
+                if filter_func is None:
+                    filter_func = self.no_filter(obj, filter_name)
+                this = filter_func(this)
+                other = filter_func(other)
+            for pos, perspective in enumerate(perspectives):
+                if perspective is obj:
+                    replacements[pos].append(this)
+                else:
+                    replacements[pos].append(other)
+            replacements[-1].append(other)
+        return [template.format(*args, **kwargs) for args in replacements]
+
+    def cache_stats(self):
+        """Return a dictionary of cache statistics."""
+        lookups = self.hits + self.misses
+        return dict(
+            size=len(self.cache), cache_size=self.cache_size, hits=self.hits,
+            misses=self.misses, evictions=self.evictions,
+            hit_rate=self.hits / lookups if lookups else None
+        )
+
+    def clear_cache(self):
+        """Empty the cache, and reset its statistics."""
+        self.cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+factory = CachingSocialsFactory()
 
 
 @factory.suffix('name', 'n')
@@ -22,7 +131,8 @@ def your(obj, suffix):
 
 
 class Social(BaseObject):
-    """A social."""
+    """A social. Socials are not commands in their own right: parsers look
+    them up by name in game.socials when no command matches."""
 
     no_target = Attribute(
         None, 'The string to be used when no target is specified'
@@ -41,14 +151,15 @@ class Social(BaseObject):
         instance.game.socials[instance.name] = instance
         if instance.description is None:
             instance.description = f'{instance.name} at someone or something.'
-        main_parser.social(instance)
 
     def use_nothing(self, player):
         player.do_social(self.no_target)
 
     def use_target(self, player, target):
         """Perform a social as player."""
-        if target is player:
+        if target is None:
+            return  # The object filter has already told them.
+        elif target is player:
             p = []
             string = self.self_target
         else:
@@ -58,11 +169,4 @@ class Social(BaseObject):
 
     @classmethod
     def on_delete(cls, instance):
-        commands = []
-        for cmd in main_parser.commands:
-            if getattr(cmd.func.func, 'func', None) not in (
-                instance.use_nothing, instance.use_target
-            ):
-                commands.append(cmd)
-        main_parser.commands = commands
         del instance.game.socials[instance.name]
@@ -34,6 +34,29 @@ const status = document.getElementById("status")
 
 let input = text
 
+const opcodes = [
+    "json", "message", "inputType", "promptText", "title", "status", "ping",
+    "inputText", "resumeToken"
+]
+const decoder = new TextDecoder()
+
+function decodeFrame(buffer) {
+    let view = new DataView(buffer)
+    let name = opcodes[view.getUint8(0)]
+    let args = []
+    let pos = 1
+    while (pos < buffer.byteLength) {
+        let length = view.getUint32(pos)
+        pos += 4
+        args.push(decoder.decode(new Uint8Array(buffer, pos, length)))
+        pos += length
+    }
+    if (name == "json") {
+        return JSON.parse(args[0])
+    }
+    return {name: name, args: args}
+}
+
 function writeMessage(text) {
     for (let line of text.split("\\n")) {
         let p = document.createElement("p")
@@ -56,45 +79,75 @@ document.getElementById("inputForm").onsubmit = (e) => {
     }
 }
 
+function connect(url) {
+    soc = new WebSocket(url, ["mudmaker.binary", "mudmaker.json"])
+    soc.binaryType = "arraybuffer"
+    soc.onerror = () => {
+        soc = null
+        writeMessage("Unable to connect. Please refresh and try again.")
+    }
+    soc.onopen = () => {
+        status.hidden = false
+        writeMessage("*** Connected ***")
+        let token = sessionStorage.getItem("resumeToken")
+        if (token) {
+            soc.send(`@resume ${token}`)
+        }
+        text.focus()
+    }
+    soc.onmessage = (e) => {
+        let data = null
+        if (typeof e.data == "string") {
+            data = JSON.parse(e.data)
+        } else {
+            data = decodeFrame(e.data)
+        }
+        let name = data.name
+        let func = functions[name]
+        if (func === undefined) {
+            writeMessage(`Unrecognised command: ${name}.`)
+        } else {
+            func(data.args)
+        }
+    }
+    soc.onclose = () => {
+        status.hidden = true
+        soc = null
+        writeMessage("*** Connection closed ***")
+    }
+}
+
 window.onload = () => {
     status.hidden = true
     textarea.hidden = true
+    let scheme = window.location.protocol == "https:" ? "wss:" : "ws:"
+    let path = new URLSearchParams(window.location.search).get("websocket")
+    if (path !== null) {
+        // The websocket is served on this port, so connect straight away.
+        connect(`${scheme}//${window.location.host}${path}`)
+        return
+    }
     let req = new XMLHttpRequest()
-    req.open("GET", `http://${window.location.host}/wsport`)
+    req.open("GET", "/wsport")
     req.onload = () => {
-        let websocketPort = JSON.parse(req.response)
-        soc = new WebSocket(
-            `ws://${window.location.hostname}:${websocketPort}`
-        )
-        soc.onerror = () => {
-            soc = null
-            writeMessage("Unable to connect. Please refresh and try again.")
-        }
-        soc.onopen = () => {
-            status.hidden = false
-            writeMessage("*** Connected ***")
-            text.focus()
-        }
-        soc.onmessage = (e) => {
-            let data = JSON.parse(e.data)
-            let name = data.name
-            let func = functions[name]
-            if (func === undefined) {
-                writeMessage(`Unrecognised command: ${name}.`)
-            } else {
-                func(data.args)
-            }
-        }
-        soc.onclose = () => {
-            status.hidden = true
-            soc = null
-            writeMessage("*** Connection closed ***")
+        let where = JSON.parse(req.response)
+        if (typeof where == "string") {
+            connect(`${scheme}//${window.location.host}${where}`)
+        } else {
+            connect(`${scheme}//${window.location.hostname}:${where}`)
         }
     }
     req.send()
 }
 
 const functions = {
+    "resumeToken": args => {
+        if (args[0]) {
+            sessionStorage.setItem("resumeToken", args[0])
+        } else {
+            sessionStorage.removeItem("resumeToken")
+        }
+    },
     "ping": () => soc.send("@pong"),
     "message": args => writeMessage(args[0]),
     "inputType": args => {
@@ -0,0 +1,140 @@
+"""Provides the StaticResource class, which serves the web client.
+
+Every file is read and compressed once, when StaticResource.load is called, so
+serving a request never touches the disk. Responses carry strong ETags and
+Cache-Control headers, and conditional requests are answered with 304 Not
+Modified. If the brotli package is installed, files are also compressed with
+brotli for clients which accept it."""
+
+import gzip
+import os
+import os.path
+from hashlib import sha256
+from mimetypes import guess_type
+
+from attr import attrs, attrib, Factory
+from twisted.web.pages import notFound
+from twisted.web.resource import Resource
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files smaller than this are not worth compressing.
+min_compress_size = 256
+
+
+@attrs
+class Asset:
+    """A file loaded into memory, with any compressed versions of it."""
+
+    data = attrib()
+    content_type = attrib()
+    etag = attrib(init=False)
+    encodings = attrib(default=Factory(dict), init=False, repr=False)
+
+    def __attrs_post_init__(self):
+        self.etag = sha256(self.data).hexdigest()[:32]
+        if len(self.data) < min_compress_size:
+            return
+        compressed = dict(gzip=gzip.compress(self.data, mtime=0))
+        if brotli is not None:
+            compressed['br'] = brotli.compress(self.data)
+        for name, data in compressed.items():
+            if len(data) < len(self.data):
+                self.encodings[name] = data
+
+    def get_etag(self, encoding=None):
+        """Return the quoted ETag of the given encoding of this asset."""
+        if encoding is None:
+            return f'"{self.etag}"'
+        return f'"{self.etag}-{encoding}"'
+
+
+def accepted_encodings(header):
+    """Return the set of content codings allowed by an Accept-Encoding
+    header."""
+    encodings = set()
+    for part in header.split(','):
+        name, *params = part.strip().split(';')
+        for param in params:
+            key, _, value = param.strip().partition('=')
+            if key == 'q' and value.strip() in ('0', '0.0', '0.00', '0.000'):
+                break
+        else:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class StaticResource(Resource):
+    """Serves every file under path from memory. Call self.load to (re)load
+    them."""
+
+    isLeaf = True
+
+    def __init__(self, path, max_age=300):
+        super().__init__()
+        self.path = path
+        self.max_age = max_age
+        self.assets = {}
+
+    def load(self):
+        """Read and compress every file under self.path."""
+        assets = {}
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                name = os.path.relpath(full_path, self.path).replace(
+                    os.sep, '/'
+                )
+                content_type, encoding = guess_type(filename)
+                if content_type is None:
+                    content_type = 'application/octet-stream'
+                elif content_type.startswith('text/') or \
+                        content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                with open(full_path, 'rb') as f:
+                    assets[name] = Asset(f.read(), content_type)
+        self.assets = assets
+
+    def choose_encoding(self, request, asset):
+        """Return the best encoding of asset which the client accepts, or None
+        for the uncompressed version."""
+        header = request.getHeader('accept-encoding')
+        if header is None:
+            return None
+        accepted = accepted_encodings(header)
+        for name in ('br', 'gzip'):
+            if name in asset.encodings and (
+                name in accepted or '*' in accepted
+            ):
+                return name
+
+    def render_GET(self, request):
+        try:
+            name = '/'.join(
+                part.decode() for part in request.postpath if part
+            ) or 'index.html'
+        except UnicodeDecodeError:
+            # No asset can have a name which is not valid UTF-8.
+            name = None
+        asset = self.assets.get(name)
+        if asset is None:
+            return notFound().render(request)
+        encoding = self.choose_encoding(request, asset)
+        etag = asset.get_etag(encoding)
+        request.setHeader('ETag', etag)
+        request.setHeader('Cache-Control', f'public, max-age={self.max_age}')
+        request.setHeader('Vary', 'Accept-Encoding')
+        if_none_match = request.getHeader('if-none-match')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            if '*' in tags or etag in tags:
+                request.setResponseCode(304)
+                return b''
+        request.setHeader('Content-Type', asset.content_type)
+        if encoding is None:
+            return asset.data
+        request.setHeader('Content-Encoding', encoding)
+        return asset.encodings[encoding]
@@ -1,47 +1,265 @@
 """Provides the Task class."""
 
+from collections import deque
+from copy import deepcopy
 from functools import partial
+from importlib import import_module
 from inspect import signature
 from logging import getLogger
+from time import perf_counter
 
 from attr import attrs, attrib, Factory
-from twisted.internet.task import LoopingCall
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred
+from twisted.internet.threads import deferToThread
+from twisted.python.failure import Failure
 
-from .exc import InvalidArgumentError
+from .exc import InvalidArgumentError, InvalidModeError, NotModuleLevelError
+from .util import percentile
 
 NoneType = type(None)
+modes = ('reactor', 'thread', 'process')
+process_functions = {}
+
+
+def inject(func, ctx):
+    """Return func with the arguments it asks for from ctx filled in."""
+    args = []
+    for parameter in signature(func).parameters.values():
+        try:
+            args.append(ctx[parameter.name])
+        except KeyError:
+            if parameter.default is parameter.empty:
+                raise InvalidArgumentError(parameter.name, ctx)
+    return partial(func, *args)
+
+
+def get_reference(func):
+    """Return a "module:qualname" string which a worker process can use to
+    find func."""
+    if '<' in func.__qualname__:
+        raise NotModuleLevelError(func)
+    return f'{func.__module__}:{func.__qualname__}'
+
+
+def call_reference(reference, *args):
+    """Find the function named by reference, and call it with args. Runs in
+    worker processes.
+
+    Functions of process tasks are kept in process_functions, which forked
+    workers inherit. Otherwise the function's module is imported. If the name
+    points at a Task, as it does when Game.task is used as a decorator, the
+    task's function is called."""
+    func = process_functions.get(reference)
+    if func is None:
+        module_name, qualname = reference.split(':')
+        func = import_module(module_name)
+        for name in qualname.split('.'):
+            func = getattr(func, name)
+        if isinstance(func, Task):
+            func = func.func
+    return func(*args)
+
+
+def defer_to_process(game, func, *args):
+    """Run func(*args) in game.process_pool, returning a Deferred which fires
+    on the reactor thread. The function is sent to the pool by name, so it
+    must be defined at module level."""
+    if game.process_pool is None:
+        from concurrent.futures import ProcessPoolExecutor
+        game.process_pool = ProcessPoolExecutor(
+            max_workers=game.task_processes
+        )
+        reactor.addSystemEventTrigger(
+            'before', 'shutdown', game.process_pool.shutdown
+        )
+    d = Deferred()
+
+    def done(future):
+        try:
+            result = future.result()
+        except Exception:
+            reactor.callFromThread(d.errback, Failure())
+        else:
+            reactor.callFromThread(d.callback, result)
+
+    game.process_pool.submit(
+        call_reference, get_reference(func), *args
+    ).add_done_callback(done)
+    return d
 
 
 @attrs
 class Task:
-    """A task. Uses twisted.internet.task.LoopingCall."""
+    """A task, run by the game's scheduler.
+
+    In reactor mode, func is called on the reactor thread with whichever of
+    game, task and id it asks for. In thread mode it is called with
+    twisted.internet.threads.deferToThread, and in process mode in
+    game.process_pool. Process tasks are sent to the pool by name, so func
+    must be a module-level function, which worker processes find by importing
+    its module. Decorating it with Game.task is fine. Pool tasks
+    cannot touch the game: if snapshot is not None, it is called on the
+    reactor thread (with the same arguments a reactor func could ask for), and
+    a copy of what it returns is passed to func. Otherwise func is called with
+    no arguments.
+
+    If on_result is not None, it is called on the reactor thread with the
+    result of every run, so results can be applied to the game. A run which
+    is still going when the next is due, including a reactor task which
+    returned a Deferred, causes that next run to be skipped.
+
+    Every run is timed. The last game.task_samples durations are kept, along
+    with their total and how late the last run started compared with its
+    schedule."""
 
     game = attrib()
     func = attrib()
+    mode = attrib(default=Factory(lambda: 'reactor'))
+    snapshot = attrib(default=Factory(NoneType), repr=False)
+    on_result = attrib(default=Factory(NoneType), repr=False)
     id = attrib(default=Factory(NoneType), init=False)
-    loop = attrib(default=Factory(NoneType), init=False, repr=False)
+    job = attrib(default=Factory(NoneType), init=False, repr=False)
     deferred = attrib(default=Factory(NoneType), init=False, repr=False)
     logger = attrib(default=Factory(NoneType), init=False, repr=False)
+    name = attrib(default=Factory(NoneType), init=False)
+    busy = attrib(default=Factory(bool), init=False, repr=False)
+    runs = attrib(default=Factory(int), init=False, repr=False)
+    failures = attrib(default=Factory(int), init=False, repr=False)
+    overlaps = attrib(default=Factory(int), init=False, repr=False)
+    durations = attrib(default=Factory(NoneType), init=False, repr=False)
+    total_duration = attrib(default=Factory(float), init=False, repr=False)
+    lateness = attrib(default=Factory(float), init=False, repr=False)
+    max_lateness = attrib(default=Factory(float), init=False, repr=False)
 
     def __attrs_post_init__(self):
-        self.id = self.game.new_id()
-        self.logger = getLogger('%s (#%s)' % (self.func.__name__, self.id))
-        args = []
+        if self.mode not in modes:
+            raise InvalidModeError(self.mode, modes)
+        self.id = self.game.scheduler.new_id()
+        self.name = self.func.__name__
+        self.durations = deque(maxlen=self.game.task_samples)
+        self.logger = getLogger('%s (#%s)' % (self.name, self.id))
         ctx = dict(game=self.game, task=self, id=self.id)
-        for parameter in signature(self.func).parameters.values():
-            try:
-                args.append(ctx[parameter.name])
-            except KeyError:
-                if parameter.default is parameter.empty:
-                    raise InvalidArgumentError(parameter.name, ctx)
-        self.func = partial(self.func, *args)
-        self.loop = LoopingCall(self.func)
-
-    def start(self, *args, **kwargs):
-        """Call self.loop.start with all arguments, and store the resulting
-        Deferred in self.deferred."""
-        self.deferred = self.loop.start(*args, **kwargs)
+        if self.mode == 'process':
+            process_functions[get_reference(self.func)] = self.func
+        if self.mode == 'reactor':
+            self.func = inject(self.func, ctx)
+        elif self.snapshot is not None:
+            self.snapshot = inject(self.snapshot, ctx)
+
+    def start(self, interval, now=True):
+        """Run this task every interval seconds, starting straight away if now
+        is True. Like twisted.internet.task.LoopingCall.start, self.deferred
+        fires when the task is stopped, or errbacks if the task fails."""
+        self.deferred = Deferred()
         self.deferred.addErrback(self.on_error)
+        self.job = self.game.scheduler.call_every(
+            interval, self.run, id=self.id
+        )
+        if now:
+            self.run()
+
+    @property
+    def running(self):
+        return self.job is not None and self.job.active
+
+    def call(self):
+        """Call self.func in the way self.mode says, returning its result or
+        a Deferred."""
+        if self.mode == 'reactor':
+            return self.func()
+        args = []
+        if self.snapshot is not None:
+            args.append(self.snapshot())
+        if self.mode == 'thread':
+            return deferToThread(self.func, *deepcopy(args))
+        return defer_to_process(self.game, self.func, *args)
+
+    def run(self):
+        """Call self.func, stopping this task if it fails. If the last run is
+        still going, this run is skipped."""
+        if self.busy:
+            self.overlaps += 1
+            return
+        scheduler = self.game.scheduler
+        self.lateness = max(
+            0.0, scheduler.clock.seconds() - scheduler.due_time(self.job)
+        )
+        self.max_lateness = max(self.max_lateness, self.lateness)
+        self.runs += 1
+        started = perf_counter()
+        try:
+            with self.game.lag_monitor.doing('task', self.logger.name):
+                res = self.call()
+        except Exception:
+            return self.failed(Failure(), started)
+        if isinstance(res, Deferred):
+            self.busy = True
+            res.addCallbacks(
+                self.finished, self.failed, callbackArgs=(started,),
+                errbackArgs=(started,)
+            )
+        else:
+            self.finished(res, started)
+
+    def finished(self, result, started):
+        """A run has finished. If this task has been stopped since the run
+        began, the result is discarded."""
+        self.busy = False
+        self.record(perf_counter() - started)
+        if not self.running:
+            return
+        if self.on_result is not None:
+            try:
+                self.on_result(result)
+            except Exception:
+                self.failures += 1
+                self.fail(Failure())
+
+    def failed(self, failure, started):
+        """A run has failed."""
+        self.busy = False
+        self.record(perf_counter() - started)
+        self.failures += 1
+        self.fail(failure)
+
+    def record(self, duration):
+        """Record the duration of a run."""
+        self.durations.append(duration)
+        self.total_duration += duration
+
+    def stats(self):
+        """Return a dictionary of statistics about this task. Durations and
+        lateness are in seconds. Until the task is started, interval and
+        skipped are None."""
+        durations = sorted(self.durations)
+        if self.job is None:
+            interval = None
+            skipped = None
+        else:
+            interval = self.job.interval * self.game.scheduler.resolution
+            skipped = self.job.skipped
+        return dict(
+            id=self.id, name=self.name, mode=self.mode, running=self.running,
+            interval=interval, runs=self.runs, failures=self.failures,
+            skipped=skipped,
+            overlaps=self.overlaps,
+            last=self.durations[-1] if self.durations else None,
+            p50=percentile(durations, 50), p99=percentile(durations, 99),
+            lateness=self.lateness, max_lateness=self.max_lateness
+        )
+
+    def stop(self):
+        """Stop this task."""
+        if self.running:
+            self.job.cancel()
+            self.deferred.callback(self)
+
+    def fail(self, failure):
+        """Stop this task because of failure."""
+        if self.running:
+            self.job.cancel()
+            self.deferred.errback(failure)
 
     def on_error(self, e):
         self.logger.error('An error occurred:\n' + e.getTraceback())
@@ -0,0 +1,223 @@
+"""Provides the TelnetConnection class, for classic MUD clients and bots which
+speak raw TCP.
+
+Output can be compressed with MCCP2 (telnet option 86), and out-of-band data
+such as the window title and status is sent with GMCP (telnet option 201) to
+clients which support it."""
+
+import zlib
+from collections import deque
+from json import dumps
+
+from twisted.conch.telnet import ECHO, IAC, SB, SE, Telnet
+from twisted.internet.protocol import ServerFactory
+
+from .sessions import Session
+
+COMPRESS2 = bytes([86])
+GMCP = bytes([201])
+TIMING_MARK = bytes([6])
+DO_TIMING_MARK = IAC + bytes([253]) + TIMING_MARK
+
+# The GMCP packages used for the commands which have no plain text
+# equivalent.
+gmcp_packages = dict(
+    title='Client.Title', status='Char.Status', promptText='Client.Prompt',
+    inputText='Client.InputText', ping='Core.Ping'
+)
+
+
+class TelnetConnection(Session, Telnet):
+    """A protocol to use with telnet clients."""
+
+    max_line_length = 8192
+
+    def connectionMade(self):
+        super().connectionMade()
+        self.buffer = b''
+        self.compressor = None
+        self.gmcp = False
+        self.echo = False
+        # What each outstanding timing mark was sent for, oldest first.
+        self.timing_marks = deque()
+        self.bytes_sent = 0
+        self.bytes_compressed = 0
+        self.negotiationMap[GMCP] = self.gmcp_received
+        peer = self.transport.getPeer()
+        self.open_session(peer.host, peer.port)
+        for option in (COMPRESS2, GMCP):
+            self.will(option).addErrback(lambda failure: None)
+
+    def connectionLost(self, reason):
+        super().connectionLost(reason)
+        self.close_session(reason)
+
+    def disconnect(self, text=None):
+        """Send text, then close the connection."""
+        if text is not None:
+            self.message(text)
+        self.transport.loseConnection()
+
+    def abort(self):
+        """Drop the underlying TCP connection."""
+        self.transport.abortConnection()
+
+    def enableLocal(self, option):
+        if option == COMPRESS2:
+            # Everything after the subnegotiation is compressed.
+            self._write(IAC + SB + COMPRESS2 + IAC + SE)
+            self.compressor = zlib.compressobj()
+            self.logger.info('MCCP2 compression enabled.')
+            return True
+        elif option == GMCP:
+            self.gmcp = True
+            self.send_gmcp('Client.Title', self.title)
+            return True
+        return option == ECHO
+
+    def disableLocal(self, option):
+        if option == COMPRESS2 and self.compressor is not None:
+            # Finish the compressed stream, then carry on uncompressed.
+            self.transport.write(self.compressor.flush())
+            self.compressor = None
+        elif option == GMCP:
+            self.gmcp = False
+
+    def enableRemote(self, option):
+        return False
+
+    def telnet_DO(self, option):
+        state = self.getOptionState(option).us
+        if option in (COMPRESS2, GMCP) and state.state == 'no' and \
+           not state.negotiating:
+            # The client asked first. Telnet would only send WILL after
+            # enableLocal, by which time compression or GMCP output has
+            # already started, so agree before enabling.
+            state.state = 'yes'
+            self._will(option)
+            self.enableLocal(option)
+        else:
+            super().telnet_DO(option)
+
+    def telnet_WILL(self, option):
+        if option == TIMING_MARK:
+            self.timing_mark_received()
+        else:
+            super().telnet_WILL(option)
+
+    def telnet_WONT(self, option):
+        if option == TIMING_MARK:
+            self.timing_mark_received()
+        else:
+            super().telnet_WONT(option)
+
+    def keepalive(self):
+        """Send a timing mark, which every telnet client must answer."""
+        self.timing_marks.append('keepalive')
+        self._write(DO_TIMING_MARK)
+        return True
+
+    def timing_mark_received(self):
+        """The client has answered a timing mark. Marks are answered in the
+        order they were sent, so the oldest outstanding one is the one which
+        was answered."""
+        if not self.timing_marks:
+            self.logger.debug('Ignoring an unrequested timing mark.')
+        elif self.timing_marks.popleft() == 'ping':
+            self.pong()
+        else:
+            self.keepalive_received()
+
+    def pong(self):
+        """The client has answered a ping."""
+        if self.ping_time is not None:
+            self.handle_string('@pong')
+
+    def _write(self, data):
+        """Write data to the transport, compressing it if MCCP2 is active."""
+        self.bytes_sent += len(data)
+        if self.compressor is not None:
+            data = self.compressor.compress(data) + self.compressor.flush(
+                zlib.Z_SYNC_FLUSH
+            )
+        self.bytes_compressed += len(data)
+        self.transport.write(data)
+
+    def applicationDataReceived(self, data):
+        """Split data into lines, and handle each one as a command."""
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        if len(self.buffer) > self.max_line_length:
+            self.logger.warning('Line too long, discarding.')
+            self.buffer = b''
+        for line in lines:
+            self.receive_string(
+                line.rstrip(b'\r').decode(errors='replace')
+            )
+
+    def gmcp_received(self, data):
+        """Handle a GMCP message from the client."""
+        package, _, payload = b''.join(data).decode(
+            errors='replace'
+        ).partition(' ')
+        if package == 'Core.Ping':
+            self.pong()
+        else:
+            self.logger.debug('Ignoring GMCP %s %s.', package, payload)
+
+    def send_gmcp(self, package, value):
+        """Send a GMCP message, if the client supports it."""
+        if self.gmcp:
+            self.requestNegotiation(
+                GMCP, f'{package} {dumps(value)}'.encode()
+            )
+
+    def encode(self, name, *args):
+        """Turn messages into lines of text. Everything else is either sent
+        with GMCP, or used to negotiate telnet options."""
+        if name == 'message':
+            text = args[0].replace('\n', '\r\n') + '\r\n'
+            return text.encode().replace(IAC, IAC + IAC)
+        elif name == 'inputType':
+            echo = args[0] == 'password'
+            if echo != self.echo:
+                self.echo = echo
+                if echo:
+                    d = self.will(ECHO)
+                else:
+                    d = self.wont(ECHO)
+                d.addErrback(lambda failure: None)
+        elif name in gmcp_packages:
+            if self.gmcp:
+                if args:
+                    value = args[0]
+                else:
+                    value = ''
+                self.send_gmcp(gmcp_packages[name], value)
+            elif name == 'ping':
+                self.timing_marks.append('ping')
+                return DO_TIMING_MARK
+
+    def transmit(self, payload):
+        """Write the payload to the transport."""
+        self._write(payload)
+
+    def network_stats(self):
+        """Add the MCCP2 statistics."""
+        stats = super().network_stats()
+        stats.update(
+            compression=self.compressor is not None,
+            bytes_sent=self.bytes_sent, bytes_compressed=self.bytes_compressed
+        )
+        if self.bytes_sent:
+            stats['ratio'] = self.bytes_compressed / self.bytes_sent
+        return stats
+
+
+class TelnetFactory(ServerFactory):
+    """A factory for TelnetConnection instances."""
+
+    protocol = TelnetConnection
+
+    def __init__(self, game):
+        self.game = game
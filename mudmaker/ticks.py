@@ -0,0 +1,137 @@
+"""Provides the Ticker class, which runs tick handlers for zones with players
+in them."""
+
+from collections import OrderedDict
+from logging import getLogger
+from time import perf_counter
+
+from attr import attrs, attrib, Factory
+
+
+@attrs
+class TickHandler:
+    """A function to be called on world ticks while zone is awake.
+
+    The function is called with the number of ticks since it last ran. If
+    catch_up is True, ticks missed while the zone slept (or while the handler
+    waited for CPU time) are included, up to game.tick_max_catch_up. If not,
+    missed ticks are skipped and the function is always called with 1."""
+
+    ticker = attrib(repr=False)
+    id = attrib()
+    zone = attrib()
+    func = attrib()
+    catch_up = attrib(default=Factory(lambda: True))
+    last_tick = attrib(default=Factory(int))
+
+    def cancel(self):
+        """Stop calling this handler."""
+        self.ticker.unregister(self)
+
+
+@attrs
+class Ticker:
+    """Runs tick handlers registered for zones.
+
+    A zone is awake while a connected player is in one of its rooms, and for
+    game.tick_linger ticks after the last one leaves. Handlers for sleeping
+    zones are not called at all, so the cost of a tick depends on the number
+    of players and the handlers of the zones they are in, not on the size of
+    the world.
+
+    Each tick spends at most game.tick_budget seconds running handlers. Any
+    which do not fit are left queued, and run first on the next tick."""
+
+    game = attrib()
+    ticks = attrib(default=Factory(int), init=False)
+    handlers = attrib(default=Factory(dict), init=False, repr=False)
+    active = attrib(default=Factory(dict), init=False, repr=False)
+    queue = attrib(default=Factory(OrderedDict), init=False, repr=False)
+    max_id = attrib(default=Factory(int), init=False)
+    calls = attrib(default=Factory(int), init=False)
+    carried = attrib(default=Factory(int), init=False)
+    last_duration = attrib(default=Factory(float), init=False)
+    logger = attrib(
+        default=Factory(lambda: getLogger(__name__)), init=False, repr=False
+    )
+
+    def register(self, zone, func, catch_up=True):
+        """Call func on every tick while zone is awake. Returns a
+        TickHandler."""
+        self.max_id += 1
+        handler = TickHandler(
+            self, self.max_id, zone, func, catch_up=catch_up,
+            last_tick=self.ticks
+        )
+        self.handlers.setdefault(zone.id, {})[handler.id] = handler
+        return handler
+
+    def unregister(self, handler):
+        """Remove a handler."""
+        handlers = self.handlers.get(handler.zone.id, {})
+        handlers.pop(handler.id, None)
+        if not handlers:
+            self.handlers.pop(handler.zone.id, None)
+        self.queue.pop(handler.id, None)
+
+    def remove_zone(self, zone):
+        """Remove every handler for zone."""
+        for handler in list(self.handlers.get(zone.id, {}).values()):
+            self.unregister(handler)
+        self.active.pop(zone.id, None)
+
+    def awake_zones(self):
+        """Update self.active, and return the ids of the zones which are
+        awake."""
+        for con in self.game.connections:
+            player = con.object
+            location = getattr(player, 'location', None)
+            zone = getattr(location, 'zone', None)
+            if zone is not None:
+                self.active[zone.id] = self.ticks
+        linger = self.game.tick_linger
+        for zone_id, tick in list(self.active.items()):
+            if self.ticks - tick > linger:
+                del self.active[zone_id]
+        return list(self.active)
+
+    def tick(self):
+        """Run one world tick."""
+        started = perf_counter()
+        self.ticks += 1
+        for zone_id in self.awake_zones():
+            for handler in self.handlers.get(zone_id, {}).values():
+                if handler.id not in self.queue:
+                    self.queue[handler.id] = handler
+        deadline = started + self.game.tick_budget
+        while self.queue:
+            id, handler = self.queue.popitem(last=False)
+            self.call(handler)
+            if perf_counter() > deadline:
+                break
+        self.carried = len(self.queue)
+        self.last_duration = perf_counter() - started
+
+    def call(self, handler):
+        """Call a handler with the number of ticks since it last ran."""
+        if handler.catch_up:
+            ticks = min(
+                self.ticks - handler.last_tick, self.game.tick_max_catch_up
+            )
+        else:
+            ticks = 1
+        handler.last_tick = self.ticks
+        self.calls += 1
+        try:
+            with self.game.lag_monitor.doing('tick handler', handler):
+                handler.func(max(1, ticks))
+        except Exception:
+            self.logger.exception('Tick handler %r failed.', handler)
+
+    def stats(self):
+        """Return a dictionary of statistics."""
+        return dict(
+            ticks=self.ticks, calls=self.calls, awake=len(self.active),
+            zones=len(self.handlers), queued=len(self.queue),
+            carried=self.carried, last_duration=self.last_duration
+        )
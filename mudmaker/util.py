@@ -8,6 +8,15 @@ def format_error(e):
     return ''.join(format_exception(e.__class__, e, e.__traceback__))
 
 
+def percentile(values, percent):
+    """Return the given percentile of a sorted list of values, or None if the
+    list is empty."""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
 def english_list(l, empty='nothing', key=str, sep=', ', and_='and '):
     """Return a decently-formatted list."""
     results = [key(x) for x in l]
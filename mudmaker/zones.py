@@ -15,6 +15,15 @@ class Zone(BaseObject):
         """Get a list of rooms contained in this zone."""
         return [r for r in self.game.rooms.values() if r.zone is self]
 
+    def on_tick(self, catch_up=True):
+        """Decorate a function to be called on world ticks while this zone is
+        awake. See mudmaker.ticks.TickHandler."""
+
+        def inner(func):
+            return self.game.ticker.register(self, func, catch_up=catch_up)
+
+        return inner
+
     @classmethod
     def on_init(cls, instance):
         """Add this zone to self.game.zones."""
@@ -23,3 +32,4 @@ class Zone(BaseObject):
     @classmethod
     def on_delete(cls, instance):
         del instance.game.zones[instance.id]
+        instance.game.ticker.remove_zone(instance)
@@ -61,6 +61,12 @@ class PretendTransport:
     def getPeer(self):
         return PretendPeer()
 
+    def registerProducer(self, producer, streaming):
+        self.producer = producer
+
+    def unregisterProducer(self):
+        self.producer = None
+
 
 class PretendConnection(WebSocketConnection):
     """A pretend connection."""
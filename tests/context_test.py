@@ -0,0 +1,39 @@
+from mudmaker.context import Context
+from mudmaker.socials import factory
+
+
+def test_lazy(connection):
+    ctx = connection.get_context(command='look')
+    assert isinstance(ctx, Context)
+    assert ctx.values == dict(command='look')
+    assert 'zone' in ctx
+    assert 'command' in ctx
+    assert 'nothing' not in ctx
+    assert ctx.values == dict(command='look')
+    assert ctx['player'] is None
+    assert ctx['location'] is None
+    assert ctx.values == dict(command='look', player=None, location=None)
+
+
+def test_values(connection, player, room):
+    player.location = room
+    ctx = connection.get_context()
+    assert ctx['zone'] is room.zone
+    assert ctx['account'] is player.account
+    assert ctx['is_staff'] is False
+    assert ctx['host'] == 'test.example.com:1234'
+    assert ctx['socials'] is factory
+    d = dict(ctx)
+    assert d['game'] is connection.game
+    assert d['con'] is connection
+    assert len(ctx) == len(d)
+
+
+def test_dispatch(connection, player):
+    ctx = connection.get_context()
+    connection.parser.dispatch('@host', ctx)
+    assert connection.last_message == 'You are connected from %s.' % ctx[
+        'host'
+    ]
+    assert 'zone' not in ctx.values
+    assert 'accounts' not in ctx.values
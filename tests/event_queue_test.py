@@ -0,0 +1,104 @@
+from pytest import raises
+from twisted.internet.task import Clock
+
+from mudmaker import Game, Object
+from mudmaker.event_queue import EventQueue, QueuedEvent
+from mudmaker.exc import InvalidPolicyError, NoSuchHandlerError
+from mudmaker.scheduler import Scheduler
+
+
+def make_game(name='Test Game'):
+    clock = Clock()
+    g = Game(name, scheduler=Scheduler(clock=clock))
+    calls = []
+    g.event_queue.handler('record')(lambda **kwargs: calls.append(kwargs))
+    return g, clock, calls
+
+
+def test_init(game):
+    assert isinstance(game.event_queue, EventQueue)
+    assert game.event_queue.game is game
+    assert game.event_queue.events == {}
+
+
+def test_schedule():
+    g, clock, calls = make_game()
+    q = g.event_queue
+    with raises(NoSuchHandlerError):
+        q.schedule(5, 'nothing')
+    with raises(InvalidPolicyError):
+        q.schedule(5, 'record', catch_up='never')
+    e = q.schedule(5, 'record', text='hello')
+    assert isinstance(e, QueuedEvent)
+    assert e.kwargs == dict(text='hello')
+    assert q.events == {e.id: e}
+    clock.advance(5)
+    assert calls == [dict(text='hello')]
+    assert q.events == {}
+    e = q.schedule(5, 'record')
+    e.cancel()
+    assert q.events == {}
+    clock.advance(5)
+    assert len(calls) == 1
+
+
+def test_as_dict():
+    g, clock, calls = make_game()
+    assert 'events' not in g.as_dict()
+    q = g.event_queue
+    later = q.schedule(10, 'record')
+    sooner = q.schedule(5, 'record', catch_up='skip')
+    events = g.as_dict()['events']
+    assert [e['id'] for e in events] == [sooner.id, later.id]
+    assert events[0] == dict(
+        id=sooner.id, name='record', due=sooner.due, catch_up='skip',
+        kwargs={}
+    )
+
+
+def test_reload():
+    g, clock, calls = make_game()
+    o = g.make_object('Object', (Object,), name='Respawn')
+    q = g.event_queue
+    q.schedule(60, 'record', obj=o)
+    q.schedule(-10, 'record', catch_up='skip', text='skipped')
+    q.schedule(-10, 'record', catch_up='run', text='run')
+    for i in range(3):
+        q.schedule(-i, 'record', catch_up='spread', number=i)
+    data = g.as_dict()
+    g2, clock2, calls2 = make_game('Second Test Game')
+    g2.event_catch_up_window = 30
+    g2.from_dict(data)
+    q2 = g2.event_queue
+    assert q2.max_id == q.max_id
+    assert len(q2.events) == 5
+    clock2.advance(0.1)
+    assert calls2 == [dict(text='run'), dict(number=2)]
+    clock2.advance(15)
+    assert calls2[-1] == dict(number=1)
+    clock2.advance(15)
+    assert calls2[-1] == dict(number=0)
+    clock2.advance(30)
+    assert calls2[-1] == dict(obj=g2.objects[o.id])
+    assert q2.events == {}
+
+
+def test_deleted_object():
+    g, clock, calls = make_game()
+    o = g.make_object('Object', (Object,), name='Doomed')
+    g.event_queue.schedule(60, 'record', obj=o)
+    data = g.as_dict()
+    data['objects'] = []
+    g2, clock2, calls2 = make_game('Second Test Game')
+    g2.from_dict(data)
+    assert g2.event_queue.events == {}
+
+
+def test_missing_handler():
+    g, clock, calls = make_game()
+    e = g.event_queue.schedule(1, 'record')
+    del g.event_queue.handlers['record']
+    clock.advance(1)
+    assert g.event_queue.events == {}
+    assert calls == []
+    assert e.name not in g.event_queue.handlers
@@ -1,4 +1,4 @@
-from mudmaker import Exit, Room
+from mudmaker import Exit, Object, Room
 
 
 def test_init(game, exit):
@@ -67,3 +67,31 @@ def test_open(exit, obj):
 def test_close(exit, obj):
     exit.close(obj)
     assert exit.state is exit.CLOSED
+
+
+def test_use_followed(game, exit, zone):
+    def listen(name, location):
+        o = game.make_object('Object', (Object,), name=name, location=location)
+        o.messages = []
+        o.message = o.messages.append
+        return o
+
+    start = exit.location
+    leader = listen('Leader', start)
+    followers = [listen(f'Follower {i}', start) for i in range(3)]
+    for follower in followers:
+        follower.following = leader
+    left = listen('Left', start)
+    waiting = listen('Waiting', exit.destination)
+    exit.use(leader)
+    for o in [leader] + followers:
+        assert o.location is exit.destination
+    assert waiting.messages == ['Leader arrives.'] + [
+        f'Follower {i} arrives behind Leader.' for i in range(3)
+    ]
+    assert leader.messages[-3:] == [
+        f'Follower {i} arrives behind you.' for i in range(3)
+    ]
+    assert left.messages == ['Leader walks Test Exit.'] + [
+        f'Follower {i} leaves behind Leader.' for i in range(3)
+    ]
@@ -1,9 +1,18 @@
+from time import time
+
 from attr import attrs, attrib, Factory
+from autobahn.twisted.resource import WebSocketResource
+from autobahn.websocket.compress import (
+    PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+)
 from pytest import raises
+from twisted.web.test.requesthelper import DummyRequest
 from yaml import dump
 
-from mudmaker import Game, Zone
+from mudmaker import Game, Zone, game as game_module
 from mudmaker.game import ObjectValue
+from mudmaker.gateway import parser as gateway_parser
+from mudmaker.parsers import login_parser
 
 
 def test_init(game):
@@ -105,3 +114,144 @@ def test_load_value(game, obj):
     assert game.load_value(
         dict(objects=[ObjectValue(obj.id), ObjectValue(obj.id)])
     ) == dict(objects=[obj, obj])
+
+
+def test_accept_compression(game):
+    offer = PerMessageDeflateOffer()
+    assert game.accept_compression([]) is None
+    accept = game.accept_compression([offer])
+    assert isinstance(accept, PerMessageDeflateOfferAccept)
+    assert accept.window_bits is None
+    assert accept.no_context_takeover is False
+    game.compression_window_bits = 12
+    game.compression_mem_level = 5
+    game.compression_no_context_takeover = True
+    accept = game.accept_compression(
+        [PerMessageDeflateOffer(request_max_window_bits=10)]
+    )
+    assert accept.window_bits == 10
+    assert accept.mem_level == 5
+    assert accept.no_context_takeover is True
+
+
+def test_network_stats(connection):
+    stats = connection.network_stats()
+    assert stats['compression'] is False
+    assert stats['bytes_sent'] == 0
+    assert stats['ratio'] is None
+    assert stats['send_time'] == 0.0
+
+
+def test_reap_task(game, player):
+    con = player.connection
+    reasons = []
+    con.disconnect = reasons.append
+    con.last_active -= game.login_timeout + 1
+    game.reap_task()
+    assert reasons == []
+    con.last_active -= game.idle_timeout
+    game.reap_task()
+    assert reasons and set(reasons) == {game.idle_msg}
+    n = len(reasons)
+    game.idle_timeout = None
+    game.reap_task()
+    assert len(reasons) == n
+
+
+def test_websocket_path(game):
+    request = DummyRequest([b''])
+    game.on_index_page(request)
+    assert request.responseHeaders.getRawHeaders(b'location') == [
+        b'/static/index.html'
+    ]
+    game.websocket_path = 'ws'
+    request = DummyRequest([b''])
+    game.on_index_page(request)
+    assert request.responseHeaders.getRawHeaders(b'location') == [
+        b'/static/index.html?websocket=/ws'
+    ]
+    assert game.on_websocket_page(request) == b'"/ws"'
+    game.listen_for_websockets()
+    assert game.websocket_port is None
+    resource = game.web_root.children[b'ws']
+    assert isinstance(resource, WebSocketResource)
+    assert game.websocket_factory.game is game
+
+
+def test_resume_token(game, player, connection):
+    token = game.make_resume_token(player)
+    assert game.check_resume_token(token) is player
+    assert game.check_resume_token(token + '0') is None
+    assert game.check_resume_token('nothing') is None
+    assert game.check_resume_token('1234.abc') is None
+    id, issued, signature = token.split('.')
+    assert game.check_resume_token(
+        f'{id}.{int(issued) + 60}.{signature}'
+    ) is None
+    game.make_resume_token(player)
+    assert game.check_resume_token(token) is None
+    token = game.make_resume_token(player)
+    player.connection = None
+    player.disconnected = time()
+    assert player.message('While you were away.') is False
+    assert list(player.output_buffer) == ['While you were away.']
+    connection.object = None
+    connection.parser = login_parser
+    connection.messages.clear()
+    connection.handle_string(f'@resume {token}')
+    assert player.connection is connection
+    assert 'While you were away.' in connection.messages
+    assert not player.output_buffer
+    assert game.check_resume_token(token) is None
+
+
+def test_resume_token_expired(game, player, connection, monkeypatch):
+    monkeypatch.setattr(
+        game_module, 'time', lambda: time() - game.resume_ttl - 1
+    )
+    token = game.make_resume_token(player)
+    monkeypatch.undo()
+    assert player.connection is connection
+    assert game.check_resume_token(token) is None
+    player.connection = None
+    player.disconnected = time()
+    player.message('Nobody is listening.')
+    assert player.resume_nonce is None
+    assert not player.output_buffer
+
+
+def test_resume_token_refresh(game, player, connection, monkeypatch):
+    sent = []
+    monkeypatch.setattr(connection, 'send', lambda *args: sent.append(args))
+    token = game.make_resume_token(player)
+    game.reap_task()
+    assert sent == []
+    player.resume_issued -= game.resume_refresh_interval
+    game.reap_task()
+    [(name, new_token)] = sent
+    assert name == 'resumeToken'
+    assert game.check_resume_token(token) is None
+    assert game.check_resume_token(new_token) is player
+
+
+def test_start_gateways(game, monkeypatch):
+    spawned = []
+    monkeypatch.setattr(
+        game_module.reactor, 'spawnProcess',
+        lambda protocol, executable, args, env: spawned.append(args)
+    )
+    monkeypatch.setattr(
+        game_module.reactor, 'addSystemEventTrigger', lambda *args: None
+    )
+    game.gateways = 2
+    game.compression = True
+    game.compression_window_bits = 11
+    game.compression_mem_level = 4
+    game.compression_no_context_takeover = True
+    game.start_gateways()
+    assert len(spawned) == 2
+    args = gateway_parser.parse_args(spawned[0][3:])
+    assert args.compression is True
+    assert args.window_bits == 11
+    assert args.mem_level == 4
+    assert args.no_context_takeover is True
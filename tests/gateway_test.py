@@ -0,0 +1,181 @@
+from json import loads
+from types import SimpleNamespace
+
+from autobahn.websocket.compress import PerMessageDeflateOffer
+from autobahn.websocket.types import ConnectionDeny
+from pytest import raises
+from twisted.internet.error import ConnectionDone
+from twisted.internet.testing import StringTransport
+from twisted.python.failure import Failure
+
+from mudmaker.gateway import (
+    accept_compression, CLOSE, Gateway, GatewayClient, GatewayConnection,
+    GatewayLinkFactory, INPUT, OPEN, OUTPUT, pack_message, parser, PING,
+    PONG, RemoteSession, unpack_message
+)
+from mudmaker.protocol import decode_frame, encode_frame
+
+
+def messages(link):
+    """Return and clear the messages sent over link."""
+    data = link.transport.value()
+    link.transport.clear()
+    results = []
+    while data:
+        length = int.from_bytes(data[:4], 'big')
+        results.append(unpack_message(data[4:4 + length]))
+        data = data[4 + length:]
+    return results
+
+
+def get_link(game):
+    link = GatewayLinkFactory(game).buildProtocol(None)
+    link.makeConnection(StringTransport())
+    return link
+
+
+def test_pack():
+    data = pack_message(INPUT, 5, b'look')
+    assert unpack_message(data) == (INPUT, 5, b'look')
+
+
+def test_session(game):
+    link = get_link(game)
+    link.stringReceived(pack_message(OPEN, 3, b'example.com:1234'))
+    session = link.sessions[3]
+    assert isinstance(session, RemoteSession)
+    assert session in game.connections
+    assert session.host == 'example.com'
+    assert session.port == 1234
+    frames = [
+        decode_frame(payload) for type, session_id, payload in messages(link)
+        if type == OUTPUT and session_id == 3
+    ]
+    assert ('message', [game.welcome_msg]) in frames
+    link.stringReceived(pack_message(INPUT, 3, b'@host'))
+    assert (OUTPUT, 3, encode_frame(
+        'message', 'You are connected from example.com:1234.'
+    )) in messages(link)
+    link.stringReceived(pack_message(CLOSE, 3, b'Gone.'))
+    assert session not in game.connections
+    assert 3 not in link.sessions
+
+
+def test_lost(game):
+    link = get_link(game)
+    link.stringReceived(pack_message(OPEN, 1, b'127.0.0.1:4000'))
+    session = link.sessions[1]
+    link.connectionLost(Failure(ConnectionDone()))
+    assert session not in game.connections
+
+
+def test_keepalive(game):
+    link = get_link(game)
+    link.stringReceived(pack_message(OPEN, 2, b'127.0.0.1:4000'))
+    session = link.sessions[2]
+    session.last_seen -= game.keepalive_interval
+    messages(link)
+    game.reap_task()
+    assert messages(link) == [(PING, 2, b'')]
+    assert session.keepalive_sent is not None
+    link.stringReceived(pack_message(PONG, 2))
+    assert session.keepalive_sent is None
+    assert session.rtt is not None
+    assert session in game.connections
+    gateway = Gateway(4000)
+    client = GatewayClient()
+    client.factory = SimpleNamespace(gateway=gateway)
+    pings = []
+    con = GatewayConnection()
+    con.factory = client.factory
+    con.session_id = 2
+    con.sendPing = lambda: pings.append(None)
+    gateway.connections[2] = con
+    client.stringReceived(pack_message(PING, 2))
+    assert pings == [None]
+    sent = []
+    gateway.link = SimpleNamespace(sendString=sent.append)
+    con.onPong(b'')
+    assert unpack_message(sent.pop()) == (PONG, 2, b'')
+
+
+def test_send_frame():
+    sent = []
+    con = GatewayConnection()
+    con.sendMessage = lambda payload, isBinary=False: sent.append(
+        (payload, isBinary)
+    )
+    frame = encode_frame('title', 'Test')
+    con.send_frame(frame)
+    payload, is_binary = sent.pop()
+    assert is_binary is False
+    assert loads(payload) == dict(name='title', args=['Test'])
+    con.binary = True
+    con.send_frame(frame)
+    assert sent.pop() == (frame, True)
+
+
+def test_link_down():
+    gateway = Gateway(4000)
+    con = GatewayConnection()
+    con.factory = SimpleNamespace(gateway=gateway)
+    closes = []
+    con.sendClose = lambda code, reason: closes.append((code, reason))
+    request = SimpleNamespace(protocols=[])
+    with raises(ConnectionDeny) as e:
+        con.onConnect(request)
+    assert e.value.code == ConnectionDeny.SERVICE_UNAVAILABLE
+    con.onOpen()
+    assert closes == [
+        (con.CLOSE_STATUS_CODE_TRY_AGAIN_LATER, 'Not connected to the world.')
+    ]
+    assert gateway.connections == {}
+    assert con.session_id is None
+    sent = []
+    gateway.link = SimpleNamespace(sendString=sent.append)
+    assert con.onConnect(request) is None
+    con.transport = StringTransport()
+    con.onOpen()
+    assert gateway.connections == {con.session_id: con}
+    assert unpack_message(sent.pop()) == (
+        OPEN, con.session_id, b'192.168.1.1:54321'
+    )
+
+
+def test_invalid_frames():
+    gateway = Gateway(4000)
+    client = GatewayClient()
+    client.factory = SimpleNamespace(gateway=gateway)
+    sent = []
+    con = GatewayConnection()
+    con.sendMessage = lambda payload, isBinary=False: sent.append(payload)
+    gateway.connections[1] = con
+    client.stringReceived(b'\x0a')
+    client.stringReceived(pack_message(OUTPUT, 1, b'\xff'))
+    assert sent == []
+    client.stringReceived(pack_message(OUTPUT, 1, encode_frame('message')))
+    assert len(sent) == 1
+
+
+def test_accept_compression():
+    offer = PerMessageDeflateOffer(request_max_window_bits=10)
+    assert accept_compression([]) is None
+    accept = accept_compression(
+        [offer], window_bits=12, mem_level=5, no_context_takeover=True
+    )
+    assert accept.window_bits == 10
+    assert accept.mem_level == 5
+    assert accept.no_context_takeover is True
+
+
+def test_compression_arguments():
+    args = parser.parse_args(
+        [
+            '4000', '--compression', '--window-bits', '11', '--mem-level',
+            '4', '--no-context-takeover'
+        ]
+    )
+    assert args.compression is True
+    assert args.window_bits == 11
+    assert args.mem_level == 4
+    assert args.no_context_takeover is True
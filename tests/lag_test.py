@@ -0,0 +1,109 @@
+from threading import Event, Thread
+
+from pytest import approx, fixture
+from twisted.internet.task import Clock
+
+from mudmaker.ext.admin_parser import do_lag
+from mudmaker.scheduler import Scheduler
+
+
+@fixture(name='clock')
+def get_clock(game):
+    clock = Clock()
+    game.scheduler = Scheduler(clock=clock)
+    game.lag_monitor.start(thread=False)
+    return clock
+
+
+def test_stall(game, clock, player, connection):
+    m = game.lag_monitor
+    with m.doing('command', 'l', con=connection):
+        clock.rightNow = 0.2
+        m.check()
+        assert m.count == 0
+        clock.rightNow = 1.0
+        m.check()
+        assert m.count == 1
+        clock.rightNow = 1.5
+        m.check()
+        assert m.count == 1
+    assert m.current is None
+    stall, = m.stalls
+    assert stall.duration == approx(1.4)
+    assert not stall.finished
+    assert stall.activities == [
+        'command l from %s:%d (%s)' % (
+            connection.host, connection.port, player
+        )
+    ]
+    assert 'test_stall' in ''.join(stall.stack)
+    clock.advance(0)
+    assert stall.finished
+    assert m.stall is None
+    assert m.lag == approx(1.4)
+    assert m.max_lag == approx(1.4)
+    clock.advance(0.1)
+    assert m.lag == approx(0)
+    m.check()
+    assert m.count == 1
+
+
+def test_nested(game, clock):
+    m = game.lag_monitor
+
+    def slow_task():
+        with m.doing('save', 'game.yaml'):
+            clock.rightNow += 1
+            m.check()
+
+    task = game.task(60)(slow_task)
+    stall, = m.stalls
+    assert stall.activities == [
+        'save game.yaml', f'task slow_task (#{task.id})'
+    ]
+
+
+def test_do_lag(game, clock, player, connection):
+    m = game.lag_monitor
+    clock.rightNow = 1.0
+    m.check()
+    clock.advance(0)
+    do_lag(player=player, game=game)
+    assert connection.messages[-2].startswith('Lag: 900.0 ms')
+    assert connection.messages[-1].endswith(
+        'for 0.900 seconds, running nothing.'
+    )
+    do_lag(player=player, game=game, number=1)
+    assert 'test_do_lag' in '\n'.join(connection.messages)
+    do_lag(player=player, game=game, number=2)
+    assert connection.last_message == 'There is no stall 2.'
+    do_lag(player=player, game=game, action='clear')
+    assert not m.stalls
+    assert m.count == 1
+
+
+def test_metrics(game, clock):
+    clock.rightNow = 1.0
+    game.lag_monitor.check()
+    assert 'mudmaker_reactor_stalls_total 1\n' in game.metrics.render()
+
+
+def test_watch_errors(game, clock, monkeypatch):
+    m = game.lag_monitor
+    game.lag_threshold = 0.002
+    checked = Event()
+    calls = []
+
+    def check():
+        calls.append(None)
+        if len(calls) == 1:
+            raise RuntimeError('Fail.')
+        checked.set()
+
+    monkeypatch.setattr(m, 'check', check)
+    thread = Thread(target=m.watch)
+    thread.start()
+    assert checked.wait(5)
+    m.stop()
+    thread.join(5)
+    assert not thread.is_alive()
@@ -0,0 +1,39 @@
+from mudmaker.loadtest import (
+    build_world, parser, percentile, socials, world_command
+)
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    values = list(range(100))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 99
+
+
+def test_build_world(game):
+    rooms = build_world(game, 3)
+    assert len(rooms) == 9
+    assert len(game.rooms) == 9
+    # Each of the 12 connections between rooms has an exit in both directions.
+    assert len(game.exits) == 24
+    for room in rooms:
+        for x in room.exits:
+            assert x.other_side is not None
+    assert sorted(socials) == sorted(game.socials)
+    for social in list(game.socials.values()):
+        social.delete()
+
+
+def test_world_command():
+    args = parser.parse_args(
+        ['--port', '5000', '--rooms', '4', '--lag-interval', '0.2']
+    )
+    command = world_command(args, '/tmp/world')
+    assert command[1:3] == ['-m', 'mudmaker.loadtest']
+    world_args = parser.parse_args(command[3:])
+    assert world_args.world is True
+    assert world_args.directory == '/tmp/world'
+    assert world_args.port == 5000
+    assert world_args.rooms == 4
+    assert world_args.lag_interval == 0.2
@@ -0,0 +1,108 @@
+from pytest import approx
+from twisted.internet.address import IPv4Address
+from twisted.internet.task import Clock
+from twisted.web.test.requesthelper import DummyRequest
+
+from mudmaker.metrics import Counter, Histogram, Registry, format_sample
+from mudmaker.scheduler import Scheduler
+
+
+def test_format_sample():
+    assert format_sample('test', {}, 5) == 'test 5'
+    assert format_sample('test', dict(a='b"\n'), 0.5) == \
+        'test{a="b\\"\\n"} 0.5'
+
+
+def test_counter():
+    c = Counter('test_total', 'Testing.', labels=('name',))
+    c.inc(1, 'first')
+    c.inc(2, 'first')
+    c.inc(1, 'second')
+    assert list(c.samples()) == [
+        ('test_total', dict(name='first'), 3),
+        ('test_total', dict(name='second'), 1)
+    ]
+
+
+def test_histogram():
+    h = Histogram('test_seconds', 'Testing.', buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5):
+        h.observe(value)
+    samples = {
+        (name, labels.get('le')): value for name, labels, value in h.samples()
+    }
+    assert samples == {
+        ('test_seconds_bucket', '0.1'): 2,
+        ('test_seconds_bucket', '1.0'): 3,
+        ('test_seconds_bucket', '+Inf'): 4,
+        ('test_seconds_sum', None): approx(5.65),
+        ('test_seconds_count', None): 4
+    }
+
+
+def test_render():
+    r = Registry()
+    r.counter('test_total', 'Testing.').inc()
+    r.callback('test_things', 'Things.', 'gauge', lambda: [('', {}, 3)])
+    assert r.render() == '''# HELP test_total Testing.
+# TYPE test_total counter
+test_total 1
+# HELP test_things Things.
+# TYPE test_things gauge
+test_things 3
+'''
+
+
+def test_commands(game, connection, player):
+    connection.handle_string('l')
+    connection.handle_string('nothing like a command')
+    counts = {
+        labels['command']: value for name, labels, value in
+        game.metrics.commands.samples() if name.endswith('_count')
+    }
+    assert counts == dict(look=1, unknown=1)
+
+
+def test_bytes_sent(game, connection, monkeypatch):
+    monkeypatch.setattr(connection, 'transmit', lambda payload: None)
+    connection.write_frame(b'hello')
+    connection.write_frame(b'world!')
+    assert game.metrics.bytes_sent.values[()] == 11
+    assert game.metrics.frames_sent.values[()] == 2
+
+
+def test_reactor_lag(game):
+    clock = Clock()
+    game.scheduler = Scheduler(clock=clock)
+    game.scheduler.observe_lag = game.metrics.reactor_lag.observe
+    game.scheduler.call_later(1, lambda: None)
+    clock.advance(1.5)
+    assert game.scheduler.lag == approx(1.4)
+    assert game.metrics.reactor_lag.values[()][1] == approx(1.4)
+
+
+def test_metrics_page(game, room, obj):
+    request = DummyRequest([b''])
+    assert game.on_metrics_page(request) == b'Forbidden.'
+    assert request.responseCode == 403
+    request = DummyRequest([b''])
+    request.client = IPv4Address('TCP', '127.0.0.1', 1234)
+    text = game.on_metrics_page(request).decode()
+    assert request.responseHeaders.getRawHeaders(b'content-type') == [
+        b'text/plain; version=0.0.4'
+    ]
+    assert 'mudmaker_objects{kind="rooms"} 1\n' in text
+    assert 'mudmaker_objects{kind="objects"} 1\n' in text
+
+
+def test_metrics_token(game):
+    game.metrics_token = 'secret'
+    request = DummyRequest([b''])
+    request.requestHeaders.addRawHeader(b'authorization', b'Bearer wrong')
+    assert game.on_metrics_page(request) == b'Forbidden.'
+    request = DummyRequest([b''])
+    request.requestHeaders.addRawHeader(b'authorization', b'Bearer secret')
+    assert game.on_metrics_page(request).startswith(b'# HELP')
+    request = DummyRequest([b''])
+    request.args[b'token'] = [b'secret']
+    assert game.on_metrics_page(request).startswith(b'# HELP')
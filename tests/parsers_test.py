@@ -0,0 +1,134 @@
+from commandlet import Parser
+from commandlet.exc import CommandFailedError
+from pytest import raises
+
+from mudmaker.parsers import index_key, MudMakerParser
+
+
+def test_index_key():
+    assert index_key('look') == ('word', 'look')
+    assert index_key('look <object:thing>') == ('word', 'look')
+    assert index_key(r'\?') == ('word', '?')
+    assert index_key('"<string>') == ('char', '"')
+    assert index_key('<word:username>') is None
+    assert index_key('a|b') is None
+    for char in 'dDsSwWbB':
+        assert index_key('\\%s<string>' % char) is None
+    assert index_key(r'\.<string>') == ('char', '.')
+
+
+def make_parser(cls):
+    p = cls()
+    calls = []
+
+    @p.command('first', 'test', 'test <string>')
+    def first(string=None):
+        calls.append(('first', string))
+
+    @p.command('catchall', '<string>')
+    def catchall(string):
+        calls.append(('catchall', string))
+
+    @p.command('bang', '!<string>')
+    def bang(string):
+        calls.append(('bang', string))
+
+    return p, calls
+
+
+def test_same_results():
+    plain, plain_calls = make_parser(Parser)
+    indexed, indexed_calls = make_parser(MudMakerParser)
+    for string in ('test', 'test this', '!test', 'other', 'testing'):
+        plain.handle_command(string)
+        indexed.handle_command(string)
+    assert indexed_calls == plain_calls
+    assert indexed_calls[-1] == ('catchall', 'testing')
+
+
+def test_candidates():
+    p, calls = make_parser(MudMakerParser)
+    assert [cmd.name for cmd in p.get_candidates('test')] == [
+        'first', 'first', 'catchall'
+    ]
+    assert [cmd.name for cmd in p.get_candidates('!x')] == [
+        'catchall', 'bang'
+    ]
+
+
+def test_rebuild():
+    p = MudMakerParser()
+    with raises(CommandFailedError):
+        p.handle_command('hello')
+
+    @p.command('hello')
+    def hello():
+        return 'Hello.'
+
+    assert p.handle_command('hello') == 'Hello.'
+    p.commands = []
+    with raises(CommandFailedError):
+        p.handle_command('hello')
+
+
+def test_layers():
+    main = MudMakerParser()
+    main.filter('thing')(lambda text: text.upper())
+    builder = main.layer()
+    admin = builder.layer()
+    assert admin.layers == [main, builder, admin]
+
+    @builder.command('build', 'build <thing:what>')
+    def build(what):
+        return what
+
+    assert admin.handle_command('build it') == 'IT'
+    with raises(CommandFailedError):
+        main.handle_command('build it')
+
+    @main.command('look')
+    def look():
+        return 'Looking.'
+
+    assert admin.handle_command('look') == 'Looking.'
+    assert builder.commands == [admin.all_commands[1]]
+
+
+def test_help():
+    p = MudMakerParser()
+
+    @p.command('first')
+    def first():
+        """The first command."""
+
+    lines = p.get_help()
+    assert lines == ['first:', 'first.', 'The first command.']
+    assert p.get_help() is lines
+    layer = p.layer()
+
+    @layer.command('second', 'second', r'\?')
+    def second():
+        pass
+
+    assert layer.get_help() == lines + [
+        'second:', 'second, ?.', 'No description available.'
+    ]
+    assert p.get_help() is lines
+
+
+def test_context_keys():
+    p = MudMakerParser()
+
+    @p.command('greet', 'greet <word:name>')
+    def greet(con, name):
+        return (con, name)
+
+    cmd = p.commands[0]
+    assert p.context_keys(cmd) == ('con',)
+
+    class Context(dict):
+        def __getitem__(self, name):
+            assert name == 'con'
+            return super().__getitem__(name)
+
+    assert p.dispatch('greet you', Context(con=1, player=2)) == (1, 'you')
@@ -0,0 +1,39 @@
+import os.path
+from pstats import Stats
+
+from twisted.internet.task import Clock
+
+from mudmaker.profiler import format_function, ProfileWindow
+from mudmaker.scheduler import Scheduler
+
+
+def busy():
+    return sum(i * i for i in range(10000))
+
+
+def test_format_function():
+    assert format_function(('~', 0, '<built-in method len>')) == (
+        '<built-in method len>'
+    )
+    assert format_function(('/a/b/game.py', 12, 'run')) == 'game.py:12 run'
+
+
+def test_window(game, tmpdir):
+    clock = Clock()
+    game.scheduler = Scheduler(clock=clock)
+    game.profile_path = str(tmpdir.join('profiles'))
+    windows = []
+    w = ProfileWindow(game, 5, windows.append)
+    w.start()
+    assert game.profile_window is w
+    busy()
+    clock.advance(5)
+    assert windows == [w]
+    assert game.profile_window is None
+    assert os.path.isfile(w.filename)
+    assert w.filename.endswith('.pstats')
+    assert isinstance(Stats(w.filename), Stats)
+    names = [row[0] for row in w.top('cumulative', 50)]
+    assert any(name.endswith(' busy') for name in names)
+    internal = [row[2] for row in w.top('internal', 5)]
+    assert internal == sorted(internal, reverse=True)
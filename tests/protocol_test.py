@@ -0,0 +1,63 @@
+from json import dumps
+
+from pytest import raises
+
+from mudmaker.exc import ProtocolError
+from mudmaker.protocol import (
+    binary_protocol, decode_frame, encode_frame, json_protocol, opcodes
+)
+
+
+def test_encode():
+    data = encode_frame('message', 'Hello')
+    assert data[0] == opcodes['message']
+    assert data[1:5] == b'\x00\x00\x00\x05'
+    assert data[5:] == b'Hello'
+    assert encode_frame('ping') == bytes((opcodes['ping'],))
+
+
+def test_round_trip():
+    for name, args in (
+        ('message', ['Caf\xe9 ☺']),
+        ('title', ['']),
+        ('ping', []),
+        ('inputText', ['multiple\nlines'])
+    ):
+        assert decode_frame(encode_frame(name, *args)) == (name, args)
+
+
+def test_json_fallback():
+    data = encode_frame('unknown', 1, 'two')
+    assert data[0] == opcodes['json']
+    assert decode_frame(data) == ('unknown', [1, 'two'])
+    data = encode_frame('message', 5)
+    assert data[0] == opcodes['json']
+    assert data[5:] == dumps(dict(name='message', args=[5])).encode()
+
+
+def test_malformed():
+    with raises(ProtocolError):
+        decode_frame(b'')
+    with raises(ProtocolError):
+        decode_frame(b'\xff')
+    with raises(ProtocolError):
+        decode_frame(encode_frame('message', 'Hello')[:-1])
+    with raises(ProtocolError):
+        decode_frame(b'\x01\x00\x00')
+
+
+class PretendRequest:
+    def __init__(self, *protocols):
+        self.protocols = list(protocols)
+
+
+def test_negotiate(connection, game):
+    assert connection.binary is False
+    assert game.binary_protocol is False
+    request = PretendRequest(binary_protocol, json_protocol)
+    assert connection.onConnect(PretendRequest()) is None
+    assert connection.onConnect(request) == json_protocol
+    assert connection.binary is False
+    game.binary_protocol = True
+    assert connection.onConnect(request) == binary_protocol
+    assert connection.binary is True
@@ -0,0 +1,30 @@
+from mudmaker.ratelimit import TokenBucket
+
+
+def test_init():
+    b = TokenBucket(2, 5)
+    assert b.rate == 2
+    assert b.burst == 5
+    assert b.tokens == 5.0
+    assert b.allowed == 0
+    assert b.limited == 0
+
+
+def test_take():
+    b = TokenBucket(2, 3)
+    now = b.stamp
+    for x in range(3):
+        assert b.available(now=now)
+        b.take()
+    assert not b.available(now=now)
+    assert b.allowed == 3
+    assert b.delay() == 0.5
+    assert b.available(now=now + 0.5)
+    assert b.delay() == 0.0
+
+
+def test_refill():
+    b = TokenBucket(1, 2)
+    b.tokens = 0.0
+    b.refill(now=b.stamp + 100)
+    assert b.tokens == 2
@@ -1,4 +1,4 @@
-from mudmaker import Room, Exit
+from mudmaker import Exit, Object, Room
 
 
 def test_init(game, room):
@@ -39,3 +39,26 @@ def test_coordinates(room):
     assert room.x == 5
     assert room.y == 6
     assert room.z == 7
+
+
+def listen(game, room, name):
+    """Make an object in room which records its messages."""
+    o = game.make_object('Object', (Object,), name=name, location=room)
+    o.messages = []
+    o.message = o.messages.append
+    return o
+
+
+def test_deliver_socials(game, room):
+    actor = listen(game, room, 'Actor')
+    observer = listen(game, room, 'Observer')
+    outside = listen(game, None, 'Outside')
+    room.deliver_socials(
+        [
+            ('%1N wave%1s at %2n.', [actor, outside]),
+            ('%1N smile%1s.', [outside])
+        ]
+    )
+    assert actor.messages == ['You wave at Outside.', 'Outside smiles.']
+    assert observer.messages == ['Actor waves at Outside.', 'Outside smiles.']
+    assert outside.messages == []
@@ -0,0 +1,130 @@
+from twisted.internet.task import Clock
+
+from mudmaker.scheduler import Job, Scheduler
+
+
+def make_scheduler(**kwargs):
+    clock = Clock()
+    return clock, Scheduler(clock=clock, **kwargs)
+
+
+def test_init():
+    clock, s = make_scheduler()
+    assert s.clock is clock
+    assert s.tick == 0
+    assert s.pending == 0
+    assert len(s.wheels) == 4
+    assert all(len(wheel) == 256 for wheel in s.wheels)
+    assert clock.getDelayedCalls() == []
+
+
+def test_call_later():
+    clock, s = make_scheduler()
+    calls = []
+    j = s.call_later(1, lambda: calls.append(s.tick))
+    assert isinstance(j, Job)
+    assert j.interval is None
+    assert j.due == 10
+    assert s.pending == 1
+    assert len(clock.getDelayedCalls()) == 1
+    clock.advance(0.9)
+    assert calls == []
+    clock.advance(0.1)
+    assert calls == [10]
+    assert j.active is False
+    assert s.pending == 0
+    assert clock.getDelayedCalls() == []
+
+
+def test_call_every():
+    clock, s = make_scheduler()
+    calls = []
+    j = s.call_every(0.5, lambda: calls.append(s.tick), delay=0)
+    assert j.due == 1
+    clock.pump([0.1] * 11)
+    assert calls == [1, 6, 11]
+    j.cancel()
+    assert j.active is False
+    assert s.pending == 0
+    clock.pump([0.1] * 10)
+    assert calls == [1, 6, 11]
+    assert clock.getDelayedCalls() == []
+
+
+def test_cancel_before_run():
+    clock, s = make_scheduler()
+    calls = []
+    first = s.call_later(1, lambda: second.cancel())
+    second = s.call_later(1, lambda: calls.append(True))
+    assert first.due == second.due
+    clock.advance(1)
+    assert calls == []
+    assert s.pending == 0
+
+
+def test_levels():
+    clock, s = make_scheduler(bits=2, levels=2, resolution=1)
+    calls = []
+    delays = [1, 3, 4, 5, 15, 16, 17, 40, 100]
+    for delay in delays:
+        s.call_later(delay, lambda: calls.append(s.tick))
+    assert len(s.overflow) == 4
+    clock.pump([1] * 100)
+    assert calls == delays
+    assert s.pending == 0
+
+
+def test_catch_up():
+    clock, s = make_scheduler()
+    calls = []
+    s.call_every(1, lambda: calls.append(s.tick))
+    s.call_later(3, lambda: calls.append('later'))
+    clock.advance(5)
+    # Missed runs are skipped, like LoopingCall.
+    assert calls == [10, 'later']
+    clock.advance(1)
+    assert calls == [10, 'later', 60]
+
+
+def test_idle():
+    clock, s = make_scheduler()
+    s.call_later(0.1, lambda: None)
+    clock.advance(0.1)
+    assert clock.getDelayedCalls() == []
+    clock.advance(100)
+    calls = []
+    j = s.call_later(1, lambda: calls.append(s.tick))
+    assert j.due == 1011
+    clock.advance(1)
+    assert calls == [1011]
+
+
+def test_errors():
+    clock, s = make_scheduler()
+    calls = []
+
+    def fail():
+        calls.append('fail')
+        raise RuntimeError()
+
+    bad = s.call_every(0.1, fail)
+    good = s.call_every(0.1, lambda: calls.append('good'))
+    clock.pump([0.1] * 2)
+    assert calls == ['fail', 'good', 'good']
+    assert bad.active is False
+    assert good.active is True
+
+
+def test_many():
+    clock, s = make_scheduler(resolution=1)
+    calls = []
+    jobs = [
+        s.call_every(1 + i % 10, lambda: calls.append(None))
+        for i in range(10000)
+    ]
+    for job in jobs[::2]:
+        job.cancel()
+    assert s.pending == 5000
+    assert len(clock.getDelayedCalls()) == 1
+    clock.pump([1] * 10)
+    assert len(calls) == sum(10 // (1 + i % 10) for i in range(1, 10000, 2))
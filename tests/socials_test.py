@@ -1,7 +1,11 @@
-from functools import partial
+from emote_utils import (
+    NoObjectError, NoSuffixError, PopulatedSocialsFactory
+)
+from pytest import raises
 
+from mudmaker import Object
 from mudmaker.parsers import main_parser
-from mudmaker.socials import Social
+from mudmaker.socials import CachingSocialsFactory, Social
 
 
 def test_socials_factory(game, socials):
@@ -26,22 +30,9 @@ def test_social(game, socials):
         any_target=third
     )
     assert isinstance(s, Social)
+    assert game.socials[name] is s
     for cmd in main_parser.commands:
-        if cmd.name == name:
-            f = cmd.func
-            p = f.func
-            assert isinstance(p, partial)
-            if cmd.usage == s.name:
-                assert p.func == s.use_nothing
-                assert f.args == ['player']
-                assert p.__doc__ == f'{s.name}.'
-            else:
-                assert p.func == s.use_target
-                assert f.args == ['player', 'target']
-                assert p.__doc__ == f'{s.name} at someone or something.'
-            break
-    else:
-        raise RuntimeError('Command not found.')
+        assert cmd.name != name
     assert s.no_target == first
     assert s.self_target == second
     assert s.any_target == third
@@ -55,4 +46,70 @@ def test_delete(game):
     length = len(main_parser.commands)
     s.delete()
     assert s.name not in game.socials
-    assert len(main_parser.commands) == (length - 2)
+    assert len(main_parser.commands) == length
+
+
+def test_dispatch(game, player, connection):
+    s = game.make_object(
+        'Social', (Social,), name='grin', no_target='%1N grin%1s.',
+        self_target='%1N grin%1s sheepishly.', any_target='%1N grin%1s at %2n.'
+    )
+    connection.handle_string('grin')
+    assert connection.last_message == 'You grin.'
+    connection.handle_string(f'grin {player.name}')
+    assert connection.last_message == 'You grin sheepishly.'
+    connection.handle_string('grin nobody')
+    assert connection.last_message == 'I don\'t see "nobody" here.'
+    connection.handle_string('help')
+    assert connection.messages[-2:] == ['Socials:', 'grin.']
+    s.delete()
+    connection.handle_string('grin')
+    assert connection.last_message == 'No command found.'
+
+
+def test_no_target(game, player, connection):
+    s = game.make_object(
+        'Social', (Social,), name='missing', no_target='%1N miss%1es.',
+        self_target='%1N miss%1es %1n.', any_target='%1N miss%1es %2n.'
+    )
+    connection.handle_string('missing nobody')
+    assert connection.last_message == 'I don\'t see "nobody" here.'
+    messages = len(connection.messages)
+    s.use_target(player, None)
+    assert len(connection.messages) == messages
+    s.delete()
+
+
+def test_compiled(game, obj, socials):
+    other = game.make_object('Object', (Object,), name='Other')
+    plain = PopulatedSocialsFactory()
+    plain.suffixes.update(socials.suffixes)
+    for string in (
+        '%1N smile%1s at %2n.', '%N %1are %2Ss friend. 100%%!',
+        '%2N wave%2s|upper at %1, saying "{text}".', '%1n|title.'
+    ):
+        for perspectives in ([obj, other], [other, obj]):
+            assert socials.get_strings(
+                string, perspectives, text='hi'
+            ) == plain.get_strings(string, perspectives, text='hi')
+    with raises(NoObjectError):
+        socials.get_strings('%3n', [obj, other])
+    with raises(NoSuffixError):
+        socials.get_strings('%1nonsense', [obj])
+
+
+def test_cache(obj):
+    f = CachingSocialsFactory(cache_size=2)
+    f.get_strings('%1Are smile%1s.', [obj])
+    f.get_strings('%1Are smile%1s.', [obj])
+    assert f.hits == 1
+    assert f.misses == 1
+    f.get_strings('%1Are nod%1s.', [obj])
+    f.get_strings('%1Are smile%1s.', [obj])
+    f.get_strings('%1Are wave%1s.', [obj])
+    assert list(f.cache) == ['%1Are smile%1s.', '%1Are wave%1s.']
+    assert f.cache_stats() == dict(
+        size=2, cache_size=2, hits=2, misses=3, evictions=1, hit_rate=0.4
+    )
+    f.clear_cache()
+    assert f.cache_stats()['hit_rate'] is None
@@ -0,0 +1,77 @@
+import gzip
+
+from pytest import fixture
+from twisted.web.test.requesthelper import DummyRequest
+
+from mudmaker.static import accepted_encodings, StaticResource
+
+script = b'console.log("Hello world.");\n' * 100
+
+
+@fixture(name='static')
+def get_static(tmpdir):
+    tmpdir.join('main.js').write_binary(script)
+    tmpdir.join('index.html').write_binary(b'<p>Hello</p>')
+    s = StaticResource(str(tmpdir), max_age=60)
+    s.load()
+    return s
+
+
+def get(static, path, **headers):
+    request = DummyRequest(path.encode().split(b'/'))
+    for name, value in headers.items():
+        request.requestHeaders.setRawHeaders(name.replace('_', '-'), [value])
+    return request, static.render_GET(request)
+
+
+def test_load(static):
+    assert sorted(static.assets) == ['index.html', 'main.js']
+    asset = static.assets['main.js']
+    assert asset.data == script
+    assert 'gzip' in asset.encodings
+    assert static.assets['index.html'].encodings == {}
+
+
+def test_get(static):
+    request, body = get(static, 'main.js')
+    assert body == script
+    headers = request.responseHeaders
+    assert headers.getRawHeaders('etag') == [
+        static.assets['main.js'].get_etag()
+    ]
+    assert headers.getRawHeaders('cache-control') == ['public, max-age=60']
+    assert headers.getRawHeaders('content-encoding') is None
+    request, body = get(static, '')
+    assert body == b'<p>Hello</p>'
+
+
+def test_gzip(static):
+    request, body = get(static, 'main.js', accept_encoding='gzip, deflate')
+    assert gzip.decompress(body) == script
+    headers = request.responseHeaders
+    assert headers.getRawHeaders('content-encoding') == ['gzip']
+    assert headers.getRawHeaders('etag') == [
+        static.assets['main.js'].get_etag('gzip')
+    ]
+
+
+def test_not_modified(static):
+    etag = static.assets['main.js'].get_etag()
+    request, body = get(static, 'main.js', if_none_match=etag)
+    assert request.responseCode == 304
+    assert body == b''
+    request, body = get(static, 'main.js', if_none_match='"wrong"')
+    assert body == script
+
+
+def test_not_found(static):
+    request, body = get(static, 'nothing.js')
+    assert request.responseCode == 404
+    request = DummyRequest([b'\xff.js'])
+    static.render_GET(request)
+    assert request.responseCode == 404
+
+
+def test_accepted_encodings():
+    assert accepted_encodings('gzip, br;q=0.5') == {'gzip', 'br'}
+    assert accepted_encodings('gzip;q=0, identity') == {'identity'}
@@ -1,11 +1,18 @@
 from functools import partial
+from json import loads
+from queue import Queue
 
-from pytest import raises
+from pytest import approx, fixture, raises
+from twisted.internet.address import IPv4Address
 from twisted.internet.defer import Deferred
-from twisted.internet.task import LoopingCall
+from twisted.internet.task import Clock
+from twisted.web.test.requesthelper import DummyRequest
 
-from mudmaker import Task
-from mudmaker.exc import InvalidArgumentError
+from mudmaker import Task, tasks
+from mudmaker.exc import (
+    InvalidArgumentError, InvalidModeError, NotModuleLevelError
+)
+from mudmaker.scheduler import Job, Scheduler
 
 
 def test_init(game):
@@ -16,8 +23,11 @@ def test_init(game):
 
     assert isinstance(t, Task)
     assert isinstance(t.func, partial)
-    assert isinstance(t.loop, LoopingCall)
+    assert isinstance(t.job, Job)
+    assert t.job.interval == 150
     assert isinstance(t.deferred, Deferred)
+    assert game.tasks[t.id] is t
+    assert game.scheduler.pending >= 1
 
 
 def test_invalid_argument(game):
@@ -35,3 +45,197 @@ def test_start(game):
         task.works = True
 
     assert t.works is True
+
+
+def test_stop(game):
+
+    @game.task(15, now=False)
+    def t():
+        pass
+
+    results = []
+    t.deferred.addCallback(results.append)
+    assert t.running is True
+    t.stop()
+    assert t.running is False
+    assert t.job.active is False
+    assert results == [t]
+
+
+def test_error(game):
+
+    @game.task(15)
+    def t():
+        raise RuntimeError('Fail.')
+
+    assert t.running is False
+    assert t.job.active is False
+    assert t.deferred.called
+
+
+def test_stats(game):
+    clock = Clock()
+    game.scheduler = Scheduler(clock=clock)
+
+    @game.task(1, now=False)
+    def t():
+        pass
+
+    stats = t.stats()
+    assert stats['name'] == 't'
+    assert stats['runs'] == 0
+    assert stats['last'] is None
+    assert stats['interval'] == 1
+    clock.advance(1.5)
+    clock.advance(3)
+    stats = t.stats()
+    assert stats['runs'] == 2
+    assert stats['skipped'] == 2
+    assert stats['failures'] == 0
+    assert stats['lateness'] == approx(2.5)
+    assert stats['max_lateness'] == approx(2.5)
+    assert 0 <= stats['p50'] <= stats['p99']
+
+
+def test_stats_not_started(game):
+
+    def t():
+        pass
+
+    stats = Task(game, t).stats()
+    assert stats['running'] is False
+    assert stats['interval'] is None
+    assert stats['skipped'] is None
+
+
+def test_tasks_page(game):
+    game.task(15)(lambda: None)
+    request = DummyRequest([b''])
+    assert game.on_tasks_page(request) == b'Forbidden.'
+    assert request.responseCode == 403
+    request = DummyRequest([b''])
+    request.client = IPv4Address('TCP', '127.0.0.1', 1234)
+    tasks = loads(game.on_tasks_page(request))
+    assert [t['name'] for t in tasks] == ['<lambda>']
+    assert tasks[0]['runs'] == 1
+
+
+def test_invalid_mode(game):
+    with raises(InvalidModeError):
+        game.task(15, mode='fork')(lambda: None)
+
+
+def test_thread(game, monkeypatch):
+    calls = []
+
+    def defer(func, *args):
+        d = Deferred()
+        calls.append((func, args, d))
+        return d
+
+    monkeypatch.setattr(tasks, 'deferToThread', defer)
+    data = dict(names=['first'])
+    results = []
+
+    def analyse(snapshot):
+        return len(snapshot['names'])
+
+    t = game.task(
+        15, mode='thread', snapshot=lambda game: data,
+        on_result=results.append
+    )(analyse)
+    assert t.func is analyse
+    [(func, args, d)] = calls
+    assert func is analyse
+    assert args == (data,)
+    assert args[0] is not data
+    assert t.busy is True
+    t.run()
+    assert t.overlaps == 1
+    assert len(calls) == 1
+    d.callback(func(*args))
+    assert results == [1]
+    assert t.busy is False
+    t.run()
+    assert len(calls) == 2
+
+
+def test_thread_error(game, monkeypatch):
+    d = Deferred()
+    monkeypatch.setattr(tasks, 'deferToThread', lambda func: d)
+    t = game.task(15, mode='thread')(lambda: None)
+    d.errback(RuntimeError('Fail.'))
+    assert t.busy is False
+    assert t.failures == 1
+    assert t.running is False
+
+
+def test_stopped(game, monkeypatch):
+    d = Deferred()
+    monkeypatch.setattr(tasks, 'deferToThread', lambda func: d)
+    results = []
+    t = game.task(15, mode='thread', on_result=results.append)(
+        lambda: None
+    )
+    t.stop()
+    d.callback(5)
+    assert results == []
+    assert t.busy is False
+    assert t.failures == 0
+
+
+def count_names(names):
+    return len(names)
+
+
+def explode():
+    raise RuntimeError('Fail.')
+
+
+@fixture(name='pool_reactor')
+def get_pool_reactor(monkeypatch):
+    """Stand in for a running reactor, so results from a real process pool
+    can be delivered on this thread."""
+    calls = Queue()
+    triggers = []
+    monkeypatch.setattr(
+        tasks.reactor, 'callFromThread',
+        lambda func, *args: calls.put(partial(func, *args))
+    )
+    monkeypatch.setattr(
+        tasks.reactor, 'addSystemEventTrigger',
+        lambda phase, event, func: triggers.append((phase, event, func))
+    )
+    return calls, triggers
+
+
+def test_process(game, pool_reactor, monkeypatch):
+    calls, triggers = pool_reactor
+    results = []
+    t = game.task(
+        15, mode='process', snapshot=lambda game: ['first', 'second'],
+        on_result=results.append
+    )(count_names)
+    # As if count_names had been decorated at module level.
+    monkeypatch.setitem(globals(), 'count_names', t)
+    calls.get(timeout=30)()
+    assert results == [2]
+    assert t.failures == 0
+    assert t.busy is False
+    assert t.running is True
+    e = game.task(15, mode='process', now=False)(explode)
+    monkeypatch.setitem(globals(), 'explode', e)
+    e.run()
+    calls.get(timeout=30)()
+    assert e.failures == 1
+    assert e.running is False
+    [(phase, event, shutdown)] = triggers
+    assert (phase, event) == ('before', 'shutdown')
+    shutdown()
+    with raises(RuntimeError):
+        game.process_pool.submit(len, [])
+
+
+def test_not_module_level(game):
+    with raises(NotModuleLevelError):
+        game.task(15, mode='process')(lambda: None)
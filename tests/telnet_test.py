@@ -0,0 +1,142 @@
+import zlib
+
+from pytest import fixture, raises
+from twisted.conch.telnet import DO, DONT, ECHO, IAC, SB, SE, WILL, WONT
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+
+from mudmaker import TelnetConnection
+from mudmaker.sessions import Session
+from mudmaker.telnet import COMPRESS2, GMCP, TIMING_MARK, TelnetFactory
+
+
+@fixture(name='telnet')
+def get_telnet(game):
+    factory = TelnetFactory(game)
+    address = IPv4Address('TCP', '127.0.0.1', 4321)
+    con = factory.buildProtocol(address)
+    con.makeConnection(StringTransport(peerAddress=address))
+    yield con
+    if con in game.connections:
+        game.connections.remove(con)
+
+
+def test_connect(telnet, game):
+    assert isinstance(telnet, TelnetConnection)
+    assert telnet in game.connections
+    assert telnet.transport.producer is telnet
+    output = telnet.transport.value()
+    assert IAC + WILL + COMPRESS2 in output
+    assert IAC + WILL + GMCP in output
+    assert game.welcome_msg.encode() + b'\r\n' in output
+
+
+def test_commands(telnet):
+    telnet.transport.clear()
+    telnet.dataReceived(b'@host\r\n')
+    assert telnet.transport.value() == (
+        b'You are connected from 127.0.0.1:4321.\r\n'
+    )
+    telnet.transport.clear()
+    telnet.dataReceived(b'@ho')
+    assert telnet.transport.value() == b''
+    telnet.dataReceived(b'st\r\n')
+    assert b'127.0.0.1:4321' in telnet.transport.value()
+
+
+def test_password(telnet):
+    telnet.transport.clear()
+    telnet.get_password('Password:')
+    assert telnet.transport.value() == IAC + WILL + ECHO + b'Password:\r\n'
+
+
+def test_gmcp(telnet):
+    telnet.dataReceived(IAC + DO + GMCP)
+    assert telnet.gmcp is True
+    telnet.transport.clear()
+    telnet.set_title('New Title')
+    assert telnet.transport.value() == (
+        IAC + SB + GMCP + b'Client.Title "New Title"' + IAC + SE
+    )
+    telnet.dataReceived(IAC + DONT + GMCP)
+    assert telnet.gmcp is False
+
+
+def test_mccp(telnet):
+    telnet.transport.clear()
+    telnet.dataReceived(IAC + DO + COMPRESS2)
+    start = IAC + SB + COMPRESS2 + IAC + SE
+    assert telnet.transport.value() == start
+    assert telnet.compressor is not None
+    telnet.dataReceived(IAC + DONT + COMPRESS2)
+    assert telnet.compressor is None
+    telnet.transport.clear()
+    # Asked for without an offer, WILL has to come before the compression.
+    telnet.dataReceived(IAC + DO + COMPRESS2)
+    assert telnet.transport.value() == IAC + WILL + COMPRESS2 + start
+    assert telnet.compressor is not None
+    telnet.transport.clear()
+    for x in range(10):
+        telnet.message('This is a repetitive message.')
+    data = telnet.transport.value()
+    assert zlib.decompressobj().decompress(data) == (
+        b'This is a repetitive message.\r\n' * 10
+    )
+    stats = telnet.network_stats()
+    assert stats['compression'] is True
+    assert stats['ratio'] < 1
+
+
+def test_keepalive(telnet, game):
+    telnet.last_seen -= game.keepalive_interval
+    telnet.transport.clear()
+    game.reap_task()
+    assert telnet.transport.value() == IAC + DO + TIMING_MARK
+    assert telnet.keepalive_sent is not None
+    telnet.dataReceived(IAC + WILL + TIMING_MARK)
+    assert telnet.keepalive_sent is None
+    assert telnet.rtt is not None
+    assert telnet in game.connections
+
+
+def test_ping_and_keepalive(telnet, game):
+    telnet.dataReceived(IAC + DONT + GMCP)
+    telnet.dataReceived(b'@ping\r\n')
+    telnet.last_seen -= game.keepalive_interval
+    game.reap_task()
+    telnet.transport.clear()
+    telnet.dataReceived(IAC + WONT + TIMING_MARK)
+    assert telnet.ping_time is None
+    assert b'Lag amount:' in telnet.transport.value()
+    assert telnet.keepalive_sent is not None
+    telnet.dataReceived(b'@ping\r\n')
+    telnet.transport.clear()
+    telnet.dataReceived(IAC + WILL + TIMING_MARK)
+    assert telnet.keepalive_sent is None
+    assert telnet.ping_time is not None
+    assert telnet.transport.value() == b''
+
+
+def test_keepalive_timeout(telnet, game):
+    telnet.keepalive_sent = telnet.last_seen - game.keepalive_timeout - 1
+    game.reap_task()
+    assert telnet.transport.disconnecting is True
+
+
+def test_login_timeout(telnet, game):
+    telnet.last_active -= game.login_timeout + 1
+    telnet.transport.clear()
+    game.reap_task()
+    assert telnet.transport.value() == game.idle_msg.encode() + b'\r\n'
+    assert telnet.transport.disconnecting is True
+
+
+def test_abstract_session():
+
+    class IncompleteSession(Session):
+        def encode(self, name, *args):
+            return name.encode()
+
+    with raises(TypeError) as e:
+        IncompleteSession()
+    assert 'transmit' in str(e.value)
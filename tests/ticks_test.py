@@ -0,0 +1,93 @@
+from mudmaker import Zone
+from mudmaker.ticks import TickHandler, Ticker
+
+
+def test_init(game):
+    assert isinstance(game.ticker, Ticker)
+    assert game.ticker.game is game
+    assert game.ticker.ticks == 0
+
+
+def test_register(game, zone):
+    calls = []
+    h = zone.on_tick()(calls.append)
+    assert isinstance(h, TickHandler)
+    assert h.zone is zone
+    assert h.catch_up is True
+    assert game.ticker.handlers == {zone.id: {h.id: h}}
+    h.cancel()
+    assert game.ticker.handlers == {}
+
+
+def test_sleeping(game, zone, room, player):
+    player.location = None
+    calls = []
+    zone.on_tick()(calls.append)
+    game.ticker.tick()
+    assert calls == []
+    player.location = room
+    game.ticker.tick()
+    assert calls == [2]
+    game.ticker.tick()
+    assert calls == [2, 1]
+
+
+def test_linger(game, zone, room, player):
+    game.tick_linger = 2
+    calls = []
+    skipped = []
+    zone.on_tick()(calls.append)
+    zone.on_tick(catch_up=False)(skipped.append)
+    player.location = room
+    game.ticker.tick()
+    player.location = None
+    for i in range(5):
+        game.ticker.tick()
+    assert calls == [1, 1, 1]
+    player.location = room
+    game.ticker.tick()
+    assert calls == [1, 1, 1, 4]
+    assert skipped == [1, 1, 1, 1]
+    game.tick_max_catch_up = 2
+    player.location = None
+    for i in range(10):
+        game.ticker.tick()
+    player.location = room
+    game.ticker.tick()
+    assert calls[-1] == 2
+
+
+def test_budget(game, zone, room, player):
+    game.tick_budget = 0
+    calls = []
+    for i in range(3):
+        zone.on_tick()(lambda ticks, i=i: calls.append((i, ticks)))
+    player.location = room
+    game.ticker.tick()
+    assert calls == [(0, 1)]
+    assert game.ticker.carried == 2
+    game.ticker.tick()
+    game.ticker.tick()
+    assert calls == [(0, 1), (1, 2), (2, 3)]
+    game.ticker.tick()
+    assert calls[-1] == (0, 3)
+
+
+def test_errors(game, zone, room, player):
+    calls = []
+
+    @zone.on_tick()
+    def fail(ticks):
+        raise RuntimeError()
+
+    zone.on_tick()(calls.append)
+    player.location = room
+    game.ticker.tick()
+    assert calls == [1]
+
+
+def test_delete_zone(game):
+    zone = game.make_object('Zone', (Zone,), name='Doomed')
+    zone.on_tick()(print)
+    zone.delete()
+    assert game.ticker.handlers == {}
@@ -0,0 +1,142 @@
+from pytest import raises
+
+from mudmaker import Game, WebSocketConnection
+from mudmaker.exc import InvalidOutboundPolicyError
+
+
+def send(con, *args):
+    """Send using the real WebSocketConnection.send method."""
+    WebSocketConnection.send(con, *args)
+
+
+def capture(con):
+    frames = []
+    con.state = con.STATE_OPEN
+    con.sendMessage = lambda payload, isBinary=False: frames.append(payload)
+    return frames
+
+
+def test_producer(connection):
+    assert connection.transport.producer is connection
+    assert connection.paused is False
+
+
+def test_queue(connection):
+    frames = capture(connection)
+    send(connection, 'message', 'First')
+    assert len(frames) == 1
+    connection.pauseProducing()
+    send(connection, 'message', 'Second')
+    assert len(frames) == 1
+    assert len(connection.outbound) == 1
+    assert connection.outbound_bytes == len(connection.outbound[0])
+    connection.resumeProducing()
+    assert len(frames) == 2
+    assert b'Second' in frames[-1]
+    assert not connection.outbound
+    assert connection.outbound_bytes == 0
+
+
+def test_summarise(connection, game):
+    game.outbound_max_messages = 2
+    frames = capture(connection)
+    connection.pauseProducing()
+    for x in range(5):
+        send(connection, 'message', str(x))
+    send(connection, 'title', 'Important')
+    assert len(connection.outbound) == 3
+    assert connection.suppressed == 3
+    assert connection.network_stats()['suppressed'] == 3
+    connection.resumeProducing()
+    assert len(frames) == 3
+    assert connection.last_message == '*** 3 lines suppressed ***'
+    assert connection.suppressed == 0
+
+
+def test_drop(connection, game):
+    game.outbound_max_messages = 1
+    game.outbound_policy = 'drop'
+    capture(connection)
+    connection.pauseProducing()
+    send(connection, 'message', 'First')
+    send(connection, 'message', 'Second')
+    connection.resumeProducing()
+    assert connection.total_suppressed == 1
+    assert connection.last_message != '*** 1 line suppressed ***'
+
+
+def test_disconnect(connection, game):
+    dropped = []
+    game.outbound_max_bytes = 10
+    game.outbound_policy = 'disconnect'
+    connection.dropConnection = lambda abort=False: dropped.append(abort)
+    connection.pauseProducing()
+    send(connection, 'message', 'This message is too long.')
+    assert dropped == [True]
+    assert not connection.outbound
+
+
+def test_overflow(connection, game):
+    dropped = []
+    game.outbound_max_messages = 2
+    game.outbound_overflow_factor = 3
+    connection.dropConnection = lambda abort=False: dropped.append(abort)
+    connection.pauseProducing()
+    for x in range(6):
+        send(connection, 'title', str(x))
+    assert len(connection.outbound) == 6
+    assert dropped == []
+    send(connection, 'title', 'Too many')
+    assert dropped == [True]
+    assert not connection.outbound
+
+
+def test_invalid_policy(game):
+    with raises(InvalidOutboundPolicyError):
+        game.outbound_policy = 'disconect'
+    assert game.outbound_policy == 'summarise'
+    with raises(InvalidOutboundPolicyError):
+        Game('Test Game', outbound_policy='nothing')
+
+
+def test_closing(connection):
+    frames = capture(connection)
+    connection.state = connection.STATE_CLOSING
+    send(connection, 'message', 'Too late')
+    assert frames == []
+
+
+def test_rate_limit_reject(connection, game):
+    game.rate_limits['login'] = (1, 2)
+    game.rate_limit_policy = 'reject'
+    for x in range(3):
+        connection.receive_string('@host')
+    assert connection.last_message == game.rate_limit_msg
+    assert connection.rate_limited['login'] == 1
+    assert connection.buckets['login'].limited == 1
+    assert connection.buckets['login'].allowed == 2
+
+
+def test_rate_limit_queue(connection, game):
+    game.rate_limits['login'] = (1, 1)
+    connection.receive_string('@host')
+    connection.receive_string('@uptime')
+    assert len(connection.input_queue) == 1
+    assert connection.input_call.active()
+    connection.input_call.cancel()
+    connection.buckets['login'].tokens = 1.0
+    connection.process_input_queue()
+    assert not connection.input_queue
+    assert connection.messages[-1].startswith('Server started:')
+
+
+def test_classify_input(player, game):
+    con = player.connection
+    assert con.classify_input('look') == 'command'
+    assert con.classify_input('say hello') == 'broadcast'
+    assert con.classify_input('"hello') == 'broadcast'
+    assert len(con.get_buckets('broadcast')) == 2
+    assert (player.id, 'broadcast') in game.account_buckets
+    con.object = None
+    assert con.classify_input('look') == 'login'
+    assert len(con.get_buckets('login')) == 1